@@ -1,13 +1,23 @@
 import typing as tp
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import asynccontextmanager
 
-from yara.adapters.memory.backends.base import MemoryBackend
+from yara.adapters.memory.backends.base import MemoryBackend, StreamEntry
+from yara.adapters.memory.backends.pipeline import MemoryPipeline
+from yara.adapters.memory.codecs import MemoryCodecs, MemoryValueCodec
+from yara.adapters.memory.near_cache import MemoryNearCache
 from yara.core.adapters import YaraAdapter
 from yara.core.helpers import import_obj
 from yara.main import YaraBaseRootApp
 
+# pipeline commands writing the key passed as the first argument
+WRITE_COMMANDS = ("set", "getdel", "incrby", "delete", "expire")
+
 
 class MemoryAdapter(YaraAdapter):
     backend: MemoryBackend
+    near_cache: MemoryNearCache | None
+    codecs: MemoryCodecs
     root_app: YaraBaseRootApp
 
     def __init__(self, root_app: YaraBaseRootApp) -> None:
@@ -22,16 +32,43 @@ class MemoryAdapter(YaraAdapter):
             raise ValueError(f"Backend {backend_cls_path} not found")
 
         self.backend = backend_cls(self.root_app.settings)
+        self.codecs = MemoryCodecs(self.root_app.settings)
+        self.near_cache = None
+        if getattr(self.root_app.settings, "YARA_MEMORY_NEAR_CACHE_PREFIXES", None):
+            self.near_cache = MemoryNearCache(
+                self.backend,
+                prefixes=self.root_app.settings.YARA_MEMORY_NEAR_CACHE_PREFIXES,
+                max_size=self.root_app.settings.YARA_MEMORY_NEAR_CACHE_SIZE,
+                ttl=self.root_app.settings.YARA_MEMORY_NEAR_CACHE_TTL,
+                channel=self.root_app.settings.YARA_MEMORY_NEAR_CACHE_CHANNEL,
+            )
 
     async def up(self) -> None:
         await self.backend.up()
+        if self.near_cache:
+            await self.near_cache.start()
 
     async def healthcheck(self) -> bool:
         return await self.backend.healthcheck()
 
     async def shutdown(self) -> None:
+        if self.near_cache:
+            await self.near_cache.stop()
         await self.backend.shutdown()
 
+    def metrics(self) -> dict[str, tp.Any]:
+        metrics = {"backend": self.backend.metrics()}
+        if self.near_cache:
+            metrics["near_cache"] = self.near_cache.metrics()
+        return metrics
+
+    async def _invalidate(self, keys: tp.Iterable[str]) -> None:
+        if not self.near_cache:
+            return
+        cached_keys = [key for key in keys if self.near_cache.is_cached(key)]
+        if cached_keys:
+            await self.near_cache.invalidate(cached_keys)
+
     async def sadd(self, queue_name: str, *values: tp.Any) -> int:
         return await self.backend.sadd(queue_name, *values)
 
@@ -44,20 +81,121 @@ class MemoryAdapter(YaraAdapter):
     async def sismember(self, name: str, value: str) -> bool:
         return await self.backend.sismember(name, value)
 
-    async def set(self, key: str, value: tp.Any) -> str:
-        return await self.backend.set(key, value)
+    async def smismember(self, name: str, values: list[str]) -> list[bool]:
+        return await self.backend.smismember(name, values)
+
+    def sscan_iter(self, name: str, match: str | None = None, count: int | None = None) -> AsyncIterator[str]:
+        return self.backend.sscan_iter(name, match=match, count=count)
+
+    async def set(self, key: str, value: tp.Any, ex: int | None = None, nx: bool = False) -> bool:
+        is_set = await self.backend.set(key, value, ex=ex, nx=nx)
+        if is_set:
+            await self._invalidate([key])
+        return is_set
 
     async def get(self, key: str) -> str | None:
+        if self.near_cache and self.near_cache.is_cached(key):
+            return await self.near_cache.get(key)
         return await self.backend.get(key)
 
+    async def getdel(self, key: str) -> str | None:
+        value = await self.backend.getdel(key)
+        await self._invalidate([key])
+        return value
+
+    async def incrby(self, key: str, amount: int = 1, ex: int | None = None) -> int:
+        value = await self.backend.incrby(key, amount=amount, ex=ex)
+        await self._invalidate([key])
+        return value
+
+    def get_codec(self, key: str) -> MemoryValueCodec:
+        return self.codecs.get(key)
+
+    async def set_value(self, key: str, value: tp.Any, ex: int | None = None, nx: bool = False) -> bool:
+        """
+        Set the value serialized (and compressed) with the codec of the key namespace.
+        """
+        return await self.set(key, self.get_codec(key).encode(value), ex=ex, nx=nx)
+
+    async def get_value(self, key: str) -> tp.Any:
+        """
+        Get the value set with set_value, None if the key doesn't exist.
+        """
+        data = await self.get(key)
+        if data is None:
+            return None
+        return self.get_codec(key).decode(data)  # type: ignore [arg-type]
+
+    async def mset_values(self, mapping: dict[str, tp.Any]) -> bool:
+        return await self.mset({key: self.get_codec(key).encode(value) for key, value in mapping.items()})
+
+    async def mget_values(self, keys: list[str]) -> list[tp.Any]:
+        return [
+            None if data is None else self.get_codec(key).decode(data)  # type: ignore [arg-type]
+            for key, data in zip(keys, await self.mget(keys), strict=True)
+        ]
+
+    async def hset(self, name: str, mapping: dict[str, tp.Any]) -> int:
+        return await self.backend.hset(name, mapping)
+
+    async def hgetall(self, name: str) -> dict[str, str]:
+        return await self.backend.hgetall(name)
+
+    async def hmget(self, name: str, keys: list[str]) -> list[str | None]:
+        return await self.backend.hmget(name, keys)
+
+    def hscan_iter(
+        self, name: str, match: str | None = None, count: int | None = None
+    ) -> AsyncIterator[tuple[str, str]]:
+        return self.backend.hscan_iter(name, match=match, count=count)
+
+    async def zadd(self, name: str, mapping: dict[str, float]) -> int:
+        return await self.backend.zadd(name, mapping)
+
+    async def zrangebyscore(
+        self,
+        name: str,
+        min: float | str,
+        max: float | str,
+        start: int | None = None,
+        num: int | None = None,
+        withscores: bool = False,
+    ) -> list[tp.Any]:
+        return await self.backend.zrangebyscore(name, min, max, start=start, num=num, withscores=withscores)
+
+    async def zremrangebyscore(self, name: str, min: float | str, max: float | str) -> int:
+        return await self.backend.zremrangebyscore(name, min, max)
+
+    async def mget(self, keys: list[str]) -> list[str | None]:
+        if self.near_cache and any(self.near_cache.is_cached(key) for key in keys):
+            return await self.near_cache.mget(keys)
+        return await self.backend.mget(keys)
+
+    async def mset(self, mapping: dict[str, tp.Any]) -> bool:
+        is_set = await self.backend.mset(mapping)
+        await self._invalidate(mapping.keys())
+        return is_set
+
     async def delete(self, key: str) -> int:
-        return await self.backend.delete(key)
+        deleted = await self.backend.delete(key)
+        await self._invalidate([key])
+        return deleted
+
+    async def delete_many(self, keys: list[str]) -> int:
+        deleted = await self.backend.delete_many(keys)
+        await self._invalidate(keys)
+        return deleted
 
     async def exists(self, key: str) -> int:
         return await self.backend.exists(key)
 
     async def expire(self, key: str, time: int) -> int:
-        return await self.backend.expire(key, time)
+        is_set = await self.backend.expire(key, time)
+        await self._invalidate([key])
+        return is_set
+
+    def scan_iter(self, match: str | None = None, count: int | None = None) -> AsyncIterator[str]:
+        return self.backend.scan_iter(match=match, count=count)
 
     async def lpush(self, queue_name: str, *args: tp.Any) -> int:
         return await self.backend.lpush(queue_name, *args)
@@ -65,5 +203,67 @@ class MemoryAdapter(YaraAdapter):
     async def rpop(self, queue_name: str, count: int | None = None) -> str | list[str] | None:
         return await self.backend.rpop(queue_name, count=count)
 
-    async def brpop(self, queue_names: list[str], timeout: int | None = 0) -> list[str]:
+    async def ltrim(self, queue_name: str, start: int, end: int) -> bool:
+        return await self.backend.ltrim(queue_name, start, end)
+
+    async def brpop(self, queue_names: list[str], timeout: int | None = 0) -> list[str] | None:
         return await self.backend.brpop(queue_names, timeout=timeout)
+
+    @asynccontextmanager
+    async def pipeline(self, transaction: bool = False) -> AsyncGenerator[MemoryPipeline, None]:
+        async with self.backend.pipeline(transaction=transaction) as pipeline:
+            yield pipeline
+        written_keys = []
+        for name, args, _ in pipeline.commands:
+            if name in WRITE_COMMANDS:
+                written_keys.append(args[0])
+            elif name == "mset":
+                written_keys.extend(args[0].keys())
+            elif name == "delete_many":
+                written_keys.extend(args[0])
+        await self._invalidate(written_keys)
+
+    async def xadd(
+        self,
+        name: str,
+        fields: dict[str, tp.Any],
+        maxlen: int | None = None,
+        approximate: bool = True,
+    ) -> bytes:
+        return await self.backend.xadd(name, fields, maxlen=maxlen, approximate=approximate)
+
+    async def xgroup_create(self, name: str, group: str, id: str = "0", mkstream: bool = True) -> bool:
+        return await self.backend.xgroup_create(name, group, id=id, mkstream=mkstream)
+
+    async def xgroup_delconsumer(self, name: str, group: str, consumer: str) -> int:
+        return await self.backend.xgroup_delconsumer(name, group, consumer)
+
+    async def xreadgroup(
+        self,
+        group: str,
+        consumer: str,
+        streams: dict[str, str],
+        count: int | None = None,
+        block: int | None = None,
+    ) -> list[tuple[bytes, list[StreamEntry]]]:
+        return await self.backend.xreadgroup(group, consumer, streams, count=count, block=block)
+
+    async def xack(self, name: str, group: str, *ids: tp.Any) -> int:
+        return await self.backend.xack(name, group, *ids)
+
+    async def xautoclaim(
+        self,
+        name: str,
+        group: str,
+        consumer: str,
+        min_idle_time: int,
+        start_id: str = "0-0",
+        count: int | None = None,
+    ) -> tuple[bytes, list[StreamEntry]]:
+        return await self.backend.xautoclaim(name, group, consumer, min_idle_time, start_id=start_id, count=count)
+
+    async def publish(self, channel: str, message: tp.Any) -> int:
+        return await self.backend.publish(channel, message)
+
+    def subscribe(self, *channels: str, patterns: list[str] | None = None) -> AsyncIterator[tuple[bytes, bytes]]:
+        return self.backend.subscribe(*channels, patterns=patterns)
@@ -1,17 +1,33 @@
 import abc
 import typing as tp
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import asynccontextmanager
 
+from yara.adapters.memory.backends.instrumentation import MemoryInstrumentation
+from yara.adapters.memory.backends.pipeline import MemoryPipeline
+from yara.adapters.memory.backends.pubsub import MemoryPubSubHub, MemorySubscription
 from yara.settings import YaraSettings
 
+# (entry id, fields) of a stream
+StreamEntry = tuple[bytes, dict[bytes, bytes]]
+
 
 class MemoryBackend:
     settings: YaraSettings
+    dsn: str | None
+    pubsub_hub: MemoryPubSubHub
+    instrumentation: MemoryInstrumentation
 
     def __init__(
         self,
         settings: YaraSettings,
+        dsn: str | None = None,
     ) -> None:
         self.settings = settings
+        self.dsn = dsn or settings.YARA_MEMORY_DSN
+        self.pubsub_hub = MemoryPubSubHub()
+        # backends talking to a server record their commands and connection waits here
+        self.instrumentation = MemoryInstrumentation(settings.YARA_MEMORY_SLOW_COMMAND_THRESHOLD)
 
     @abc.abstractmethod
     async def up(self) -> None:
@@ -25,6 +41,12 @@ class MemoryBackend:
     async def shutdown(self) -> None:
         ...
 
+    def get_pool_metrics(self) -> dict[str, tp.Any]:
+        return {}
+
+    def metrics(self) -> dict[str, tp.Any]:
+        return {**self.instrumentation.metrics(), "pool": self.get_pool_metrics()}
+
     @abc.abstractmethod
     async def sadd(self, queue_name: str, *values: tp.Any) -> int:
         ...
@@ -42,17 +64,86 @@ class MemoryBackend:
         ...
 
     @abc.abstractmethod
-    async def set(self, key: str, value: tp.Any) -> str:
+    async def smismember(self, name: str, values: list[str]) -> list[bool]:
+        ...
+
+    @abc.abstractmethod
+    def sscan_iter(self, name: str, match: str | None = None, count: int | None = None) -> AsyncIterator[str]:
+        """
+        Iterate over members of the set in pages of about count members, see SSCAN.
+        """
+        ...
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: tp.Any, ex: int | None = None, nx: bool = False) -> bool:
         ...
 
     @abc.abstractmethod
     async def get(self, key: str) -> str | None:
         ...
 
+    @abc.abstractmethod
+    async def getdel(self, key: str) -> str | None:
+        ...
+
+    @abc.abstractmethod
+    async def incrby(self, key: str, amount: int = 1, ex: int | None = None) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def hset(self, name: str, mapping: dict[str, tp.Any]) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def hgetall(self, name: str) -> dict[str, str]:
+        ...
+
+    @abc.abstractmethod
+    async def hmget(self, name: str, keys: list[str]) -> list[str | None]:
+        ...
+
+    @abc.abstractmethod
+    def hscan_iter(
+        self, name: str, match: str | None = None, count: int | None = None
+    ) -> AsyncIterator[tuple[str, str]]:
+        ...
+
+    @abc.abstractmethod
+    async def zadd(self, name: str, mapping: dict[str, float]) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def zrangebyscore(
+        self,
+        name: str,
+        min: float | str,
+        max: float | str,
+        start: int | None = None,
+        num: int | None = None,
+        withscores: bool = False,
+    ) -> list[tp.Any]:
+        ...
+
+    @abc.abstractmethod
+    async def zremrangebyscore(self, name: str, min: float | str, max: float | str) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def mget(self, keys: list[str]) -> list[str | None]:
+        ...
+
+    @abc.abstractmethod
+    async def mset(self, mapping: dict[str, tp.Any]) -> bool:
+        ...
+
     @abc.abstractmethod
     async def delete(self, key: str) -> int:
         ...
 
+    @abc.abstractmethod
+    async def delete_many(self, keys: list[str]) -> int:
+        ...
+
     @abc.abstractmethod
     async def exists(self, key: str) -> int:
         ...
@@ -61,6 +152,10 @@ class MemoryBackend:
     async def expire(self, key: str, time: int) -> int:
         ...
 
+    @abc.abstractmethod
+    def scan_iter(self, match: str | None = None, count: int | None = None) -> AsyncIterator[str]:
+        ...
+
     @abc.abstractmethod
     async def lpush(self, queue_name: str, *args: tp.Any) -> int:
         ...
@@ -70,5 +165,116 @@ class MemoryBackend:
         ...
 
     @abc.abstractmethod
-    async def brpop(self, queue_names: list[str], timeout: int | None = 0) -> list[str]:
+    async def ltrim(self, queue_name: str, start: int, end: int) -> bool:
+        """
+        Keep the items from start to end inclusive, negative indexes count from the end, see LTRIM.
+        """
+
+    @abc.abstractmethod
+    async def brpop(self, queue_names: list[str], timeout: int | None = 0) -> list[str] | None:
+        ...
+
+    @abc.abstractmethod
+    async def xadd(
+        self,
+        name: str,
+        fields: dict[str, tp.Any],
+        maxlen: int | None = None,
+        approximate: bool = True,
+    ) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    async def xgroup_create(self, name: str, group: str, id: str = "0", mkstream: bool = True) -> bool:
+        """
+        Create the consumer group, return False if it already exists.
+        """
+        ...
+
+    @abc.abstractmethod
+    async def xgroup_delconsumer(self, name: str, group: str, consumer: str) -> int:
+        """
+        Delete the consumer from the group, return the number of its pending entries deleted with it.
+        """
+        ...
+
+    @abc.abstractmethod
+    async def xreadgroup(
+        self,
+        group: str,
+        consumer: str,
+        streams: dict[str, str],
+        count: int | None = None,
+        block: int | None = None,
+    ) -> list[tuple[bytes, list[StreamEntry]]]:
+        """
+        Read entries of the streams (name -> ">" for new entries or an id for pending entries of the consumer),
+        block is in milliseconds.
+        """
+        ...
+
+    @abc.abstractmethod
+    async def xack(self, name: str, group: str, *ids: tp.Any) -> int:
         ...
+
+    @abc.abstractmethod
+    async def xautoclaim(
+        self,
+        name: str,
+        group: str,
+        consumer: str,
+        min_idle_time: int,
+        start_id: str = "0-0",
+        count: int | None = None,
+    ) -> tuple[bytes, list[StreamEntry]]:
+        """
+        Transfer pending entries idle for min_idle_time milliseconds to the consumer,
+        return the id to continue from ("0-0" when done) and the claimed entries.
+        """
+        ...
+
+    @abc.abstractmethod
+    async def publish(self, channel: str, message: tp.Any) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def _subscribe(self, channels: list[str], patterns: list[str]) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def _unsubscribe(self, channels: list[str], patterns: list[str]) -> None:
+        ...
+
+    async def subscribe(self, *channels: str, patterns: list[str] | None = None) -> AsyncIterator[tuple[bytes, bytes]]:
+        """
+        Iterate over (channel, message) published to the channels or to channels matching the glob patterns
+        until the iteration is stopped. All subscriptions of the backend share one connection.
+        """
+        subscription = MemorySubscription(
+            channels, tuple(patterns or ()), self.settings.YARA_MEMORY_PUBSUB_QUEUE_SIZE
+        )
+        new_channels, new_patterns = self.pubsub_hub.add(subscription)
+        try:
+            if new_channels or new_patterns:
+                await self._subscribe(new_channels, new_patterns)
+            while True:
+                yield await subscription.get()
+        finally:
+            stale_channels, stale_patterns = self.pubsub_hub.remove(subscription)
+            if stale_channels or stale_patterns:
+                await self._unsubscribe(stale_channels, stale_patterns)
+
+    @asynccontextmanager
+    async def pipeline(self, transaction: bool = False) -> AsyncGenerator[MemoryPipeline, None]:
+        """
+        Queue commands and execute them in one round trip on exit,
+        atomically (MULTI/EXEC) if transaction is set. Nothing is executed if the block raises.
+        """
+        pipeline = MemoryPipeline()
+        yield pipeline
+        if pipeline.commands:
+            pipeline.results = await self.execute_pipeline(pipeline, transaction=transaction)
+
+    async def execute_pipeline(self, pipeline: MemoryPipeline, transaction: bool = False) -> list[tp.Any]:
+        # Backends without pipelining run the commands one by one
+        return [await getattr(self, name)(*args, **kwargs) for name, args, kwargs in pipeline.commands]
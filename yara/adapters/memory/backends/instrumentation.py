@@ -0,0 +1,124 @@
+import bisect
+import logging
+import time
+import typing as tp
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# seconds, upper bounds of the latency buckets, slower observations go to the overflow bucket
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# commands waiting for data by design, they are not reported as slow
+BLOCKING_COMMANDS = ("BRPOP", "BLPOP", "XREAD", "XREADGROUP")
+
+
+class LatencyHistogram:
+    counts: list[int]
+    count: int
+    total: float
+    max: float
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, duration: float) -> None:
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket of the q quantile, the max for the overflow bucket.
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts, strict=False):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict[str, tp.Any]:
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                **{str(bound): count for bound, count in zip(LATENCY_BUCKETS, self.counts, strict=False)},
+                "+inf": self.counts[-1],
+            },
+        }
+
+
+class MemoryInstrumentation:
+    """
+    Command latencies and errors of a memory backend and the waits for a connection of its pool.
+    Commands slower than slow_threshold seconds are logged.
+    """
+
+    slow_threshold: float | None
+    latency: defaultdict[str, LatencyHistogram]
+    errors: defaultdict[str, int]
+    slow_commands: int
+    pool_wait: LatencyHistogram
+    pool_waiting: int
+    pool_timeouts: int
+
+    def __init__(self, slow_threshold: float | None = None) -> None:
+        self.slow_threshold = slow_threshold
+        self.latency = defaultdict(LatencyHistogram)
+        self.errors = defaultdict(int)
+        self.slow_commands = 0
+        self.pool_wait = LatencyHistogram()
+        self.pool_waiting = 0
+        self.pool_timeouts = 0
+
+    def observe(self, command: str, duration: float, key: tp.Any = None) -> None:
+        self.latency[command].observe(duration)
+        if self.slow_threshold is not None and duration >= self.slow_threshold and command not in BLOCKING_COMMANDS:
+            self.slow_commands += 1
+            logger.warning("Slow memory command %s %s took %.1f ms", command, key, duration * 1000)
+
+    @contextmanager
+    def measure(self, command: str, key: tp.Any = None) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors[command] += 1
+            raise
+        finally:
+            self.observe(command, time.perf_counter() - start, key)
+
+    @contextmanager
+    def measure_pool_wait(self, timeout_errors: tuple[type[Exception], ...] = ()) -> Iterator[None]:
+        start = time.perf_counter()
+        self.pool_waiting += 1
+        try:
+            yield
+        except timeout_errors:
+            self.pool_timeouts += 1
+            raise
+        finally:
+            self.pool_waiting -= 1
+            self.pool_wait.observe(time.perf_counter() - start)
+
+    def metrics(self) -> dict[str, tp.Any]:
+        return {
+            "commands": {command: histogram.to_dict() for command, histogram in sorted(self.latency.items())},
+            "errors": dict(self.errors),
+            "slow_commands": self.slow_commands,
+            "pool_wait": self.pool_wait.to_dict(),
+            # callers waiting for a connection right now
+            "pool_waiting": self.pool_waiting,
+            "pool_timeouts": self.pool_timeouts,
+        }
@@ -0,0 +1,598 @@
+import asyncio
+import heapq
+import logging
+import time
+import typing as tp
+from collections import OrderedDict, deque
+from collections.abc import AsyncIterator
+from fnmatch import fnmatchcase
+
+from yara.adapters.memory.backends.base import MemoryBackend, StreamEntry
+
+logger = logging.getLogger(__name__)
+
+# Rough per key overhead in bytes used for the memory cap
+KEY_OVERHEAD = 64
+SCORE_SIZE = 8
+# default page size of scans like in Redis
+SCAN_COUNT = 10
+
+
+def _encode(value: tp.Any) -> bytes:
+    # Values are stored as bytes like Redis does
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode("utf-8")
+    if isinstance(value, int | float) and not isinstance(value, bool):
+        return repr(value).encode("utf-8")
+    raise ValueError(f"Invalid value type {type(value).__name__}")
+
+
+async def _scan(items: list[tp.Any], count: int | None) -> AsyncIterator[tp.Any]:
+    # iterate over a snapshot in pages, yielding to the event loop between pages like round trips to Redis
+    page_size = count or SCAN_COUNT
+    for start in range(0, len(items), page_size):
+        if start:
+            await asyncio.sleep(0)
+        for item in items[start : start + page_size]:
+            yield item
+
+
+class _SortedSet(dict[bytes, float]):
+    # member -> score, a distinct type to tell sorted sets from hashes
+    pass
+
+
+class _StreamGroup:
+    def __init__(self, last_delivered_id: tuple[int, int]) -> None:
+        self.last_delivered_id = last_delivered_id
+        # entry id -> [consumer, delivered at (monotonic), deliveries]
+        self.pending: dict[tuple[int, int], list[tp.Any]] = {}
+
+
+class _Stream:
+    def __init__(self) -> None:
+        self.entries: dict[tuple[int, int], dict[bytes, bytes]] = {}
+        self.last_id = (0, 0)
+        self.groups: dict[str, _StreamGroup] = {}
+
+
+def _parse_stream_id(value: tp.Any) -> tuple[int, int]:
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    ms, _, seq = str(value).partition("-")
+    return int(ms), int(seq or 0)
+
+
+def _format_stream_id(stream_id: tuple[int, int]) -> bytes:
+    return f"{stream_id[0]}-{stream_id[1]}".encode()
+
+
+def _parse_score(value: float | str) -> tuple[float, bool]:
+    # "(1.5" is exclusive like in ZRANGEBYSCORE
+    if isinstance(value, str) and value.startswith("("):
+        return float(value[1:]), True
+    return float(value), False
+
+
+class LocalMemoryBackend(MemoryBackend):
+    """
+    In-process backend for single node deployments, tests and benchmarks.
+    Keys expire lazily on access and periodically every YARA_MEMORY_LOCAL_REAP_INTERVAL seconds.
+    When YARA_MEMORY_LOCAL_MAX_MEMORY (approximate bytes) is exceeded the least recently used keys are evicted.
+    """
+
+    data: OrderedDict[str, tp.Any]
+    expires: dict[str, float]
+    sizes: dict[str, int]
+    memory: int
+
+    def __init__(self, settings: tp.Any, dsn: str | None = None) -> None:
+        super().__init__(settings, dsn=dsn)
+        self.data = OrderedDict()
+        self.expires = {}
+        self.sizes = {}
+        self.memory = 0
+        self._expires_heap: list[tuple[float, str]] = []
+        self._pushed = asyncio.Condition()
+        self._reaper_task: asyncio.Task[None] | None = None
+
+    async def up(self) -> None:
+        if self._reaper_task is None:
+            self._reaper_task = asyncio.create_task(self._reap())
+
+    async def healthcheck(self) -> bool:
+        return self._reaper_task is not None
+
+    async def shutdown(self) -> None:
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            self._reaper_task = None
+        self.data.clear()
+        self.expires.clear()
+        self.sizes.clear()
+        self._expires_heap.clear()
+        self.memory = 0
+
+    async def _reap(self) -> None:
+        while True:
+            await asyncio.sleep(self.settings.YARA_MEMORY_LOCAL_REAP_INTERVAL)
+            self.reap_expired()
+
+    def reap_expired(self) -> int:
+        now = time.monotonic()
+        reaped = 0
+        while self._expires_heap and self._expires_heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expires_heap)
+            # the heap keeps stale entries of keys whose TTL has changed since
+            if self.expires.get(key) == expires_at:
+                self._remove(key)
+                reaped += 1
+        return reaped
+
+    def _is_expired(self, key: str) -> bool:
+        expires_at = self.expires.get(key)
+        return expires_at is not None and expires_at <= time.monotonic()
+
+    def _lookup(self, key: str, value_type: type | None = None) -> tp.Any:
+        if key not in self.data:
+            return None
+        if self._is_expired(key):
+            self._remove(key)
+            return None
+        value = self.data[key]
+        if value_type is not None and type(value) is not value_type:
+            raise ValueError(f"Key {key} holds a value of another type")
+        self.data.move_to_end(key)
+        return value
+
+    def _lookup_or_create(self, key: str, value_type: type) -> tp.Any:
+        value = self._lookup(key, value_type)
+        if value is None:
+            value = value_type()
+            self.data[key] = value
+            self._resize(key, KEY_OVERHEAD + len(key))
+        return value
+
+    def _store(self, key: str, value: bytes) -> None:
+        self._remove(key)
+        self.data[key] = value
+        self._resize(key, KEY_OVERHEAD + len(key) + len(value))
+
+    def _remove(self, key: str) -> bool:
+        if key not in self.data:
+            return False
+        del self.data[key]
+        self.expires.pop(key, None)
+        self.memory -= self.sizes.pop(key, 0)
+        return True
+
+    def _remove_if_empty(self, key: str) -> None:
+        # empty collections don't exist like in Redis
+        if key in self.data and not self.data[key]:
+            self._remove(key)
+
+    def _resize(self, key: str, delta: int) -> None:
+        if key not in self.data:
+            # evicted while being written
+            return
+        self.sizes[key] = self.sizes.get(key, 0) + delta
+        self.memory += delta
+        self._evict()
+
+    def _evict(self) -> None:
+        max_memory = self.settings.YARA_MEMORY_LOCAL_MAX_MEMORY
+        if not max_memory:
+            return
+        while self.memory > max_memory and self.data:
+            key = next(iter(self.data))
+            self._remove(key)
+            logger.debug("LocalMemoryBackend evicted %s", key)
+
+    def _set_expire(self, key: str, time_: float) -> None:
+        expires_at = time.monotonic() + time_
+        self.expires[key] = expires_at
+        heapq.heappush(self._expires_heap, (expires_at, key))
+
+    async def sadd(self, queue_name: str, *values: tp.Any) -> int:
+        members: set[bytes] = self._lookup_or_create(queue_name, set)
+        added = 0
+        for value in values:
+            member = _encode(value)
+            if member not in members:
+                members.add(member)
+                self._resize(queue_name, len(member))
+                added += 1
+        return added
+
+    async def srem(self, queue_name: str, *values: tp.Any) -> int:
+        members: set[bytes] | None = self._lookup(queue_name, set)
+        if members is None:
+            return 0
+        removed = 0
+        for value in values:
+            member = _encode(value)
+            if member in members:
+                members.remove(member)
+                self._resize(queue_name, -len(member))
+                removed += 1
+        self._remove_if_empty(queue_name)
+        return removed
+
+    async def smembers(self, name: str) -> set[str]:
+        members: set[bytes] | None = self._lookup(name, set)
+        return set(members or ())  # type: ignore [arg-type]
+
+    async def sismember(self, name: str, value: str) -> bool:
+        members: set[bytes] | None = self._lookup(name, set)
+        return bool(members) and _encode(value) in members  # type: ignore [operator]
+
+    async def smismember(self, name: str, values: list[str]) -> list[bool]:
+        members: set[bytes] = self._lookup(name, set) or set()
+        return [_encode(value) in members for value in values]
+
+    async def sscan_iter(self, name: str, match: str | None = None, count: int | None = None) -> AsyncIterator[str]:
+        members: set[bytes] | None = self._lookup(name, set)
+        pattern = _encode(match) if match else None
+        async for member in _scan(list(members or ()), count):
+            if pattern is None or fnmatchcase(member, pattern):
+                yield member
+
+    async def set(self, key: str, value: tp.Any, ex: int | None = None, nx: bool = False) -> bool:
+        if nx and self._lookup(key) is not None:
+            return False
+        self._store(key, _encode(value))
+        if ex is not None:
+            self._set_expire(key, ex)
+        return True
+
+    async def get(self, key: str) -> str | None:
+        return self._lookup(key, bytes)
+
+    async def getdel(self, key: str) -> str | None:
+        value = self._lookup(key, bytes)
+        self._remove(key)
+        return value
+
+    async def incrby(self, key: str, amount: int = 1, ex: int | None = None) -> int:
+        current = self._lookup(key, bytes)
+        try:
+            value = int(current or 0) + amount
+        except ValueError as exc:
+            raise ValueError(f"Key {key} is not an integer") from exc
+        expires_at = self.expires.get(key)
+        self._store(key, str(value).encode("utf-8"))
+        if expires_at is not None:
+            self.expires[key] = expires_at
+        elif ex is not None:
+            self._set_expire(key, ex)
+        return value
+
+    async def hset(self, name: str, mapping: dict[str, tp.Any]) -> int:
+        fields: dict[bytes, bytes] = self._lookup_or_create(name, dict)
+        added = 0
+        for field, value in mapping.items():
+            field_bytes, value_bytes = _encode(field), _encode(value)
+            previous = fields.get(field_bytes)
+            if previous is None:
+                added += 1
+                self._resize(name, len(field_bytes) + len(value_bytes))
+            else:
+                self._resize(name, len(value_bytes) - len(previous))
+            fields[field_bytes] = value_bytes
+        return added
+
+    async def hgetall(self, name: str) -> dict[str, str]:
+        fields: dict[bytes, bytes] | None = self._lookup(name, dict)
+        return dict(fields or {})  # type: ignore [arg-type]
+
+    async def hmget(self, name: str, keys: list[str]) -> list[str | None]:
+        fields: dict[bytes, bytes] = self._lookup(name, dict) or {}
+        return [fields.get(_encode(key)) for key in keys]  # type: ignore [misc]
+
+    async def hscan_iter(
+        self, name: str, match: str | None = None, count: int | None = None
+    ) -> AsyncIterator[tuple[str, str]]:
+        fields: dict[bytes, bytes] | None = self._lookup(name, dict)
+        pattern = _encode(match) if match else None
+        async for field, value in _scan(list((fields or {}).items()), count):
+            if pattern is None or fnmatchcase(field, pattern):
+                yield field, value
+
+    async def zadd(self, name: str, mapping: dict[str, float]) -> int:
+        scores: _SortedSet = self._lookup_or_create(name, _SortedSet)
+        added = 0
+        for member, score in mapping.items():
+            member_bytes = _encode(member)
+            if member_bytes not in scores:
+                added += 1
+                self._resize(name, len(member_bytes) + SCORE_SIZE)
+            scores[member_bytes] = float(score)
+        return added
+
+    def _range_by_score(self, name: str, min: float | str, max: float | str) -> list[tuple[bytes, float]]:
+        scores: _SortedSet | None = self._lookup(name, _SortedSet)
+        if not scores:
+            return []
+        min_score, min_exclusive = _parse_score(min)
+        max_score, max_exclusive = _parse_score(max)
+        return sorted(
+            (
+                (member, score)
+                for member, score in scores.items()
+                if (score > min_score if min_exclusive else score >= min_score)
+                and (score < max_score if max_exclusive else score <= max_score)
+            ),
+            key=lambda item: (item[1], item[0]),
+        )
+
+    async def zrangebyscore(
+        self,
+        name: str,
+        min: float | str,
+        max: float | str,
+        start: int | None = None,
+        num: int | None = None,
+        withscores: bool = False,
+    ) -> list[tp.Any]:
+        items = self._range_by_score(name, min, max)
+        if start is not None and num is not None:
+            items = items[start : start + num] if num >= 0 else items[start:]
+        if withscores:
+            return items
+        return [member for member, _ in items]
+
+    async def zremrangebyscore(self, name: str, min: float | str, max: float | str) -> int:
+        items = self._range_by_score(name, min, max)
+        if not items:
+            return 0
+        scores: _SortedSet = self.data[name]
+        for member, _ in items:
+            del scores[member]
+            self._resize(name, -len(member) - SCORE_SIZE)
+        self._remove_if_empty(name)
+        return len(items)
+
+    async def mget(self, keys: list[str]) -> list[str | None]:
+        return [self._lookup(key, bytes) for key in keys]
+
+    async def mset(self, mapping: dict[str, tp.Any]) -> bool:
+        for key, value in mapping.items():
+            self._store(key, _encode(value))
+        return True
+
+    async def delete(self, key: str) -> int:
+        return int(self._lookup(key) is not None and self._remove(key))
+
+    async def delete_many(self, keys: list[str]) -> int:
+        return sum([await self.delete(key) for key in keys])
+
+    async def exists(self, key: str) -> int:
+        return int(self._lookup(key) is not None)
+
+    async def expire(self, key: str, time: int) -> int:
+        if self._lookup(key) is None:
+            return 0
+        if time <= 0:
+            self._remove(key)
+        else:
+            self._set_expire(key, time)
+        return 1
+
+    async def scan_iter(self, match: str | None = None, count: int | None = None) -> AsyncIterator[str]:
+        async for key in _scan(list(self.data), count):
+            # keys deleted or expired since the snapshot are skipped
+            if key not in self.data or self._is_expired(key):
+                continue
+            if match is None or fnmatchcase(key, match):
+                yield key
+
+    async def lpush(self, queue_name: str, *args: tp.Any) -> int:
+        items: deque[bytes] = self._lookup_or_create(queue_name, deque)
+        for arg in args:
+            item = _encode(arg)
+            items.appendleft(item)
+            self._resize(queue_name, len(item))
+        length = len(items)
+        async with self._pushed:
+            self._pushed.notify_all()
+        return length
+
+    async def rpop(self, queue_name: str, count: int | None = None) -> str | list[str] | None:
+        items: deque[bytes] | None = self._lookup(queue_name, deque)
+        if not items:
+            return None
+        if count is None:
+            item = items.pop()
+            self._resize(queue_name, -len(item))
+            self._remove_if_empty(queue_name)
+            return item  # type: ignore [return-value]
+        popped = [items.pop() for _ in range(min(count, len(items)))]
+        self._resize(queue_name, -sum(len(item) for item in popped))
+        self._remove_if_empty(queue_name)
+        return popped  # type: ignore [return-value]
+
+    async def ltrim(self, queue_name: str, start: int, end: int) -> bool:
+        items: deque[bytes] | None = self._lookup(queue_name, deque)
+        if not items:
+            return True
+        length = len(items)
+        start = max(start + length if start < 0 else start, 0)
+        end = min(end + length if end < 0 else end, length - 1)
+        kept = list(items)[start : end + 1]
+        self._resize(queue_name, sum(len(item) for item in kept) - sum(len(item) for item in items))
+        items.clear()
+        items.extend(kept)
+        self._remove_if_empty(queue_name)
+        return True
+
+    async def brpop(self, queue_names: list[str], timeout: int | None = 0) -> list[str] | None:
+        deadline = time.monotonic() + timeout if timeout else None
+        async with self._pushed:
+            while True:
+                for queue_name in queue_names:
+                    item = await self.rpop(queue_name)
+                    if item is not None:
+                        return [queue_name.encode("utf-8"), item]  # type: ignore [list-item]
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                try:
+                    await asyncio.wait_for(self._pushed.wait(), remaining)
+                except TimeoutError:
+                    return None
+
+    async def xadd(
+        self,
+        name: str,
+        fields: dict[str, tp.Any],
+        maxlen: int | None = None,
+        approximate: bool = True,
+    ) -> bytes:
+        stream: _Stream = self._lookup_or_create(name, _Stream)
+        now_ms = int(time.time() * 1000)
+        last_ms, last_seq = stream.last_id
+        stream.last_id = (now_ms, 0) if now_ms > last_ms else (last_ms, last_seq + 1)
+        entry = {_encode(field): _encode(value) for field, value in fields.items()}
+        stream.entries[stream.last_id] = entry
+        self._resize(name, sum(len(field) + len(value) for field, value in entry.items()))
+        while maxlen is not None and len(stream.entries) > maxlen:
+            trimmed = stream.entries.pop(next(iter(stream.entries)))
+            self._resize(name, -sum(len(field) + len(value) for field, value in trimmed.items()))
+        async with self._pushed:
+            self._pushed.notify_all()
+        return _format_stream_id(stream.last_id)
+
+    async def xgroup_create(self, name: str, group: str, id: str = "0", mkstream: bool = True) -> bool:
+        stream: _Stream | None = self._lookup(name, _Stream)
+        if stream is None:
+            if not mkstream:
+                raise ValueError(f"Stream {name} does not exist")
+            stream = self._lookup_or_create(name, _Stream)
+        if group in stream.groups:
+            return False
+        stream.groups[group] = _StreamGroup(stream.last_id if id == "$" else _parse_stream_id(id))
+        return True
+
+    async def xgroup_delconsumer(self, name: str, group: str, consumer: str) -> int:
+        _, stream_group = self._get_stream_group(name, group)
+        pending_ids = [stream_id for stream_id, pending in stream_group.pending.items() if pending[0] == consumer]
+        for stream_id in pending_ids:
+            del stream_group.pending[stream_id]
+        return len(pending_ids)
+
+    def _get_stream_group(self, name: str, group: str) -> tuple[_Stream, _StreamGroup]:
+        stream: _Stream | None = self._lookup(name, _Stream)
+        if stream is None or group not in stream.groups:
+            raise ValueError(f"Consumer group {group} of stream {name} does not exist")
+        return stream, stream.groups[group]
+
+    def _read_group(
+        self,
+        name: str,
+        group: str,
+        consumer: str,
+        entry_id: str,
+        count: int | None,
+    ) -> list[StreamEntry]:
+        stream, stream_group = self._get_stream_group(name, group)
+        entries: list[StreamEntry] = []
+        now = time.monotonic()
+        if entry_id == ">":
+            for stream_id, fields in stream.entries.items():
+                if count is not None and len(entries) >= count:
+                    break
+                if stream_id > stream_group.last_delivered_id:
+                    stream_group.last_delivered_id = stream_id
+                    stream_group.pending[stream_id] = [consumer, now, 1]
+                    entries.append((_format_stream_id(stream_id), fields))
+            return entries
+        # pending entries of the consumer after the id
+        start_id = _parse_stream_id(entry_id)
+        for stream_id in sorted(stream_group.pending):
+            if count is not None and len(entries) >= count:
+                break
+            pending = stream_group.pending[stream_id]
+            if stream_id > start_id and pending[0] == consumer and stream_id in stream.entries:
+                pending[1:] = [now, pending[2] + 1]
+                entries.append((_format_stream_id(stream_id), stream.entries[stream_id]))
+        return entries
+
+    async def xreadgroup(
+        self,
+        group: str,
+        consumer: str,
+        streams: dict[str, str],
+        count: int | None = None,
+        block: int | None = None,
+    ) -> list[tuple[bytes, list[StreamEntry]]]:
+        deadline = time.monotonic() + block / 1000 if block else None
+        async with self._pushed:
+            while True:
+                result = []
+                for name, entry_id in streams.items():
+                    entries = self._read_group(name, group, consumer, entry_id, count)
+                    if entries:
+                        result.append((name.encode("utf-8"), entries))
+                # only reading new entries blocks
+                if result or block is None or ">" not in streams.values():
+                    return result
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return []
+                try:
+                    await asyncio.wait_for(self._pushed.wait(), remaining)
+                except TimeoutError:
+                    return []
+
+    async def xack(self, name: str, group: str, *ids: tp.Any) -> int:
+        stream: _Stream | None = self._lookup(name, _Stream)
+        if stream is None or group not in stream.groups:
+            return 0
+        pending = stream.groups[group].pending
+        return sum(pending.pop(_parse_stream_id(entry_id), None) is not None for entry_id in ids)
+
+    async def xautoclaim(
+        self,
+        name: str,
+        group: str,
+        consumer: str,
+        min_idle_time: int,
+        start_id: str = "0-0",
+        count: int | None = None,
+    ) -> tuple[bytes, list[StreamEntry]]:
+        stream, stream_group = self._get_stream_group(name, group)
+        count = count or 100
+        now = time.monotonic()
+        start = _parse_stream_id(start_id)
+        pending_ids = [stream_id for stream_id in sorted(stream_group.pending) if stream_id >= start]
+        entries: list[StreamEntry] = []
+        for stream_id in pending_ids:
+            if len(entries) >= count:
+                return _format_stream_id(stream_id), entries
+            pending = stream_group.pending[stream_id]
+            if (now - pending[1]) * 1000 < min_idle_time:
+                continue
+            if stream_id not in stream.entries:
+                # trimmed from the stream
+                del stream_group.pending[stream_id]
+                continue
+            stream_group.pending[stream_id] = [consumer, now, pending[2] + 1]
+            entries.append((_format_stream_id(stream_id), stream.entries[stream_id]))
+        return b"0-0", entries
+
+    async def publish(self, channel: str, message: tp.Any) -> int:
+        channel_bytes, message_bytes = channel.encode("utf-8"), _encode(message)
+        received = self.pubsub_hub.dispatch(channel_bytes, message_bytes)
+        for pattern in list(self.pubsub_hub.patterns):
+            if fnmatchcase(channel, pattern):
+                received += self.pubsub_hub.dispatch(channel_bytes, message_bytes, pattern.encode("utf-8"))
+        return received
+
+    async def _subscribe(self, channels: list[str], patterns: list[str]) -> None:
+        # messages are dispatched by publish() directly
+        pass
+
+    async def _unsubscribe(self, channels: list[str], patterns: list[str]) -> None:
+        pass
@@ -0,0 +1,117 @@
+import typing as tp
+
+
+class MemoryPipeline:
+    """
+    Commands queued by MemoryBackend.pipeline() and sent in one round trip when the context exits.
+    Results are stored in `results` in the order the commands were queued.
+    """
+
+    commands: list[tuple[str, tuple[tp.Any, ...], dict[str, tp.Any]]]
+    results: list[tp.Any]
+
+    def __init__(self) -> None:
+        self.commands = []
+        self.results = []
+
+    def __len__(self) -> int:
+        return len(self.commands)
+
+    def _queue(self, name: str, *args: tp.Any, **kwargs: tp.Any) -> "MemoryPipeline":
+        self.commands.append((name, args, kwargs))
+        return self
+
+    def sadd(self, queue_name: str, *values: tp.Any) -> "MemoryPipeline":
+        return self._queue("sadd", queue_name, *values)
+
+    def srem(self, queue_name: str, *values: tp.Any) -> "MemoryPipeline":
+        return self._queue("srem", queue_name, *values)
+
+    def smembers(self, name: str) -> "MemoryPipeline":
+        return self._queue("smembers", name)
+
+    def sismember(self, name: str, value: str) -> "MemoryPipeline":
+        return self._queue("sismember", name, value)
+
+    def smismember(self, name: str, values: list[str]) -> "MemoryPipeline":
+        return self._queue("smismember", name, values)
+
+    def set(self, key: str, value: tp.Any, ex: int | None = None, nx: bool = False) -> "MemoryPipeline":
+        return self._queue("set", key, value, ex=ex, nx=nx)
+
+    def get(self, key: str) -> "MemoryPipeline":
+        return self._queue("get", key)
+
+    def getdel(self, key: str) -> "MemoryPipeline":
+        return self._queue("getdel", key)
+
+    def incrby(self, key: str, amount: int = 1, ex: int | None = None) -> "MemoryPipeline":
+        return self._queue("incrby", key, amount, ex=ex)
+
+    def hset(self, name: str, mapping: dict[str, tp.Any]) -> "MemoryPipeline":
+        return self._queue("hset", name, mapping=mapping)
+
+    def hgetall(self, name: str) -> "MemoryPipeline":
+        return self._queue("hgetall", name)
+
+    def hmget(self, name: str, keys: list[str]) -> "MemoryPipeline":
+        return self._queue("hmget", name, keys)
+
+    def zadd(self, name: str, mapping: dict[str, float]) -> "MemoryPipeline":
+        return self._queue("zadd", name, mapping)
+
+    def zrangebyscore(
+        self,
+        name: str,
+        min: float | str,
+        max: float | str,
+        start: int | None = None,
+        num: int | None = None,
+        withscores: bool = False,
+    ) -> "MemoryPipeline":
+        return self._queue("zrangebyscore", name, min, max, start=start, num=num, withscores=withscores)
+
+    def zremrangebyscore(self, name: str, min: float | str, max: float | str) -> "MemoryPipeline":
+        return self._queue("zremrangebyscore", name, min, max)
+
+    def xadd(
+        self,
+        name: str,
+        fields: dict[str, tp.Any],
+        maxlen: int | None = None,
+        approximate: bool = True,
+    ) -> "MemoryPipeline":
+        return self._queue("xadd", name, fields, maxlen=maxlen, approximate=approximate)
+
+    def xack(self, name: str, group: str, *ids: tp.Any) -> "MemoryPipeline":
+        return self._queue("xack", name, group, *ids)
+
+    def mget(self, keys: list[str]) -> "MemoryPipeline":
+        return self._queue("mget", keys)
+
+    def mset(self, mapping: dict[str, tp.Any]) -> "MemoryPipeline":
+        return self._queue("mset", mapping)
+
+    def delete(self, key: str) -> "MemoryPipeline":
+        return self._queue("delete", key)
+
+    def delete_many(self, keys: list[str]) -> "MemoryPipeline":
+        return self._queue("delete_many", keys)
+
+    def exists(self, key: str) -> "MemoryPipeline":
+        return self._queue("exists", key)
+
+    def expire(self, key: str, time: int) -> "MemoryPipeline":
+        return self._queue("expire", key, time)
+
+    def lpush(self, queue_name: str, *args: tp.Any) -> "MemoryPipeline":
+        return self._queue("lpush", queue_name, *args)
+
+    def rpop(self, queue_name: str, count: int | None = None) -> "MemoryPipeline":
+        return self._queue("rpop", queue_name, count=count)
+
+    def ltrim(self, queue_name: str, start: int, end: int) -> "MemoryPipeline":
+        return self._queue("ltrim", queue_name, start, end)
+
+    def publish(self, channel: str, message: tp.Any) -> "MemoryPipeline":
+        return self._queue("publish", channel, message)
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+
+class MemorySubscription:
+    """
+    Channels and patterns of one MemoryBackend.subscribe() consumer with its bounded message queue.
+    When the consumer falls behind the oldest messages are dropped.
+    """
+
+    channels: tuple[str, ...]
+    patterns: tuple[str, ...]
+    queue: asyncio.Queue[tuple[bytes, bytes]]
+    dropped: int
+
+    def __init__(self, channels: tuple[str, ...], patterns: tuple[str, ...], max_size: int) -> None:
+        self.channels = channels
+        self.patterns = patterns
+        self.queue = asyncio.Queue(max_size)
+        self.dropped = 0
+
+    def put(self, channel: bytes, message: bytes) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            if self.dropped == 1 or not self.dropped % 1000:
+                logger.warning("Subscriber of %s is too slow, %s messages dropped", self.channels, self.dropped)
+        self.queue.put_nowait((channel, message))
+
+    async def get(self) -> tuple[bytes, bytes]:
+        return await self.queue.get()
+
+
+class MemoryPubSubHub:
+    """
+    Dispatches messages received on one backend connection to the local subscriptions.
+    """
+
+    channels: defaultdict[str, set[MemorySubscription]]
+    patterns: defaultdict[str, set[MemorySubscription]]
+
+    def __init__(self) -> None:
+        self.channels = defaultdict(set)
+        self.patterns = defaultdict(set)
+
+    def add(self, subscription: MemorySubscription) -> tuple[list[str], list[str]]:
+        """
+        Register the subscription, return channels and patterns that have no subscriptions yet.
+        """
+        new_channels = [channel for channel in subscription.channels if channel not in self.channels]
+        new_patterns = [pattern for pattern in subscription.patterns if pattern not in self.patterns]
+        for channel in subscription.channels:
+            self.channels[channel].add(subscription)
+        for pattern in subscription.patterns:
+            self.patterns[pattern].add(subscription)
+        return new_channels, new_patterns
+
+    def remove(self, subscription: MemorySubscription) -> tuple[list[str], list[str]]:
+        """
+        Unregister the subscription, return channels and patterns that have no subscriptions left.
+        """
+        stale_channels = []
+        stale_patterns = []
+        for channel in subscription.channels:
+            self.channels[channel].discard(subscription)
+            if not self.channels[channel]:
+                del self.channels[channel]
+                stale_channels.append(channel)
+        for pattern in subscription.patterns:
+            self.patterns[pattern].discard(subscription)
+            if not self.patterns[pattern]:
+                del self.patterns[pattern]
+                stale_patterns.append(pattern)
+        return stale_channels, stale_patterns
+
+    def dispatch(self, channel: bytes, message: bytes, pattern: bytes | None = None) -> int:
+        subscriptions = (
+            self.patterns.get(pattern.decode("utf-8"), set())
+            if pattern is not None
+            else self.channels.get(channel.decode("utf-8"), set())
+        )
+        for subscription in subscriptions:
+            subscription.put(channel, message)
+        return len(subscriptions)
@@ -1,27 +1,94 @@
+import asyncio
 import logging
 import typing as tp
+from collections.abc import AsyncIterator
 
 import redis.asyncio as redis
 
-from yara.adapters.memory.backends.base import MemoryBackend
+from yara.adapters.memory.backends.base import MemoryBackend, StreamEntry
+from yara.adapters.memory.backends.instrumentation import MemoryInstrumentation
+from yara.adapters.memory.backends.pipeline import MemoryPipeline
 
 logger = logging.getLogger(__name__)
 
+# INCRBY and set the TTL if the key has none, i.e. it has just been created
+INCRBY_SCRIPT = """
+local value = redis.call("INCRBY", KEYS[1], ARGV[1])
+if redis.call("TTL", KEYS[1]) == -1 then
+    redis.call("EXPIRE", KEYS[1], ARGV[2])
+end
+return value
+"""
+
+
+class _InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    instrumentation: MemoryInstrumentation
+
+    async def get_connection(self, *args: tp.Any, **kwargs: tp.Any) -> tp.Any:
+        with self.instrumentation.measure_pool_wait((redis.ConnectionError,)):
+            return await super().get_connection(*args, **kwargs)
+
+
+class _InstrumentedRedis(redis.Redis):
+    async def execute_command(self, *args: tp.Any, **options: tp.Any) -> tp.Any:
+        instrumentation: MemoryInstrumentation = self.connection_pool.instrumentation  # type: ignore [attr-defined]
+        with instrumentation.measure(str(args[0]), args[1] if len(args) > 1 else None):
+            return await super().execute_command(*args, **options)
+
+
+def _get_pipeline_result(name: str, result: tp.Any) -> tp.Any:
+    # the same types as the commands called directly return
+    match name:
+        case "sismember" | "set" | "ltrim":
+            return bool(result)
+        case "smismember":
+            return [bool(is_member) for is_member in result]
+        case _:
+            return result
+
 
 class RedisMemoryBackend(MemoryBackend):
     client: tp.Any | None
+    incrby_script: tp.Any | None
+    # client of the dedicated connection shared by all subscriptions
+    pubsub_client: tp.Any | None
+    pubsub: tp.Any | None
 
-    def __init__(self, settings: tp.Any) -> None:
-        super().__init__(settings)
+    def __init__(self, settings: tp.Any, dsn: str | None = None) -> None:
+        super().__init__(settings, dsn=dsn)
         self.client = None
+        self.incrby_script = None
+        self.pubsub_client = None
+        self.pubsub = None
+        self._pubsub_task: asyncio.Task[None] | None = None
+        # subscriptions of this connection, a ring node only holds the channels of its keys
+        self._pubsub_channels: set[str] = set()
+        self._pubsub_patterns: set[str] = set()
+        # concurrent commands on a new PubSub would each open a connection
+        self._pubsub_lock = asyncio.Lock()
 
     async def up(self) -> None:
-        pool = redis.BlockingConnectionPool.from_url(
-            self.settings.YARA_MEMORY_DSN,
+        if not self.dsn:
+            raise ValueError("Provide YARA_MEMORY_DSN settings")
+        pool = _InstrumentedConnectionPool.from_url(
+            self.dsn,
             max_connections=self.settings.YARA_MEMORY_MAX_CONNECTIONS,
             timeout=self.settings.YARA_MEMORY_TIMEOUT,
         )
-        self.client = redis.Redis.from_pool(pool)
+        pool.instrumentation = self.instrumentation
+        self.client = _InstrumentedRedis.from_pool(pool)
+        self.pubsub_client = self.client
+        self.incrby_script = self.client.register_script(INCRBY_SCRIPT)
+
+    def get_pool_metrics(self) -> dict[str, tp.Any]:
+        if not self.client:
+            return {}
+        pool = self.client.connection_pool
+        return {
+            "max_connections": pool.max_connections,
+            "in_use": len(pool._in_use_connections),
+            "idle": len(pool._available_connections),
+        }
 
     async def healthcheck(self) -> bool:
         if not self.client:
@@ -33,9 +100,19 @@ class RedisMemoryBackend(MemoryBackend):
             return False
 
     async def shutdown(self) -> None:
+        if self._pubsub_task:
+            self._pubsub_task.cancel()
+            self._pubsub_task = None
+        if self.pubsub:
+            await self.pubsub.aclose()
+            self.pubsub = None
+        if self.pubsub_client and self.pubsub_client is not self.client:
+            await self.pubsub_client.aclose()
+        self.pubsub_client = None
         if self.client:
             await self.client.aclose(close_connection_pool=True)
             self.client = None
+            self.incrby_script = None
 
     async def sadd(self, queue_name: str, *values: tp.Any) -> int:
         if not self.client:
@@ -57,21 +134,113 @@ class RedisMemoryBackend(MemoryBackend):
             raise ValueError("RedisMemoryBackend is not connected")
         return bool(await self.client.sismember(name, value))
 
-    async def set(self, key: str, value: tp.Any) -> str:
+    async def smismember(self, name: str, values: list[str]) -> list[bool]:
         if not self.client:
             raise ValueError("RedisMemoryBackend is not connected")
-        return await self.client.set(key, value)
+        if not values:
+            return []
+        return [bool(is_member) for is_member in await self.client.smismember(name, values)]
+
+    async def sscan_iter(self, name: str, match: str | None = None, count: int | None = None) -> AsyncIterator[str]:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        async for member in self.client.sscan_iter(name, match=match, count=count):
+            yield member
+
+    async def set(self, key: str, value: tp.Any, ex: int | None = None, nx: bool = False) -> bool:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        return bool(await self.client.set(key, value, ex=ex, nx=nx))
 
     async def get(self, key: str) -> str | None:
         if not self.client:
             raise ValueError("RedisMemoryBackend is not connected")
         return await self.client.get(key)
 
+    async def getdel(self, key: str) -> str | None:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        return await self.client.getdel(key)
+
+    async def incrby(self, key: str, amount: int = 1, ex: int | None = None) -> int:
+        if not self.client or not self.incrby_script:
+            raise ValueError("RedisMemoryBackend is not connected")
+        if ex is None:
+            return await self.client.incrby(key, amount)
+        return await self.incrby_script(keys=[key], args=[amount, ex])
+
+    async def hset(self, name: str, mapping: dict[str, tp.Any]) -> int:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        return await self.client.hset(name, mapping=mapping)
+
+    async def hgetall(self, name: str) -> dict[str, str]:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        return await self.client.hgetall(name)
+
+    async def hmget(self, name: str, keys: list[str]) -> list[str | None]:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        return await self.client.hmget(name, keys)
+
+    async def hscan_iter(
+        self, name: str, match: str | None = None, count: int | None = None
+    ) -> AsyncIterator[tuple[str, str]]:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        async for field, value in self.client.hscan_iter(name, match=match, count=count):
+            yield field, value
+
+    async def zadd(self, name: str, mapping: dict[str, float]) -> int:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        return await self.client.zadd(name, mapping)
+
+    async def zrangebyscore(
+        self,
+        name: str,
+        min: float | str,
+        max: float | str,
+        start: int | None = None,
+        num: int | None = None,
+        withscores: bool = False,
+    ) -> list[tp.Any]:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        return await self.client.zrangebyscore(name, min, max, start=start, num=num, withscores=withscores)
+
+    async def zremrangebyscore(self, name: str, min: float | str, max: float | str) -> int:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        return await self.client.zremrangebyscore(name, min, max)
+
+    async def mget(self, keys: list[str]) -> list[str | None]:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        if not keys:
+            return []
+        return await self.client.mget(keys)
+
+    async def mset(self, mapping: dict[str, tp.Any]) -> bool:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        if not mapping:
+            return True
+        return await self.client.mset(mapping)
+
     async def delete(self, key: str) -> int:
         if not self.client:
             raise ValueError("RedisMemoryBackend is not connected")
         return await self.client.delete(key)
 
+    async def delete_many(self, keys: list[str]) -> int:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        if not keys:
+            return 0
+        return await self.client.delete(*keys)
+
     async def exists(self, key: str) -> int:
         if not self.client:
             raise ValueError("RedisMemoryBackend is not connected")
@@ -82,6 +251,12 @@ class RedisMemoryBackend(MemoryBackend):
             raise ValueError("RedisMemoryBackend is not connected")
         return await self.client.expire(key, time)
 
+    async def scan_iter(self, match: str | None = None, count: int | None = None) -> AsyncIterator[str]:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        async for key in self.client.scan_iter(match=match, count=count):
+            yield key
+
     async def lpush(self, queue_name: str, *args: tp.Any) -> int:
         if not self.client:
             raise ValueError("RedisMemoryBackend is not connected")
@@ -92,7 +267,163 @@ class RedisMemoryBackend(MemoryBackend):
             raise ValueError("RedisMemoryBackend is not connected")
         return await self.client.rpop(queue_name, count=count)
 
-    async def brpop(self, queue_names: list[str], timeout: int | None = 0) -> list[str]:
+    async def ltrim(self, queue_name: str, start: int, end: int) -> bool:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        return bool(await self.client.ltrim(queue_name, start, end))
+
+    async def brpop(self, queue_names: list[str], timeout: int | None = 0) -> list[str] | None:
         if not self.client:
             raise ValueError("RedisMemoryBackend is not connected")
         return await self.client.brpop(queue_names, timeout=timeout)
+
+    async def xadd(
+        self,
+        name: str,
+        fields: dict[str, tp.Any],
+        maxlen: int | None = None,
+        approximate: bool = True,
+    ) -> bytes:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        return await self.client.xadd(name, fields, maxlen=maxlen, approximate=approximate)
+
+    async def xgroup_create(self, name: str, group: str, id: str = "0", mkstream: bool = True) -> bool:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        try:
+            return await self.client.xgroup_create(name, group, id=id, mkstream=mkstream)
+        except redis.ResponseError as exc:
+            if "BUSYGROUP" in str(exc):
+                return False
+            raise
+
+    async def xgroup_delconsumer(self, name: str, group: str, consumer: str) -> int:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        return await self.client.xgroup_delconsumer(name, group, consumer)
+
+    async def xreadgroup(
+        self,
+        group: str,
+        consumer: str,
+        streams: dict[str, str],
+        count: int | None = None,
+        block: int | None = None,
+    ) -> list[tuple[bytes, list[StreamEntry]]]:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        result = await self.client.xreadgroup(group, consumer, streams, count=count, block=block)
+        return [(stream, entries) for stream, entries in result or []]
+
+    async def xack(self, name: str, group: str, *ids: tp.Any) -> int:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        if not ids:
+            return 0
+        return await self.client.xack(name, group, *ids)
+
+    async def xautoclaim(
+        self,
+        name: str,
+        group: str,
+        consumer: str,
+        min_idle_time: int,
+        start_id: str = "0-0",
+        count: int | None = None,
+    ) -> tuple[bytes, list[StreamEntry]]:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        result = await self.client.xautoclaim(name, group, consumer, min_idle_time, start_id=start_id, count=count)
+        # Redis 7 also returns ids of claimed entries deleted from the stream
+        return result[0], [(entry_id, fields) for entry_id, fields in result[1] if fields is not None]
+
+    async def publish(self, channel: str, message: tp.Any) -> int:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        return await self.client.publish(channel, message)
+
+    async def _subscribe(self, channels: list[str], patterns: list[str]) -> None:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        async with self._pubsub_lock:
+            if not self.pubsub:
+                self.pubsub = self.pubsub_client.pubsub(ignore_subscribe_messages=True)  # type: ignore [union-attr]
+            self._pubsub_channels.update(channels)
+            self._pubsub_patterns.update(patterns)
+            if channels:
+                await self.pubsub.subscribe(*channels)
+            if patterns:
+                await self.pubsub.psubscribe(*patterns)
+        if not self._pubsub_task:
+            self._pubsub_task = asyncio.create_task(self._read_pubsub())
+
+    async def _unsubscribe(self, channels: list[str], patterns: list[str]) -> None:
+        self._pubsub_channels.difference_update(channels)
+        self._pubsub_patterns.difference_update(patterns)
+        if not self.pubsub:
+            return
+        try:
+            async with self._pubsub_lock:
+                if channels:
+                    await self.pubsub.unsubscribe(*channels)
+                if patterns:
+                    await self.pubsub.punsubscribe(*patterns)
+        except (redis.ConnectionError, redis.TimeoutError):
+            # resubscribing after reconnect only restores the remaining subscriptions
+            logger.warning("Failed to unsubscribe from %s %s", channels, patterns)
+
+    async def _read_pubsub(self) -> None:
+        while True:
+            try:
+                message = await self.pubsub.get_message(timeout=1.0)  # type: ignore [union-attr]
+            except (redis.ConnectionError, redis.TimeoutError, OSError):
+                logger.warning("RedisMemoryBackend pub/sub connection lost, reconnecting")
+                await self._reconnect_pubsub()
+                continue
+            if not message:
+                continue
+            pattern = message["pattern"] if message["type"] == "pmessage" else None
+            self.pubsub_hub.dispatch(message["channel"], message["data"], pattern)
+
+    async def _reconnect_pubsub(self) -> None:
+        delay = 0.1
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                async with self._pubsub_lock:
+                    if self.pubsub:
+                        await self.pubsub.aclose()
+                    self.pubsub = self.pubsub_client.pubsub(ignore_subscribe_messages=True)  # type: ignore [union-attr]
+                    if self._pubsub_channels:
+                        await self.pubsub.subscribe(*self._pubsub_channels)
+                    if self._pubsub_patterns:
+                        await self.pubsub.psubscribe(*self._pubsub_patterns)
+                return
+            except (redis.ConnectionError, redis.TimeoutError, OSError):
+                delay = min(delay * 2, 10.0)
+
+    async def _pipeline_incrby(self, redis_pipeline: tp.Any, key: str, amount: int, ex: int) -> None:
+        await self.incrby_script(keys=[key], args=[amount, ex], client=redis_pipeline)  # type: ignore [misc]
+
+    async def execute_pipeline(self, pipeline: MemoryPipeline, transaction: bool = False) -> list[tp.Any]:
+        if not self.client or not self.incrby_script:
+            raise ValueError("RedisMemoryBackend is not connected")
+        async with self.client.pipeline(transaction=transaction) as redis_pipeline:
+            for name, args, kwargs in pipeline.commands:
+                match name:
+                    case "delete_many":
+                        redis_pipeline.delete(*args[0])
+                    case "incrby" if kwargs["ex"] is not None:
+                        await self._pipeline_incrby(redis_pipeline, args[0], args[1], kwargs["ex"])
+                    case "incrby":
+                        redis_pipeline.incrby(*args)
+                    case _:
+                        getattr(redis_pipeline, name)(*args, **kwargs)
+            with self.instrumentation.measure(
+                "TRANSACTION" if transaction else "PIPELINE", f"{len(pipeline.commands)} commands"
+            ):
+                results = await redis_pipeline.execute()
+        return [
+            _get_pipeline_result(name, result) for (name, _, _), result in zip(pipeline.commands, results, strict=True)
+        ]
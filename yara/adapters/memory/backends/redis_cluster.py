@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import typing as tp
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+
+import redis.asyncio as redis
+from redis.asyncio.cluster import RedisCluster
+from redis.exceptions import RedisClusterException
+
+from yara.adapters.memory.backends.instrumentation import MemoryInstrumentation
+from yara.adapters.memory.backends.pipeline import MemoryPipeline
+from yara.adapters.memory.backends.redis import INCRBY_SCRIPT, RedisMemoryBackend
+
+logger = logging.getLogger(__name__)
+
+
+class _BlockingRedisCluster(RedisCluster):
+    """
+    Waits for a free connection like BlockingConnectionPool does instead of raising MaxConnectionsError.
+    Commands and pipelines take a slot of max_connections, a pipeline counts once
+    although it holds a connection of every node it touches.
+    """
+
+    instrumentation: MemoryInstrumentation
+
+    def __init__(
+        self,
+        *args: tp.Any,
+        instrumentation: MemoryInstrumentation,
+        max_connections: int = 2**31,
+        **kwargs: tp.Any,
+    ) -> None:
+        super().__init__(*args, max_connections=max_connections, **kwargs)
+        self.instrumentation = instrumentation
+        self.max_connections = max_connections
+        self.in_use = 0
+        self._connections = asyncio.Semaphore(max_connections)
+
+    @asynccontextmanager
+    async def _acquire(self) -> AsyncGenerator[None, None]:
+        with self.instrumentation.measure_pool_wait():
+            await self._connections.acquire()
+        self.in_use += 1
+        try:
+            yield
+        finally:
+            self.in_use -= 1
+            self._connections.release()
+
+    async def execute_command(self, *args: tp.Any, **kwargs: tp.Any) -> tp.Any:
+        async with self._acquire():
+            with self.instrumentation.measure(str(args[0]), args[1] if len(args) > 1 else None):
+                return await super().execute_command(*args, **kwargs)
+
+    async def _execute_pipeline_by_slot(  # type: ignore [override]
+        self, command: str, slots_to_args: tp.Any
+    ) -> list[tp.Any]:
+        # multi-key DEL, mget_nonatomic and mset_nonatomic run as a pipeline of a command per slot
+        async with self._acquire():
+            with self.instrumentation.measure(command, f"{len(slots_to_args)} slots"):
+                return await super()._execute_pipeline_by_slot(command, slots_to_args)
+
+
+class RedisClusterMemoryBackend(RedisMemoryBackend):
+    """
+    Redis Cluster backend, YARA_MEMORY_DSN is the URL of any node of the cluster.
+    Multi-key commands are split by hash slot. Keys used together in brpop, xreadgroup, pipelines
+    or transactions have to share a hash tag, e.g. "ws:{user_id}:messages" and "ws:{user_id}:stream".
+    """
+
+    async def up(self) -> None:
+        if not self.dsn:
+            raise ValueError("Provide YARA_MEMORY_DSN settings")
+        self.client = _BlockingRedisCluster.from_url(
+            self.dsn,
+            max_connections=self.settings.YARA_MEMORY_MAX_CONNECTIONS,
+            instrumentation=self.instrumentation,
+        )
+        await self.client.initialize()
+        # PUBLISH is broadcast to every node of the cluster, so one node delivers all messages
+        self.pubsub_client = redis.Redis.from_url(self.dsn)
+        self.incrby_script = self.client.register_script(INCRBY_SCRIPT)  # type: ignore [misc]
+
+    def get_pool_metrics(self) -> dict[str, tp.Any]:
+        if not self.client:
+            return {}
+        return {"max_connections": self.client.max_connections, "in_use": self.client.in_use}
+
+    async def healthcheck(self) -> bool:
+        if not self.client:
+            return False
+        try:
+            return bool(await self.client.ping())
+        except (redis.ConnectionError, RedisClusterException):
+            logger.warning("RedisClusterMemoryBackend is not healthy")
+            return False
+
+    async def shutdown(self) -> None:
+        client = self.client
+        # RedisCluster closes its node pools with aclose() without arguments
+        self.client = None
+        await super().shutdown()
+        if client:
+            await client.aclose()
+
+    async def mget(self, keys: list[str]) -> list[str | None]:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        if not keys:
+            return []
+        return await self.client.mget_nonatomic(keys)
+
+    async def mset(self, mapping: dict[str, tp.Any]) -> bool:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        if not mapping:
+            return True
+        return all(await self.client.mset_nonatomic(mapping))
+
+    async def publish(self, channel: str, message: tp.Any) -> int:
+        if not self.pubsub_client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        # the cluster client has no PUBLISH, the message is propagated from any node
+        with self.instrumentation.measure("PUBLISH", channel):
+            return await self.pubsub_client.publish(channel, message)
+
+    async def _pipeline_incrby(self, redis_pipeline: tp.Any, key: str, amount: int, ex: int) -> None:
+        redis_pipeline.eval(INCRBY_SCRIPT, 1, key, amount, ex)
+
+    async def execute_pipeline(self, pipeline: MemoryPipeline, transaction: bool = False) -> list[tp.Any]:
+        if transaction:
+            raise ValueError("RedisClusterMemoryBackend does not support transactions")
+        publish_positions = [position for position, (name, _, _) in enumerate(pipeline.commands) if name == "publish"]
+        if not publish_positions:
+            return await self._execute_cluster_pipeline(pipeline)
+        if not self.pubsub_client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        # the cluster pipeline blocks PUBLISH, it is pipelined through the pub/sub client like publish()
+        async with self.pubsub_client.pipeline(transaction=False) as redis_pipeline:
+            for position in publish_positions:
+                _, args, kwargs = pipeline.commands[position]
+                redis_pipeline.publish(*args, **kwargs)
+            with self.instrumentation.measure("PIPELINE", f"{len(publish_positions)} commands"):
+                published = await redis_pipeline.execute()
+        cluster_pipeline = MemoryPipeline()
+        cluster_pipeline.commands = [command for command in pipeline.commands if command[0] != "publish"]
+        cluster_results = iter(await self._execute_cluster_pipeline(cluster_pipeline) if cluster_pipeline else [])
+        publish_results = dict(zip(publish_positions, published, strict=True))
+        return [
+            publish_results[position] if position in publish_results else next(cluster_results)
+            for position in range(len(pipeline.commands))
+        ]
+
+    async def _execute_cluster_pipeline(self, pipeline: MemoryPipeline) -> list[tp.Any]:
+        if not self.client:
+            raise ValueError("RedisMemoryBackend is not connected")
+        # ClusterPipeline.execute goes to the node connections directly, past execute_command
+        async with self.client._acquire():
+            return await super().execute_pipeline(pipeline)
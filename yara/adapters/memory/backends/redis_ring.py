@@ -0,0 +1,315 @@
+import asyncio
+import bisect
+import hashlib
+import typing as tp
+from collections import defaultdict
+from collections.abc import AsyncIterator
+
+from yara.adapters.memory.backends.base import MemoryBackend, StreamEntry
+from yara.adapters.memory.backends.pipeline import MemoryPipeline
+from yara.adapters.memory.backends.redis import RedisMemoryBackend
+
+
+def get_hash_tag(key: str) -> str:
+    """
+    Part of the key that decides its node, "{user_id}" in "ws:{user_id}:messages" like in Redis Cluster.
+    """
+    start = key.find("{")
+    if start != -1:
+        end = key.find("}", start + 1)
+        if end > start + 1:
+            return key[start + 1 : end]
+    return key
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def _get_command_keys(name: str, args: tuple[tp.Any, ...]) -> list[str]:
+    match name:
+        case "mget" | "delete_many":
+            return list(args[0])
+        case "mset":
+            return list(args[0].keys())
+        case _:
+            return [args[0]]
+
+
+class RedisRingMemoryBackend(MemoryBackend):
+    """
+    Client side consistent hash ring over the standalone Redis servers of YARA_MEMORY_RING_DSNS.
+    Adding a server moves only the keys of its ring points. Multi-key commands are split by node and merged.
+    Keys used together in brpop, blocking xreadgroup or transactions have to share a hash tag.
+    """
+
+    nodes: list[RedisMemoryBackend]
+    ring: list[tuple[int, int]]
+
+    def __init__(self, settings: tp.Any, dsn: str | None = None) -> None:
+        super().__init__(settings, dsn=dsn)
+        if not settings.YARA_MEMORY_RING_DSNS:
+            raise ValueError("Provide YARA_MEMORY_RING_DSNS settings")
+        self.nodes = [RedisMemoryBackend(settings, dsn=node_dsn) for node_dsn in settings.YARA_MEMORY_RING_DSNS]
+        for node in self.nodes:
+            # subscriptions of every node are dispatched to the subscribers of the ring
+            node.pubsub_hub = self.pubsub_hub
+        # points are derived from the DSN, so the order of YARA_MEMORY_RING_DSNS doesn't matter
+        self.ring = sorted(
+            (_hash(f"{node_dsn}#{replica}"), index)
+            for index, node_dsn in enumerate(settings.YARA_MEMORY_RING_DSNS)
+            for replica in range(settings.YARA_MEMORY_RING_REPLICAS)
+        )
+        self._ring_hashes = [point for point, _ in self.ring]
+
+    def get_node_index(self, key: str) -> int:
+        position = bisect.bisect(self._ring_hashes, _hash(get_hash_tag(key))) % len(self.ring)
+        return self.ring[position][1]
+
+    def get_node(self, key: str) -> RedisMemoryBackend:
+        return self.nodes[self.get_node_index(key)]
+
+    def _get_single_node_index(self, keys: tp.Iterable[str], command: str) -> int:
+        indexes = {self.get_node_index(key) for key in keys}
+        if len(indexes) > 1:
+            raise ValueError(f"Keys of {command} are on different nodes, use a common hash tag")
+        return indexes.pop()
+
+    def _get_single_node(self, keys: tp.Iterable[str], command: str) -> RedisMemoryBackend:
+        return self.nodes[self._get_single_node_index(keys, command)]
+
+    def _group_by_node(self, keys: tp.Iterable[str]) -> dict[int, list[str]]:
+        keys_by_node: dict[int, list[str]] = defaultdict(list)
+        for key in keys:
+            keys_by_node[self.get_node_index(key)].append(key)
+        return keys_by_node
+
+    async def up(self) -> None:
+        await asyncio.gather(*(node.up() for node in self.nodes))
+
+    def metrics(self) -> dict[str, tp.Any]:
+        return {"nodes": {node.dsn: node.metrics() for node in self.nodes}}
+
+    async def healthcheck(self) -> bool:
+        return all(await asyncio.gather(*(node.healthcheck() for node in self.nodes)))
+
+    async def shutdown(self) -> None:
+        await asyncio.gather(*(node.shutdown() for node in self.nodes))
+
+    async def sadd(self, queue_name: str, *values: tp.Any) -> int:
+        return await self.get_node(queue_name).sadd(queue_name, *values)
+
+    async def srem(self, queue_name: str, *values: tp.Any) -> int:
+        return await self.get_node(queue_name).srem(queue_name, *values)
+
+    async def smembers(self, name: str) -> set[str]:
+        return await self.get_node(name).smembers(name)
+
+    async def sismember(self, name: str, value: str) -> bool:
+        return await self.get_node(name).sismember(name, value)
+
+    async def smismember(self, name: str, values: list[str]) -> list[bool]:
+        return await self.get_node(name).smismember(name, values)
+
+    async def sscan_iter(self, name: str, match: str | None = None, count: int | None = None) -> AsyncIterator[str]:
+        async for member in self.get_node(name).sscan_iter(name, match=match, count=count):
+            yield member
+
+    async def set(self, key: str, value: tp.Any, ex: int | None = None, nx: bool = False) -> bool:
+        return await self.get_node(key).set(key, value, ex=ex, nx=nx)
+
+    async def get(self, key: str) -> str | None:
+        return await self.get_node(key).get(key)
+
+    async def getdel(self, key: str) -> str | None:
+        return await self.get_node(key).getdel(key)
+
+    async def incrby(self, key: str, amount: int = 1, ex: int | None = None) -> int:
+        return await self.get_node(key).incrby(key, amount=amount, ex=ex)
+
+    async def hset(self, name: str, mapping: dict[str, tp.Any]) -> int:
+        return await self.get_node(name).hset(name, mapping)
+
+    async def hgetall(self, name: str) -> dict[str, str]:
+        return await self.get_node(name).hgetall(name)
+
+    async def hmget(self, name: str, keys: list[str]) -> list[str | None]:
+        return await self.get_node(name).hmget(name, keys)
+
+    async def hscan_iter(
+        self, name: str, match: str | None = None, count: int | None = None
+    ) -> AsyncIterator[tuple[str, str]]:
+        async for field, value in self.get_node(name).hscan_iter(name, match=match, count=count):
+            yield field, value
+
+    async def zadd(self, name: str, mapping: dict[str, float]) -> int:
+        return await self.get_node(name).zadd(name, mapping)
+
+    async def zrangebyscore(
+        self,
+        name: str,
+        min: float | str,
+        max: float | str,
+        start: int | None = None,
+        num: int | None = None,
+        withscores: bool = False,
+    ) -> list[tp.Any]:
+        return await self.get_node(name).zrangebyscore(name, min, max, start=start, num=num, withscores=withscores)
+
+    async def zremrangebyscore(self, name: str, min: float | str, max: float | str) -> int:
+        return await self.get_node(name).zremrangebyscore(name, min, max)
+
+    async def mget(self, keys: list[str]) -> list[str | None]:
+        keys_by_node = self._group_by_node(keys)
+        nodes_values = await asyncio.gather(
+            *(self.nodes[index].mget(node_keys) for index, node_keys in keys_by_node.items())
+        )
+        values: dict[str, str | None] = {}
+        for node_keys, node_values in zip(keys_by_node.values(), nodes_values, strict=True):
+            values.update(zip(node_keys, node_values, strict=True))
+        return [values[key] for key in keys]
+
+    async def mset(self, mapping: dict[str, tp.Any]) -> bool:
+        keys_by_node = self._group_by_node(mapping)
+        return all(
+            await asyncio.gather(
+                *(
+                    self.nodes[index].mset({key: mapping[key] for key in node_keys})
+                    for index, node_keys in keys_by_node.items()
+                )
+            )
+        )
+
+    async def delete(self, key: str) -> int:
+        return await self.get_node(key).delete(key)
+
+    async def delete_many(self, keys: list[str]) -> int:
+        keys_by_node = self._group_by_node(keys)
+        return sum(
+            await asyncio.gather(
+                *(self.nodes[index].delete_many(node_keys) for index, node_keys in keys_by_node.items())
+            )
+        )
+
+    async def exists(self, key: str) -> int:
+        return await self.get_node(key).exists(key)
+
+    async def expire(self, key: str, time: int) -> int:
+        return await self.get_node(key).expire(key, time)
+
+    async def scan_iter(self, match: str | None = None, count: int | None = None) -> AsyncIterator[str]:
+        for node in self.nodes:
+            async for key in node.scan_iter(match=match, count=count):
+                yield key
+
+    async def lpush(self, queue_name: str, *args: tp.Any) -> int:
+        return await self.get_node(queue_name).lpush(queue_name, *args)
+
+    async def rpop(self, queue_name: str, count: int | None = None) -> str | list[str] | None:
+        return await self.get_node(queue_name).rpop(queue_name, count=count)
+
+    async def ltrim(self, queue_name: str, start: int, end: int) -> bool:
+        return await self.get_node(queue_name).ltrim(queue_name, start, end)
+
+    async def brpop(self, queue_names: list[str], timeout: int | None = 0) -> list[str] | None:
+        return await self._get_single_node(queue_names, "brpop").brpop(queue_names, timeout=timeout)
+
+    async def xadd(
+        self,
+        name: str,
+        fields: dict[str, tp.Any],
+        maxlen: int | None = None,
+        approximate: bool = True,
+    ) -> bytes:
+        return await self.get_node(name).xadd(name, fields, maxlen=maxlen, approximate=approximate)
+
+    async def xgroup_create(self, name: str, group: str, id: str = "0", mkstream: bool = True) -> bool:
+        return await self.get_node(name).xgroup_create(name, group, id=id, mkstream=mkstream)
+
+    async def xgroup_delconsumer(self, name: str, group: str, consumer: str) -> int:
+        return await self.get_node(name).xgroup_delconsumer(name, group, consumer)
+
+    async def xreadgroup(
+        self,
+        group: str,
+        consumer: str,
+        streams: dict[str, str],
+        count: int | None = None,
+        block: int | None = None,
+    ) -> list[tuple[bytes, list[StreamEntry]]]:
+        if block is not None:
+            node = self._get_single_node(streams, "blocking xreadgroup")
+            return await node.xreadgroup(group, consumer, streams, count=count, block=block)
+        streams_by_node = self._group_by_node(streams)
+        nodes_result = await asyncio.gather(
+            *(
+                self.nodes[index].xreadgroup(
+                    group, consumer, {name: streams[name] for name in node_streams}, count=count
+                )
+                for index, node_streams in streams_by_node.items()
+            )
+        )
+        return [stream for node_result in nodes_result for stream in node_result]
+
+    async def xack(self, name: str, group: str, *ids: tp.Any) -> int:
+        return await self.get_node(name).xack(name, group, *ids)
+
+    async def xautoclaim(
+        self,
+        name: str,
+        group: str,
+        consumer: str,
+        min_idle_time: int,
+        start_id: str = "0-0",
+        count: int | None = None,
+    ) -> tuple[bytes, list[StreamEntry]]:
+        return await self.get_node(name).xautoclaim(
+            name, group, consumer, min_idle_time, start_id=start_id, count=count
+        )
+
+    async def publish(self, channel: str, message: tp.Any) -> int:
+        return await self.get_node(channel).publish(channel, message)
+
+    async def _subscribe(self, channels: list[str], patterns: list[str]) -> None:
+        # a channel lives on the node of its name, a pattern may match channels of every node
+        channels_by_node = self._group_by_node(channels)
+        await asyncio.gather(
+            *(
+                node._subscribe(channels_by_node.get(index, []), patterns)
+                for index, node in enumerate(self.nodes)
+                if index in channels_by_node or patterns
+            )
+        )
+
+    async def _unsubscribe(self, channels: list[str], patterns: list[str]) -> None:
+        channels_by_node = self._group_by_node(channels)
+        await asyncio.gather(
+            *(
+                node._unsubscribe(channels_by_node.get(index, []), patterns)
+                for index, node in enumerate(self.nodes)
+                if index in channels_by_node or patterns
+            )
+        )
+
+    async def execute_pipeline(self, pipeline: MemoryPipeline, transaction: bool = False) -> list[tp.Any]:
+        node_pipelines: dict[int, MemoryPipeline] = defaultdict(MemoryPipeline)
+        # positions of the commands of every node pipeline in the pipeline
+        positions: dict[int, list[int]] = defaultdict(list)
+        for position, command in enumerate(pipeline.commands):
+            name, args, _ = command
+            index = self._get_single_node_index(_get_command_keys(name, args), name)
+            node_pipelines[index].commands.append(command)
+            positions[index].append(position)
+        if transaction and len(node_pipelines) > 1:
+            raise ValueError("Keys of the transaction are on different nodes, use a common hash tag")
+        nodes_results = await asyncio.gather(
+            *(
+                self.nodes[index].execute_pipeline(node_pipeline, transaction=transaction)
+                for index, node_pipeline in node_pipelines.items()
+            )
+        )
+        results: list[tp.Any] = [None] * len(pipeline.commands)
+        for index, node_results in zip(node_pipelines, nodes_results, strict=True):
+            for position, result in zip(positions[index], node_results, strict=True):
+                results[position] = result
+        return results
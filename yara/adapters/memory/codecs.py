@@ -0,0 +1,218 @@
+import abc
+import importlib
+import typing as tp
+import zlib
+
+import orjson
+
+
+def _import_module(name: str, package: str) -> tp.Any:
+    try:
+        return importlib.import_module(name)
+    except ImportError as e:
+        raise ValueError(f"Install {package} to use it for memory values") from e
+
+
+class MemoryCodec(abc.ABC):
+    @abc.abstractmethod
+    def dumps(self, value: tp.Any) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    def loads(self, data: bytes) -> tp.Any:
+        ...
+
+
+class OrjsonMemoryCodec(MemoryCodec):
+    def dumps(self, value: tp.Any) -> bytes:
+        return orjson.dumps(value)
+
+    def loads(self, data: bytes) -> tp.Any:
+        return orjson.loads(data)
+
+
+class MsgpackMemoryCodec(MemoryCodec):
+    def __init__(self) -> None:
+        self.msgpack = _import_module("msgpack", "msgpack")
+
+    def dumps(self, value: tp.Any) -> bytes:
+        return self.msgpack.packb(value)
+
+    def loads(self, data: bytes) -> tp.Any:
+        return self.msgpack.unpackb(data)
+
+
+class RawMemoryCodec(MemoryCodec):
+    """
+    Stores bytes and strings as is, values are returned as bytes.
+    """
+
+    def dumps(self, value: tp.Any) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        if isinstance(value, str):
+            return value.encode("utf-8")
+        if isinstance(value, int | float) and not isinstance(value, bool):
+            return repr(value).encode("utf-8")
+        raise ValueError(f"Raw codec can't store {type(value).__name__} values")
+
+    def loads(self, data: bytes) -> tp.Any:
+        return data
+
+
+class MemoryCompressor(abc.ABC):
+    # first byte of the values compressed with the compressor
+    header: bytes
+
+    @abc.abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    def decompress(self, data: bytes) -> bytes:
+        ...
+
+
+class ZlibMemoryCompressor(MemoryCompressor):
+    header = b"z"
+
+    def compress(self, data: bytes) -> bytes:
+        return zlib.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data)
+
+
+class ZstdMemoryCompressor(MemoryCompressor):
+    header = b"s"
+
+    def __init__(self) -> None:
+        zstandard = _import_module("zstandard", "zstandard")
+        self.compressor = zstandard.ZstdCompressor()
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self.decompressor.decompress(data)
+
+
+class Lz4MemoryCompressor(MemoryCompressor):
+    header = b"l"
+
+    def __init__(self) -> None:
+        self.lz4_frame = _import_module("lz4.frame", "lz4")
+
+    def compress(self, data: bytes) -> bytes:
+        return self.lz4_frame.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self.lz4_frame.decompress(data)
+
+
+CODECS: dict[str, type[MemoryCodec]] = {
+    "orjson": OrjsonMemoryCodec,
+    "msgpack": MsgpackMemoryCodec,
+    "raw": RawMemoryCodec,
+}
+
+COMPRESSORS: dict[str, type[MemoryCompressor]] = {
+    "zlib": ZlibMemoryCompressor,
+    "zstd": ZstdMemoryCompressor,
+    "lz4": Lz4MemoryCompressor,
+}
+
+# first byte of the values stored without compression
+UNCOMPRESSED_HEADER = b"\x00"
+
+
+class MemoryValueCodec:
+    """
+    Serializes values with the codec and compresses the ones larger than compression_threshold bytes.
+    The first byte of a stored value tells how it is compressed,
+    so values written before a compression settings change remain readable.
+    """
+
+    codec: MemoryCodec
+    compressor: MemoryCompressor | None
+    compression_threshold: int
+
+    def __init__(self, codec: str, compression: str | None = None, compression_threshold: int = 1024) -> None:
+        codec_cls = CODECS.get(codec)
+        if not codec_cls:
+            raise ValueError(f"Memory codec {codec} not found")
+        self.codec = codec_cls()
+        self.compressor = self._get_compressor(compression) if compression else None
+        self.compression_threshold = compression_threshold
+        self._decompressors: dict[bytes, MemoryCompressor] = {}
+
+    @staticmethod
+    def _get_compressor(name: str) -> MemoryCompressor:
+        compressor_cls = COMPRESSORS.get(name)
+        if not compressor_cls:
+            raise ValueError(f"Memory compression {name} not found")
+        return compressor_cls()
+
+    def _get_decompressor(self, header: bytes) -> MemoryCompressor:
+        if self.compressor and self.compressor.header == header:
+            return self.compressor
+        if header not in self._decompressors:
+            for name, compressor_cls in COMPRESSORS.items():
+                if compressor_cls.header == header:
+                    self._decompressors[header] = self._get_compressor(name)
+                    break
+            else:
+                raise ValueError(f"Unknown memory value header {header!r}")
+        return self._decompressors[header]
+
+    def encode(self, value: tp.Any) -> bytes:
+        data = self.codec.dumps(value)
+        if self.compressor and len(data) > self.compression_threshold:
+            return self.compressor.header + self.compressor.compress(data)
+        return UNCOMPRESSED_HEADER + data
+
+    def decode(self, data: bytes) -> tp.Any:
+        header, payload = data[:1], data[1:]
+        if header != UNCOMPRESSED_HEADER:
+            payload = self._get_decompressor(header).decompress(payload)
+        return self.codec.loads(payload)
+
+
+class MemoryCodecs:
+    """
+    Value codecs by key prefix, the longest matching prefix wins.
+    """
+
+    default: MemoryValueCodec
+    prefixes: list[tuple[str, MemoryValueCodec]]
+
+    def __init__(self, settings: tp.Any) -> None:
+        self.default = MemoryValueCodec(
+            settings.YARA_MEMORY_CODEC,
+            compression=settings.YARA_MEMORY_COMPRESSION,
+            compression_threshold=settings.YARA_MEMORY_COMPRESSION_THRESHOLD,
+        )
+        self.prefixes = sorted(
+            (
+                (
+                    prefix,
+                    MemoryValueCodec(
+                        options.get("codec", settings.YARA_MEMORY_CODEC),
+                        compression=options.get("compression", settings.YARA_MEMORY_COMPRESSION),
+                        compression_threshold=options.get(
+                            "compression_threshold", settings.YARA_MEMORY_COMPRESSION_THRESHOLD
+                        ),
+                    ),
+                )
+                for prefix, options in settings.YARA_MEMORY_CODECS.items()
+            ),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+    def get(self, key: str) -> MemoryValueCodec:
+        for prefix, codec in self.prefixes:
+            if key.startswith(prefix):
+                return codec
+        return self.default
@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import time
+import typing as tp
+import uuid
+from collections import OrderedDict
+
+import orjson
+
+from yara.adapters.memory.backends.base import MemoryBackend
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryNearCache:
+    """
+    Per process LRU cache with TTL in front of the memory backend for keys starting with one of the prefixes.
+    Writes through MemoryAdapter drop the keys locally and publish them on the invalidation channel,
+    so other processes drop their copies too. The TTL bounds staleness when an invalidation is lost.
+    """
+
+    backend: MemoryBackend
+    prefixes: tuple[str, ...]
+    max_size: int
+    ttl: float
+    channel: str
+
+    # key -> (fetched at, value)
+    entries: OrderedDict[str, tuple[float, tp.Any]]
+
+    def __init__(
+        self,
+        backend: MemoryBackend,
+        prefixes: list[str],
+        max_size: int,
+        ttl: float,
+        channel: str,
+    ) -> None:
+        self.backend = backend
+        self.prefixes = tuple(prefixes)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.channel = channel
+        self.entries = OrderedDict()
+        self.node_id = uuid.uuid4().hex
+        # bumped by every invalidation, a value fetched across an invalidation is not cached
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.served_age_total = 0.0
+        self.served_age_max = 0.0
+        self.invalidation_lag_total = 0.0
+        self.invalidation_lag_count = 0
+        self._listen_task: asyncio.Task[None] | None = None
+
+    def is_cached(self, key: str) -> bool:
+        return key.startswith(self.prefixes)
+
+    def _lookup(self, key: str) -> tuple[bool, tp.Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        age = time.monotonic() - entry[0]
+        if age >= self.ttl:
+            del self.entries[key]
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.served_age_total += age
+        self.served_age_max = max(self.served_age_max, age)
+        return True, entry[1]
+
+    def _store(self, key: str, value: tp.Any) -> None:
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key: str) -> tp.Any:
+        found, value = self._lookup(key)
+        if found:
+            return value
+        version = self.version
+        value = await self.backend.get(key)
+        if version == self.version:
+            self._store(key, value)
+        return value
+
+    async def mget(self, keys: list[str]) -> list[tp.Any]:
+        values: dict[str, tp.Any] = {}
+        missing_keys = []
+        for key in keys:
+            found, value = self._lookup(key) if self.is_cached(key) else (False, None)
+            if found:
+                values[key] = value
+            else:
+                missing_keys.append(key)
+        if missing_keys:
+            version = self.version
+            fetched_values = await self.backend.mget(missing_keys)
+            for key, value in zip(missing_keys, fetched_values, strict=True):
+                values[key] = value
+                if version == self.version and self.is_cached(key):
+                    self._store(key, value)
+        return [values[key] for key in keys]
+
+    def invalidate_local(self, keys: list[str]) -> None:
+        self.version += 1
+        for key in keys:
+            if self.entries.pop(key, None) is not None:
+                self.invalidations += 1
+
+    async def invalidate(self, keys: list[str]) -> None:
+        self.invalidate_local(keys)
+        message = orjson.dumps({"node_id": self.node_id, "keys": keys, "time": time.time()})
+        try:
+            await self.backend.publish(self.channel, message)
+        except Exception:
+            logger.exception("Failed to publish near cache invalidation of %s", keys)
+
+    def clear(self) -> None:
+        self.version += 1
+        self.entries.clear()
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async for _, data in self.backend.subscribe(self.channel):
+                    message = orjson.loads(data)
+                    if message["node_id"] == self.node_id:
+                        continue
+                    self.invalidate_local(message["keys"])
+                    self.invalidation_lag_total += max(time.time() - message["time"], 0.0)
+                    self.invalidation_lag_count += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Near cache invalidation listener failed, reconnecting")
+            # invalidations may have been missed while disconnected
+            self.clear()
+            await asyncio.sleep(1)
+
+    async def start(self) -> None:
+        if self._listen_task is None:
+            self._listen_task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            self._listen_task = None
+        self.clear()
+
+    def metrics(self) -> dict[str, tp.Any]:
+        requests = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            # seconds since the served values have been fetched from the backend
+            "served_age_avg": self.served_age_total / self.hits if self.hits else 0.0,
+            "served_age_max": self.served_age_max,
+            # seconds between a write on another process and the local invalidation
+            "invalidation_lag_avg": (
+                self.invalidation_lag_total / self.invalidation_lag_count if self.invalidation_lag_count else 0.0
+            ),
+        }
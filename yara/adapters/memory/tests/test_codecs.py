@@ -0,0 +1,29 @@
+import pytest
+
+from yara.adapters.memory.codecs import MemoryCodecs, MemoryValueCodec
+from yara.settings import YaraSettings
+
+
+def test_compression_threshold() -> None:
+    codec = MemoryValueCodec("orjson", compression="zlib", compression_threshold=100)
+    small = {"id": 1}
+    large = {"items": ["item"] * 100}
+    assert codec.encode(small) == b'\x00{"id":1}'
+    assert codec.encode(large)[:1] == b"z"
+    assert codec.decode(codec.encode(small)) == small
+    assert codec.decode(codec.encode(large)) == large
+    # compressed values stay readable when the compression is turned off
+    assert MemoryValueCodec("orjson").decode(codec.encode(large)) == large
+
+
+def test_codecs_by_prefix() -> None:
+    codecs = MemoryCodecs(
+        YaraSettings.model_construct(
+            YARA_MEMORY_CODECS={"raw:": {"codec": "raw"}, "raw:zlib:": {"compression": "zlib"}},
+        )
+    )
+    assert codecs.get("user:1") is codecs.default
+    assert codecs.get("raw:1").decode(codecs.get("raw:1").encode("text")) == b"text"
+    assert codecs.get("raw:zlib:1").compressor is not None
+    with pytest.raises(ValueError, match="not found"):
+        MemoryValueCodec("pickle")
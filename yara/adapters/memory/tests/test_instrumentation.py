@@ -0,0 +1,27 @@
+import pytest
+
+from yara.adapters.memory.backends.instrumentation import LatencyHistogram, MemoryInstrumentation
+
+
+def test_latency_histogram() -> None:
+    histogram = LatencyHistogram()
+    for duration in [0.0002] * 98 + [0.03, 10.0]:
+        histogram.observe(duration)
+    metrics = histogram.to_dict()
+    assert metrics["count"] == 100
+    assert metrics["p50"] == 0.0005
+    assert metrics["p99"] == 0.05
+    assert metrics["max"] == 10.0
+    assert metrics["buckets"]["+inf"] == 1
+
+
+def test_errors_and_slow_commands() -> None:
+    instrumentation = MemoryInstrumentation(slow_threshold=0.0)
+    with pytest.raises(ValueError, match="failed"), instrumentation.measure("GET", "key"):
+        raise ValueError("failed")
+    with instrumentation.measure("BRPOP", "queue"):
+        pass
+    metrics = instrumentation.metrics()
+    assert metrics["errors"] == {"GET": 1}
+    assert metrics["commands"]["GET"]["count"] == 1
+    assert metrics["slow_commands"] == 1
@@ -0,0 +1,128 @@
+import asyncio
+import time
+import typing as tp
+
+import pytest
+
+from yara.adapters.memory.backends.local import LocalMemoryBackend
+from yara.settings import YaraSettings
+
+
+def get_backend(**settings: tp.Any) -> LocalMemoryBackend:
+    return LocalMemoryBackend(YaraSettings.model_construct(**settings))
+
+
+async def test_set_get_expire(monkeypatch: pytest.MonkeyPatch) -> None:
+    backend = get_backend()
+    assert await backend.set("key", 1, ex=60)
+    assert not await backend.set("key", 2, nx=True)
+    assert await backend.get("key") == b"1"
+    assert await backend.incrby("counter", 5, ex=60) == 5
+    assert await backend.incrby("counter") == 6
+    await backend.expire("key", 0)
+    assert await backend.exists("key") == 0
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    assert backend.reap_expired() == 1
+    assert await backend.mget(["key", "counter"]) == [None, None]
+
+
+async def test_collections() -> None:
+    backend = get_backend()
+    assert await backend.sadd("set", "a", "b", "a") == 2
+    assert await backend.sismember("set", "a")
+    assert await backend.smismember("set", ["a", "c", "b"]) == [True, False, True]
+    await backend.lpush("list", "a", "b", "c", "d")
+    assert await backend.ltrim("list", 0, 1)
+    assert await backend.rpop("list", count=10) == [b"c", b"d"]
+    await backend.lpush("list", "a", "b", "c")
+    assert await backend.ltrim("list", -2, -1)
+    assert await backend.rpop("list", count=10) == [b"a", b"b"]
+    assert await backend.srem("set", "a", "b") == 2
+    assert not await backend.exists("set")
+    await backend.hset("hash", {"x": 1})
+    assert await backend.hmget("hash", ["x", "y"]) == [b"1", None]
+    await backend.zadd("zset", {"a": 1, "b": 2, "c": 3})
+    assert await backend.zrangebyscore("zset", "(1", "+inf") == [b"b", b"c"]
+    assert await backend.zremrangebyscore("zset", "-inf", 2) == 2
+    with pytest.raises(ValueError, match="another type"):
+        await backend.hgetall("zset")
+
+
+async def test_brpop() -> None:
+    backend = get_backend()
+    waiter = asyncio.create_task(backend.brpop(["queue"]))
+    await asyncio.sleep(0)
+    await backend.lpush("queue", "message")
+    assert await waiter == [b"queue", b"message"]
+    assert await backend.brpop(["queue"], timeout=0.01) is None  # type: ignore [arg-type]
+
+
+async def test_lru_eviction() -> None:
+    backend = get_backend(YARA_MEMORY_LOCAL_MAX_MEMORY=300)
+    for index in range(5):
+        await backend.set(f"key{index}", "x" * 10)
+        await backend.get("key0")
+    assert await backend.exists("key0")
+    assert not await backend.exists("key1")
+    assert backend.memory <= 300
+
+
+async def test_scans() -> None:
+    backend = get_backend()
+    await backend.sadd("set", *range(25))
+    await backend.hset("hash", {"a1": 1, "b1": 2})
+    await backend.set("key", 1)
+    assert {member async for member in backend.sscan_iter("set", count=10)} == {str(i).encode() for i in range(25)}
+    assert sorted([member async for member in backend.sscan_iter("set", match="2?")]) == [
+        b"20",
+        b"21",
+        b"22",
+        b"23",
+        b"24",
+    ]
+    assert [field async for field in backend.hscan_iter("hash", match="a*")] == [(b"a1", b"1")]
+    assert sorted([key async for key in backend.scan_iter()]) == ["hash", "key", "set"]
+
+
+async def test_streams(monkeypatch: pytest.MonkeyPatch) -> None:
+    backend = get_backend()
+    assert await backend.xgroup_create("stream", "group")
+    assert not await backend.xgroup_create("stream", "group")
+    first_id = await backend.xadd("stream", {"message": "a"})
+    await backend.xadd("stream", {"message": "b"})
+    await backend.xadd("stream", {"message": "c"}, maxlen=2)
+    # "a" is trimmed before it is read
+    result = await backend.xreadgroup("group", "first", {"stream": ">"}, count=1)
+    assert [(name, [fields for _, fields in entries]) for name, entries in result] == [
+        (b"stream", [{b"message": b"b"}])
+    ]
+    [(_, [(b_id, _)])] = result
+    assert b_id > first_id
+    assert await backend.xreadgroup("group", "second", {"stream": ">"}, block=10) != []
+    assert await backend.xreadgroup("group", "second", {"stream": ">"}, block=10) == []
+    # pending entries of the consumer are read again after the id
+    assert [entry_id for entry_id, _ in (await backend.xreadgroup("group", "first", {"stream": "0"}))[0][1]] == [b_id]
+    assert await backend.xack("stream", "group", b_id) == 1
+    assert await backend.xack("stream", "group", b_id) == 0
+
+    # the entry of "second" is claimed by "third" once idle
+    assert await backend.xautoclaim("stream", "group", "third", 60000) == (b"0-0", [])
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 61)
+    _, claimed = await backend.xautoclaim("stream", "group", "third", 60000)
+    assert [fields for _, fields in claimed] == [{b"message": b"c"}]
+    assert await backend.xgroup_delconsumer("stream", "group", "second") == 0
+    assert await backend.xgroup_delconsumer("stream", "group", "third") == 1
+    assert await backend.xautoclaim("stream", "group", "first", 0) == (b"0-0", [])
+
+
+async def test_blocking_xreadgroup() -> None:
+    backend = get_backend()
+    await backend.xgroup_create("stream", "group", id="$")
+    waiter = asyncio.create_task(backend.xreadgroup("group", "consumer", {"stream": ">"}, block=1000))
+    await asyncio.sleep(0)
+    entry_id = await backend.xadd("stream", {"message": "a"})
+    assert await waiter == [(b"stream", [(entry_id, {b"message": b"a"})])]
+    with pytest.raises(ValueError, match="does not exist"):
+        await backend.xreadgroup("missing", "consumer", {"stream": ">"})
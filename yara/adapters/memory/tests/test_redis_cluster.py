@@ -0,0 +1,52 @@
+import asyncio
+import inspect
+import typing as tp
+
+import pytest
+from redis.asyncio.cluster import RedisCluster
+
+from yara.adapters.memory.backends.pipeline import MemoryPipeline
+from yara.adapters.memory.backends.redis import RedisMemoryBackend
+from yara.adapters.memory.backends.redis_cluster import RedisClusterMemoryBackend, _BlockingRedisCluster
+from yara.settings import YaraSettings
+
+
+def test_overridden_private_methods() -> None:
+    # _BlockingRedisCluster wraps private RedisCluster methods, fail loudly when redis-py changes them
+    for name in ("_execute_pipeline_by_slot",):
+        assert inspect.iscoroutinefunction(getattr(RedisCluster, name, None))
+        assert list(inspect.signature(getattr(RedisCluster, name)).parameters) == list(
+            inspect.signature(getattr(_BlockingRedisCluster, name)).parameters
+        )
+
+
+async def test_pipeline_takes_connection(monkeypatch: pytest.MonkeyPatch) -> None:
+    backend = RedisClusterMemoryBackend(YaraSettings.model_construct(), dsn="redis://localhost:7001")
+    # not initialized, the node connections are never opened
+    client = tp.cast(
+        _BlockingRedisCluster,
+        _BlockingRedisCluster.from_url(
+            "redis://localhost:7001", max_connections=1, instrumentation=backend.instrumentation
+        ),
+    )
+    backend.client = client
+    release = asyncio.Event()
+    in_use: list[int] = []
+
+    async def execute_pipeline(
+        self: RedisMemoryBackend, pipeline: MemoryPipeline, transaction: bool = False
+    ) -> list[tp.Any]:
+        in_use.append(client.in_use)
+        await release.wait()
+        return [True]
+
+    monkeypatch.setattr(RedisMemoryBackend, "execute_pipeline", execute_pipeline)
+    pipeline = MemoryPipeline().set("key", 1)
+    first = asyncio.create_task(backend.execute_pipeline(pipeline))
+    second = asyncio.create_task(backend.execute_pipeline(pipeline))
+    await asyncio.sleep(0.01)
+    # the second pipeline waits for the only connection
+    assert in_use == [1]
+    release.set()
+    assert await asyncio.gather(first, second) == [[True], [True]]
+    assert client.in_use == 0
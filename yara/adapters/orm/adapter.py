@@ -1,26 +1,39 @@
+import asyncio
+import inspect
+import logging
 import typing as tp
+from collections.abc import AsyncGenerator
 
 from yara.adapters.orm.backends.base import ORMBackend
+from yara.adapters.orm.backends.deadline import deadline
+from yara.adapters.orm.backends.registry import get_eq_columns, get_where_columns
 from yara.adapters.orm.backends.schemas import (
+    BulkProgress,
     DeleteClause,
     InsertClause,
+    OrderClause,
     PaginationClause,
     SelectClause,
     UpdateClause,
     WhereClause,
     where_clause,
 )
+from yara.adapters.orm.buffer import ORMWriteBuffer
 from yara.apps.orm.models import Model
 from yara.core.adapters import YaraAdapter
 from yara.core.helpers import import_obj
 from yara.main import YaraBaseRootApp
 
+logger = logging.getLogger(__name__)
+
 TModel = tp.TypeVar("TModel", bound=Model)
+TProgressCallback = tp.Callable[[BulkProgress], tp.Any]
 
 
 class ORMAdapter(tp.Generic[TModel], YaraAdapter):
     backend: ORMBackend
     root_app: YaraBaseRootApp
+    write_buffer: ORMWriteBuffer
 
     def __init__(self, root_app: YaraBaseRootApp) -> None:
         super().__init__(root_app)
@@ -33,71 +46,117 @@ class ORMAdapter(tp.Generic[TModel], YaraAdapter):
             raise ValueError(f"Backend {backend_cls_path} not found")
 
         self.backend = backend_cls(self.root_app.settings)
+        self.write_buffer = ORMWriteBuffer(
+            self.backend,
+            max_size=self.root_app.settings.YARA_ORM_WRITE_BUFFER_SIZE,
+            flush_interval=self.root_app.settings.YARA_ORM_WRITE_BUFFER_INTERVAL,
+            max_pending=self.root_app.settings.YARA_ORM_WRITE_BUFFER_MAX_PENDING,
+        )
 
     async def up(self) -> None:
         await self.backend.up()
+        await self.backend.load_registry()
+        await self.write_buffer.start()
 
     async def healthcheck(self) -> bool:
         return await self.backend.healthcheck()
 
     async def shutdown(self) -> None:
+        await self.write_buffer.stop()
         await self.backend.shutdown()
 
+    def pin(self) -> tp.Any:
+        """
+        Reuse one lazily acquired connection for all ORM calls inside the context.
+        """
+        return self.backend.pin()
+
+    def _warn_unindexed(
+        self,
+        model_cls: type[TModel],
+        where: list[WhereClause] | None,
+        order_by: list[OrderClause] | None = None,
+    ) -> None:
+        if not self.root_app.settings.YARA_ORM_WARN_UNINDEXED:
+            return
+        columns = get_where_columns(where) + [order.column for order in order_by or []]
+        unindexed_columns = self.backend.registry.get_unindexed_columns(model_cls.__table__, columns)
+        if unindexed_columns:
+            logger.warning(
+                "Query on %s filters or sorts by unindexed columns: %s", model_cls.__table__, unindexed_columns
+            )
+
+    def _is_unique_lookup(
+        self,
+        model_cls: type[TModel],
+        where: list[WhereClause],
+    ) -> bool:
+        return self.backend.registry.get_unique_key(model_cls.__table__, get_eq_columns(where)) is not None
+
     async def list_rows(
         self,
         model_cls: type[TModel],
         clause: SelectClause,
+        timeout: float | None = None,
     ) -> tuple[list[TModel] | list[dict[str, tp.Any]], int]:
-        rows = await self.backend.select(
-            model_cls.__table__,
-            clause,
-        )
-        clause.pagination = None
-        total = await self.backend.count(
-            model_cls.__table__,
-            clause.where,
-        )
-        if clause.columns is not None:
-            return rows, total
-        return [model_cls.serialize(row) for row in rows], total
+        with deadline(timeout):
+            self._warn_unindexed(model_cls, clause.where, clause.order_by)
+            rows = await self.backend.select(
+                model_cls.__table__,
+                clause,
+            )
+            clause.pagination = None
+            total = await self.backend.count(
+                model_cls.__table__,
+                clause.where,
+            )
+            if clause.columns is not None:
+                return rows, total
+            return [model_cls.serialize(row) for row in rows], total
 
     async def read(
         self,
         model_cls: type[TModel],
         where: list[WhereClause],
+        timeout: float | None = None,
     ) -> TModel | None:
-        rows = await self.backend.select(
-            model_cls.__table__,
-            SelectClause(
-                where=where,
-                pagination=PaginationClause(
-                    limit=2,  # check if there are multiple rows
+        with deadline(timeout):
+            self._warn_unindexed(model_cls, where)
+            rows = await self.backend.select(
+                model_cls.__table__,
+                SelectClause(
+                    where=where,
+                    pagination=PaginationClause(
+                        # check if there are multiple rows unless the lookup is by a unique key
+                        limit=1 if self._is_unique_lookup(model_cls, where) else 2,
+                    ),
                 ),
-            ),
-        )
-        if len(rows) > 1:
-            raise Exception("Multiple rows returned")
-        if len(rows) == 0:
-            return None
-        return model_cls.serialize(rows[0])
+            )
+            if len(rows) > 1:
+                raise Exception("Multiple rows returned")
+            if len(rows) == 0:
+                return None
+            return model_cls.serialize(rows[0])
 
     async def create(
         self,
         model_cls: type[TModel],
         payload: dict[str, tp.Any],
         returning: list[str] | None = None,
+        timeout: float | None = None,
     ) -> dict[str, tp.Any]:
-        rows = await self.backend.insert(
-            model_cls.__table__,
-            InsertClause(
-                columns=list(payload.keys()),
-                values=list(payload.values()),
-                returning=returning,
-            ),
-        )
-        if rows:
-            return rows[0]
-        return {}
+        with deadline(timeout):
+            rows = await self.backend.insert(
+                model_cls.__table__,
+                InsertClause(
+                    columns=list(payload.keys()),
+                    values=list(payload.values()),
+                    returning=returning,
+                ),
+            )
+            if rows:
+                return rows[0]
+            return {}
 
     async def update(
         self,
@@ -105,125 +164,348 @@ class ORMAdapter(tp.Generic[TModel], YaraAdapter):
         payload: dict[str, tp.Any],
         where: list[WhereClause],
         returning: list[str] | None = None,
+        timeout: float | None = None,
     ) -> dict[str, tp.Any]:
-        results = await self.backend.update(
-            model_cls.__table__,
-            UpdateClause(
-                columns=list(payload.keys()),
-                values=list(payload.values()),
-                where=where,
-                returning=returning,
-            ),
-        )
-        if results:
-            return results[0]
-        return {}
+        with deadline(timeout):
+            self._warn_unindexed(model_cls, where)
+            results = await self.backend.update(
+                model_cls.__table__,
+                UpdateClause(
+                    columns=list(payload.keys()),
+                    values=list(payload.values()),
+                    where=where,
+                    returning=returning,
+                ),
+            )
+            if results:
+                return results[0]
+            return {}
 
     async def delete(
         self,
         model_cls: type[TModel],
         where: list[WhereClause],
+        timeout: float | None = None,
     ) -> None:
-        await self.backend.delete(
-            model_cls.__table__,
-            DeleteClause(
-                where=where,
-            ),
+        with deadline(timeout):
+            self._warn_unindexed(model_cls, where)
+            await self.backend.delete(
+                model_cls.__table__,
+                DeleteClause(
+                    where=where,
+                ),
+            )
+
+    def _get_primary_key(self, model_cls: type[TModel]) -> str:
+        table_schema = self.backend.registry.get_table(model_cls.__table__)
+        if not table_schema or len(table_schema.primary_key) != 1:
+            return "id"
+        return table_schema.primary_key[0]
+
+    async def _iter_key_chunks(
+        self,
+        model_cls: type[TModel],
+        where: list[WhereClause],
+        chunk_size: int,
+        start_after: tp.Any = None,
+    ) -> AsyncGenerator[list[tp.Any], None]:
+        # Keyset pagination by primary key, each chunk is a short statement of its own
+        primary_key = self._get_primary_key(model_cls)
+        last_key = start_after
+        while True:
+            chunk_where = where
+            if last_key is not None:
+                chunk_where = where + where_clause(**{f"{primary_key}__gt": last_key})
+            rows = await self.backend.select(
+                model_cls.__table__,
+                SelectClause(
+                    columns=[primary_key],
+                    where=chunk_where,
+                    order_by=[OrderClause(column=primary_key)],
+                    pagination=PaginationClause(limit=chunk_size),
+                ),
+            )
+            if not rows:
+                return
+            keys = [row[primary_key] if isinstance(row[primary_key], int) else str(row[primary_key]) for row in rows]
+            yield keys
+            if len(keys) < chunk_size:
+                return
+            last_key = keys[-1]
+
+    async def _bulk(
+        self,
+        model_cls: type[TModel],
+        where: list[WhereClause],
+        run_chunk: tp.Callable[[list[WhereClause]], tp.Awaitable[list[dict[str, tp.Any]]]],
+        chunk_size: int | None = None,
+        pause: float | None = None,
+        start_after: tp.Any = None,
+        on_progress: TProgressCallback | None = None,
+    ) -> int:
+        self._warn_unindexed(model_cls, where)
+        chunk_size = chunk_size or self.root_app.settings.YARA_ORM_BULK_CHUNK_SIZE
+        pause = self.root_app.settings.YARA_ORM_BULK_CHUNK_PAUSE if pause is None else pause
+        primary_key = self._get_primary_key(model_cls)
+        progress = BulkProgress(last_key=start_after)
+        async for keys in self._iter_key_chunks(model_cls, where, chunk_size, start_after=start_after):
+            # the original where clause is applied again in case rows have changed since the chunk was selected
+            rows = await run_chunk(where + where_clause(**{f"{primary_key}__in": keys}))
+            progress.last_key = keys[-1]
+            progress.affected += len(rows)
+            progress.chunks += 1
+            if on_progress:
+                result = on_progress(progress.model_copy())
+                if inspect.isawaitable(result):
+                    await result
+            if pause:
+                await asyncio.sleep(pause)
+        return progress.affected
+
+    async def bulk_update(
+        self,
+        model_cls: type[TModel],
+        payload: dict[str, tp.Any],
+        where: list[WhereClause],
+        chunk_size: int | None = None,
+        pause: float | None = None,
+        start_after: tp.Any = None,
+        on_progress: TProgressCallback | None = None,
+    ) -> int:
+        """
+        Update rows in primary key ordered chunks. Returns the number of updated rows.
+        """
+        primary_key = self._get_primary_key(model_cls)
+
+        async def update_chunk(chunk_where: list[WhereClause]) -> list[dict[str, tp.Any]]:
+            return await self.backend.update(
+                model_cls.__table__,
+                UpdateClause(
+                    columns=list(payload.keys()),
+                    values=list(payload.values()),
+                    where=chunk_where,
+                    returning=[primary_key],
+                ),
+            )
+
+        return await self._bulk(
+            model_cls,
+            where,
+            update_chunk,
+            chunk_size=chunk_size,
+            pause=pause,
+            start_after=start_after,
+            on_progress=on_progress,
         )
 
+    async def bulk_delete(
+        self,
+        model_cls: type[TModel],
+        where: list[WhereClause],
+        chunk_size: int | None = None,
+        pause: float | None = None,
+        start_after: tp.Any = None,
+        on_progress: TProgressCallback | None = None,
+    ) -> int:
+        """
+        Delete rows in primary key ordered chunks. Returns the number of deleted rows.
+        """
+        primary_key = self._get_primary_key(model_cls)
+
+        async def delete_chunk(chunk_where: list[WhereClause]) -> list[dict[str, tp.Any]]:
+            return await self.backend.delete(
+                model_cls.__table__,
+                DeleteClause(
+                    where=chunk_where,
+                    returning=[primary_key],
+                ),
+            )
+
+        return await self._bulk(
+            model_cls,
+            where,
+            delete_chunk,
+            chunk_size=chunk_size,
+            pause=pause,
+            start_after=start_after,
+            on_progress=on_progress,
+        )
+
+    def buffered_create(
+        self,
+        model_cls: type[TModel],
+        payload: dict[str, tp.Any],
+    ) -> None:
+        """
+        Insert the row later with a bulk insert.
+        """
+        self.write_buffer.insert(model_cls.__table__, payload)
+
+    def buffered_update(
+        self,
+        model_cls: type[TModel],
+        key_value: tp.Any,
+        payload: dict[str, tp.Any],
+    ) -> None:
+        """
+        Update the row with the primary key later, pending updates of the same row are merged.
+        """
+        self.write_buffer.update(model_cls.__table__, self._get_primary_key(model_cls), key_value, payload)
+
+    def buffered_increment(
+        self,
+        model_cls: type[TModel],
+        key_value: tp.Any,
+        payload: dict[str, int | float],
+    ) -> None:
+        """
+        Increment columns of the row with the primary key later, pending increments of the same row are summed.
+        """
+        self.write_buffer.increment(model_cls.__table__, self._get_primary_key(model_cls), key_value, payload)
+
     async def create_and_read(
         self,
         model_cls: type[TModel],
         payload: dict[str, tp.Any],
+        timeout: float | None = None,
     ) -> TModel:
-        async with self.backend.uow():
-            row = await self.create(
-                model_cls,
-                payload,
-                returning=["id"],
-            )
-            assert row
-            obj = await self.read(
-                model_cls,
-                where_clause(id=str(row["id"])),
-            )
-            assert obj
-            return obj
+        with deadline(timeout):
+            async with self.backend.uow():
+                row = await self.create(
+                    model_cls,
+                    payload,
+                    returning=["id"],
+                )
+                assert row
+                obj = await self.read(
+                    model_cls,
+                    where_clause(id=str(row["id"])),
+                )
+                assert obj
+                return obj
 
     async def update_and_read(
         self,
         model_cls: type[TModel],
         payload: dict[str, tp.Any],
         where: list[WhereClause],
+        timeout: float | None = None,
     ) -> TModel | None:
-        async with self.backend.uow():
-            row = await self.update(
-                model_cls,
-                payload,
-                where,
-                returning=["id"],
-            )
-            if not row:
-                return None
-            return await self.read(
-                model_cls,
-                where_clause(id=str(row["id"])),
+        with deadline(timeout):
+            async with self.backend.uow():
+                row = await self.update(
+                    model_cls,
+                    payload,
+                    where,
+                    returning=["id"],
+                )
+                if not row:
+                    return None
+                return await self.read(
+                    model_cls,
+                    where_clause(id=str(row["id"])),
+                )
+
+    async def upsert(
+        self,
+        model_cls: type[TModel],
+        payload: dict[str, tp.Any],
+        conflict_target: list[str] | None = None,
+        timeout: float | None = None,
+    ) -> TModel:
+        with deadline(timeout):
+            conflict_target = conflict_target or self.backend.registry.get_unique_key(model_cls.__table__, payload)
+            if not conflict_target:
+                raise ValueError(f"Couldn't infer conflict target for {model_cls.__table__}")
+            rows = await self.backend.insert(
+                model_cls.__table__,
+                InsertClause(
+                    columns=list(payload.keys()),
+                    values=list(payload.values()),
+                    returning=["*"],
+                    on_conflict=conflict_target,
+                    # update the conflict target itself if there is nothing else to update to return the row
+                    on_conflict_update=[column for column in payload if column not in conflict_target]
+                    or conflict_target,
+                ),
             )
+            return model_cls.serialize(rows[0])
 
     async def update_or_create(
         self,
         model_cls: type[TModel],
         payload: dict[str, tp.Any],
         where: list[WhereClause],
+        timeout: float | None = None,
     ) -> TModel:
-        # TODO: select for update
-        async with self.backend.uow():
-            row = await self.update_and_read(
-                model_cls,
-                payload,
-                where,
-            )
-            if row:
-                return row
-            return await self.create_and_read(
-                model_cls,
-                payload,
-            )
+        with deadline(timeout):
+            eq_columns = get_eq_columns(where)
+            conflict_target = self.backend.registry.get_unique_key(model_cls.__table__, eq_columns)
+            if (
+                conflict_target
+                and self.backend.registry.can_insert(model_cls.__table__, payload)
+                and set(get_where_columns(where)) == set(eq_columns)
+                and all(column in payload and payload[column] == value for column, value in eq_columns.items())
+            ):
+                # the where clause is a unique key lookup matching a complete payload, upsert in a single statement
+                return await self.upsert(model_cls, payload, conflict_target=conflict_target)
+
+            # TODO: select for update
+            async with self.backend.uow():
+                row = await self.update_and_read(
+                    model_cls,
+                    payload,
+                    where,
+                )
+                if row:
+                    return row
+                return await self.create_and_read(
+                    model_cls,
+                    payload,
+                )
 
     async def read_or_create(
         self,
         model_cls: type[TModel],
         payload: dict[str, tp.Any],
         where: list[WhereClause],
+        timeout: float | None = None,
     ) -> TModel:
-        async with self.backend.uow():
-            row = await self.read(
-                model_cls,
-                where,
-            )
-            if row:
-                return row
-            return await self.create_and_read(
-                model_cls,
-                payload,
-            )
+        with deadline(timeout):
+            async with self.backend.uow():
+                row = await self.read(
+                    model_cls,
+                    where,
+                )
+                if row:
+                    return row
+                return await self.create_and_read(
+                    model_cls,
+                    payload,
+                )
 
     async def exists(
         self,
         model_cls: type[TModel],
         where: list[WhereClause],
+        timeout: float | None = None,
     ) -> bool:
-        return await self.backend.exists(
-            model_cls.__table__,
-            where=where,
-        )
+        with deadline(timeout):
+            self._warn_unindexed(model_cls, where)
+            return await self.backend.exists(
+                model_cls.__table__,
+                where=where,
+            )
 
     async def count(
         self,
         model_cls: type[TModel],
         where: list[WhereClause],
+        timeout: float | None = None,
     ) -> int:
-        return await self.backend.count(
-            model_cls.__table__,
-            where=where,
-        )
+        with deadline(timeout):
+            self._warn_unindexed(model_cls, where)
+            return await self.backend.count(
+                model_cls.__table__,
+                where=where,
+            )
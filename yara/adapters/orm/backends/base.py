@@ -6,14 +6,18 @@ import typing as tp
 from pkgutil import iter_modules
 
 from yara.adapters.orm.backends.exceptions import UndefinedTableError
+from yara.adapters.orm.backends.registry import ORMRegistry
 from yara.adapters.orm.backends.schemas import (
     ColumnClause,
     DeleteClause,
     EOperator,
+    IndexClause,
     InsertClause,
+    InsertManyClause,
     SelectClause,
     UniqueConstraintClause,
     UpdateClause,
+    UpdateManyClause,
     WhereClause,
     WhereTermClause,
 )
@@ -28,12 +32,15 @@ class ORMBackend:
     dsn: str
     migrations: list[str]
     migrations_table: str
+    registry: ORMRegistry
 
     def __init__(
         self,
         settings: YaraSettings,
+        dsn: str | None = None,
     ) -> None:
         self.settings = settings
+        self.dsn = dsn or settings.YARA_ORM_DSN
         self.migrations_table = self.settings.YARA_ORM_MIGRATIONS_TABLE
         self.migrations = []
         for app_path in settings.get_apps_paths():
@@ -43,6 +50,7 @@ class ORMBackend:
                 self.migrations.append(migrations_path)
             except ImportError:
                 continue
+        self.registry = ORMRegistry(self.migrations_table)
 
     @abc.abstractmethod
     async def up(self) -> None:
@@ -60,6 +68,10 @@ class ORMBackend:
     def uow(self) -> tp.Any:
         ...
 
+    @abc.abstractmethod
+    def pin(self) -> tp.Any:
+        ...
+
     @abc.abstractmethod
     async def execute(self, sql: str, *args: tp.Any, **kwargs: tp.Any) -> tp.Any:
         ...
@@ -78,6 +90,23 @@ class ORMBackend:
         table: str,
         columns: list[ColumnClause],
         unique_constraints: list[UniqueConstraintClause] | None = None,
+        indexes: list[IndexClause] | None = None,
+    ) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def create_index(
+        self,
+        table: str,
+        index: IndexClause,
+    ) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def drop_index(
+        self,
+        table: str,
+        index: IndexClause,
     ) -> None:
         ...
 
@@ -109,7 +138,7 @@ class ORMBackend:
         self,
         table: str,
         clause: DeleteClause,
-    ) -> None:
+    ) -> list[dict[str, tp.Any]]:
         ...
 
     @abc.abstractmethod
@@ -128,6 +157,22 @@ class ORMBackend:
     ) -> list[dict[str, tp.Any]]:
         ...
 
+    @abc.abstractmethod
+    async def insert_many(
+        self,
+        table: str,
+        clause: InsertManyClause,
+    ) -> None:
+        ...
+
+    @abc.abstractmethod
+    async def update_many(
+        self,
+        table: str,
+        clause: UpdateManyClause,
+    ) -> None:
+        ...
+
     @abc.abstractmethod
     async def count(
         self,
@@ -144,19 +189,32 @@ class ORMBackend:
     ) -> bool:
         ...
 
-    async def migrate(self, table: str) -> None:
-        try:
-            applied_migrations = [row["name"] for row in await self.select(table, SelectClause(columns=["name"]))]
-        except UndefinedTableError:
-            applied_migrations = []
+    def get_migration_modules(self) -> list[tp.Any]:
         migration_modules = []
         for migrations_module_path in self.migrations:
             module = importlib.import_module(migrations_module_path)
             for migration_module_info in iter_modules(module.__path__):
                 migration_module = importlib.import_module(migrations_module_path + "." + migration_module_info.name)
-                if migration_module.__name__ in applied_migrations:
-                    continue
                 migration_modules.append(migration_module)
+        return migration_modules
+
+    async def load_registry(self) -> None:
+        # Replay all migrations against the registry to know primary keys, unique keys and indexes
+        registry = ORMRegistry(self.migrations_table)
+        for migration_module in self.get_migration_modules():
+            await migration_module.upgrade(registry)
+        self.registry = registry
+
+    async def migrate(self, table: str) -> None:
+        try:
+            applied_migrations = [row["name"] for row in await self.select(table, SelectClause(columns=["name"]))]
+        except UndefinedTableError:
+            applied_migrations = []
+        migration_modules = [
+            migration_module
+            for migration_module in self.get_migration_modules()
+            if migration_module.__name__ not in applied_migrations
+        ]
         async with self.uow():
             for migration_module in migration_modules:
                 await migration_module.upgrade(self)
@@ -178,34 +236,33 @@ class ORMBackend:
             applied_migrations = [row["name"] for row in await self.select(table, SelectClause(columns=["name"]))]
         except UndefinedTableError:
             applied_migrations = []
-        migration_modules = []
-        for migrations_module_path in self.migrations:
-            module = importlib.import_module(migrations_module_path)
-            for migration_module_info in iter_modules(module.__path__):
-                migration_module = importlib.import_module(migrations_module_path + "." + migration_module_info.name)
-                if migration_module.__name__ not in applied_migrations:
-                    continue
-                migration_modules.append(migration_module)
+        migration_modules = [
+            migration_module
+            for migration_module in self.get_migration_modules()
+            if migration_module.__name__ in applied_migrations
+        ]
         async with self.uow():
             for migration_module in migration_modules[::-1]:
                 if to_migration and migration_module.__name__ == to_migration:
                     break
                 await migration_module.downgrade(self)
                 with contextlib.suppress(UndefinedTableError):
-                    await self.delete(
-                        table,
-                        DeleteClause(
-                            where=[
-                                WhereClause(
-                                    terms=[
-                                        WhereTermClause(
-                                            column="name",
-                                            operator=EOperator.EQ,
-                                            value=migration_module.__name__,
-                                        ),
-                                    ],
-                                ),
-                            ],
-                        ),
-                    )
+                    # savepoint, the error would abort the whole transaction otherwise
+                    async with self.uow():
+                        await self.delete(
+                            table,
+                            DeleteClause(
+                                where=[
+                                    WhereClause(
+                                        terms=[
+                                            WhereTermClause(
+                                                column="name",
+                                                operator=EOperator.EQ,
+                                                value=migration_module.__name__,
+                                            ),
+                                        ],
+                                    ),
+                                ],
+                            ),
+                        )
                 logger.info("%s deleted", migration_module.__name__)
@@ -0,0 +1,39 @@
+import time
+from collections.abc import Generator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from yara.adapters.orm.backends.exceptions import QueryTimeoutError
+
+# Monotonic time by which all ORM calls of the current context have to finish
+orm_deadline: ContextVar[float | None] = ContextVar("orm_deadline", default=None)
+
+
+@contextmanager
+def deadline(timeout: float | None) -> Generator[None, None, None]:
+    """
+    Limit ORM calls inside the block to the timeout. Nested deadlines can only shrink the budget.
+    """
+    if timeout is None:
+        yield
+        return
+    current_deadline = orm_deadline.get()
+    new_deadline = time.monotonic() + timeout
+    token = orm_deadline.set(new_deadline if current_deadline is None else min(current_deadline, new_deadline))
+    try:
+        yield
+    finally:
+        orm_deadline.reset(token)
+
+
+def get_timeout() -> float | None:
+    """
+    Get the remaining budget of the current deadline.
+    """
+    current_deadline = orm_deadline.get()
+    if current_deadline is None:
+        return None
+    remaining = current_deadline - time.monotonic()
+    if remaining <= 0:
+        raise QueryTimeoutError("ORM deadline exceeded")
+    return remaining
@@ -1,2 +1,6 @@
 class UndefinedTableError(Exception):
     pass
+
+
+class QueryTimeoutError(TimeoutError):
+    pass
@@ -1,42 +1,108 @@
+import asyncio
 import logging
+import time
 import typing as tp
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
 
 import asyncpg
+import orjson
 from asyncpg.transaction import Transaction
 
 from yara.adapters.orm.backends.base import ORMBackend
-from yara.adapters.orm.backends.exceptions import UndefinedTableError
+from yara.adapters.orm.backends.deadline import deadline, get_timeout
+from yara.adapters.orm.backends.exceptions import QueryTimeoutError, UndefinedTableError
+from yara.adapters.orm.backends.registry import get_index_name
 from yara.adapters.orm.backends.schemas import (
     ColumnClause,
     DeleteClause,
     EColumnType,
     EOperator,
+    IndexClause,
     InsertClause,
+    InsertManyClause,
     SelectClause,
     UniqueConstraintClause,
     UpdateClause,
+    UpdateManyClause,
     WhereClause,
+    WhereTermClause,
 )
+from yara.core.helpers import import_obj
 
 logger = logging.getLogger(__name__)
 
+# asyncpg supports up to 32767 arguments per statement
+MAX_ARGUMENTS = 32767
 
-def _get_where_sql_with_values(where: list[WhereClause] | None, shift_index: int = 0) -> tuple[str, list[tp.Any]]:
+CAST_TYPES: dict[EColumnType, str] = {
+    EColumnType.BOOL: "BOOLEAN",
+    EColumnType.STR: "TEXT",
+    EColumnType.INT: "INTEGER",
+    EColumnType.SMALLINT: "SMALLINT",
+    EColumnType.BIGINT: "BIGINT",
+    EColumnType.FLOAT: "REAL",
+    EColumnType.DATETIME: "TIMESTAMP",
+    EColumnType.DATETIME_TZ: "TIMESTAMPTZ",
+    EColumnType.DATE: "DATE",
+    EColumnType.LIST: "TEXT[]",
+    EColumnType.DICT: "JSONB",
+    EColumnType.UUID: "UUID",
+    EColumnType.SERIAL: "INTEGER",
+    EColumnType.SMALLSERIAL: "SMALLINT",
+    EColumnType.BIGSERIAL: "BIGINT",
+}
+
+
+def _get_where_term_sql_with_value(
+    term: WhereTermClause,
+    index: int,
+    column_type: EColumnType | None = None,
+) -> tuple[str, tp.Any]:
+    placeholder = f"${index}"
+    match term.operator:
+        case EOperator.IN:
+            return f"{term.column} = ANY({placeholder})", term.value
+        case EOperator.CONTAINS | EOperator.CONTAINED_BY if isinstance(term.value, dict) or (
+            isinstance(term.value, list) and column_type != EColumnType.LIST
+        ):
+            # JSONB containment, served by GIN indexes. Lists are only bound as arrays for known TEXT[] columns.
+            if isinstance(term.value, list) and column_type is None:
+                logger.warning(
+                    "Type of column %s is not in the registry, %s with a list is compared as JSONB",
+                    term.column,
+                    term.operator,
+                )
+            return f"{term.column} {term.operator} {placeholder}::jsonb", orjson.dumps(term.value).decode()
+        case EOperator.HAS_ANY_KEYS | EOperator.HAS_ALL_KEYS:
+            return f"{term.column} {term.operator} {placeholder}::text[]", term.value
+        case EOperator.PATH_EXISTS | EOperator.PATH_MATCH:
+            return f"{term.column} {term.operator} {placeholder}::jsonpath", term.value
+        case _:
+            return f"{term.column} {term.operator} {placeholder}", term.value
+
+
+def _get_where_sql_with_values(
+    where: list[WhereClause] | None,
+    shift_index: int = 0,
+    types: dict[str, EColumnType] | None = None,
+) -> tuple[str, list[tp.Any]]:
     if not where:
         return "", []
 
     sql_where = " WHERE "
-    values = []
+    values: list[tp.Any] = []
     for index, where_clause in enumerate(where, start=1):
         sql_where += "("
         for subindex, where_clause_term in enumerate(where_clause.terms, start=1):
-            values.append(where_clause_term.value)
-            if where_clause_term.operator == EOperator.IN:
-                sql_where += f"{where_clause_term.column} = tp.Any(${shift_index + len(values)})"
-            else:
-                sql_where += f"{where_clause_term.column} {where_clause_term.operator} ${shift_index + len(values)}"
+            sql_term, value = _get_where_term_sql_with_value(
+                where_clause_term,
+                shift_index + len(values) + 1,
+                (types or {}).get(where_clause_term.column),
+            )
+            values.append(value)
+            sql_where += sql_term
             if subindex < len(where_clause.terms):
                 sql_where += f" {where_clause.conjunction} "
         sql_where += ")"
@@ -46,14 +112,74 @@ def _get_where_sql_with_values(where: list[WhereClause] | None, shift_index: int
     return sql_where, values
 
 
+class PinnedConnection:
+    connection: asyncpg.Connection | None
+    lock: asyncio.Lock
+    wait_time: float
+    released: bool
+
+    def __init__(self) -> None:
+        self.connection = None
+        self.lock = asyncio.Lock()
+        self.wait_time = 0.0
+        self.released = False
+
+
+class TransactionConnection:
+    connection: asyncpg.Connection
+    lock: asyncio.Lock
+
+    def __init__(self, connection: asyncpg.Connection) -> None:
+        self.connection = connection
+        self.lock = asyncio.Lock()
+
+
 class ORMPostgresBackend(ORMBackend):
     connection_pool: asyncpg.Pool | None = None
 
+    def __init__(self, settings: tp.Any, dsn: str | None = None) -> None:
+        super().__init__(settings, dsn=dsn)
+        self._pinned_connection: ContextVar[PinnedConnection | None] = ContextVar(
+            f"orm_pinned_connection_{id(self)}", default=None
+        )
+        self._transaction_connection: ContextVar[TransactionConnection | None] = ContextVar(
+            f"orm_transaction_connection_{id(self)}", default=None
+        )
+
     async def up(self) -> None:
+        init = None
+        if self.settings.YARA_ORM_POOL_INIT:
+            init = import_obj(self.settings.YARA_ORM_POOL_INIT)
+            if not init:
+                raise ValueError(f"Pool init {self.settings.YARA_ORM_POOL_INIT} not found")
+        statement_cache_size = self.settings.YARA_ORM_STATEMENT_CACHE_SIZE
+        server_settings = {}
+        if self.settings.YARA_ORM_PGBOUNCER:
+            # PgBouncer in transaction mode can't keep named prepared statements and startup parameters
+            # between transactions, statement_timeout has to be set on the database role instead.
+            statement_cache_size = 0
+            if self.settings.YARA_ORM_STATEMENT_TIMEOUT:
+                logger.warning("YARA_ORM_STATEMENT_TIMEOUT is ignored in PgBouncer mode")
+        elif self.settings.YARA_ORM_STATEMENT_TIMEOUT:
+            # server side safety net for statements running without a client side timeout
+            server_settings["statement_timeout"] = str(self.settings.YARA_ORM_STATEMENT_TIMEOUT)
         self.connection_pool: asyncpg.Pool = await asyncpg.create_pool(
-            dsn=self.settings.YARA_ORM_DSN,
+            dsn=self.dsn,
+            min_size=self.settings.YARA_ORM_POOL_MIN_SIZE,
+            max_size=self.settings.YARA_ORM_POOL_MAX_SIZE,
+            max_queries=self.settings.YARA_ORM_POOL_MAX_QUERIES,
+            max_inactive_connection_lifetime=self.settings.YARA_ORM_POOL_MAX_INACTIVE_CONNECTION_LIFETIME,
+            statement_cache_size=statement_cache_size,
+            init=init,
+            server_settings=server_settings or None,
         )
 
+    def _get_column_types(self, table: str) -> dict[str, EColumnType]:
+        table_schema = self.registry.get_table(table)
+        if not table_schema:
+            return {}
+        return {name: column.type for name, column in table_schema.columns.items()}
+
     async def healthcheck(self) -> bool:
         assert self.connection_pool is not None
         connection: asyncpg.Connection
@@ -65,46 +191,87 @@ class ORMPostgresBackend(ORMBackend):
             await self.connection_pool.close()
             self.connection_pool = None
 
+    @asynccontextmanager
+    async def _connection(self) -> AsyncGenerator[asyncpg.Connection, None]:
+        assert self.connection_pool is not None
+        transaction_connection = self._transaction_connection.get()
+        if transaction_connection is not None:
+            # calls of concurrent tasks of the same unit of work take turns on its connection,
+            # a nested unit of work holds it until its savepoint is released
+            async with transaction_connection.lock:
+                yield transaction_connection.connection
+            return
+        pinned_connection = self._pinned_connection.get()
+        if pinned_connection is None or pinned_connection.released:
+            async with self.connection_pool.acquire(timeout=get_timeout()) as connection:
+                yield connection
+            return
+        # calls of concurrent tasks of the same scope take turns on the pinned connection
+        async with pinned_connection.lock:
+            if pinned_connection.connection is None:
+                started_at = time.monotonic()
+                pinned_connection.connection = await self.connection_pool.acquire(timeout=get_timeout())
+                pinned_connection.wait_time = time.monotonic() - started_at
+            yield pinned_connection.connection
+
+    @asynccontextmanager
+    async def pin(self) -> AsyncGenerator[PinnedConnection, None]:
+        # Reuse one lazily acquired connection for all calls inside the scope (e.g. a request).
+        current_pinned_connection = self._pinned_connection.get()
+        if current_pinned_connection is not None and not current_pinned_connection.released:
+            yield current_pinned_connection
+            return
+        pinned_connection = PinnedConnection()
+        token = self._pinned_connection.set(pinned_connection)
+        try:
+            yield pinned_connection
+        finally:
+            self._pinned_connection.reset(token)
+            pinned_connection.released = True
+            if pinned_connection.connection is not None and self.connection_pool is not None:
+                logger.debug("Pinned connection released, pool wait time %.6fs", pinned_connection.wait_time)
+                await self.connection_pool.release(pinned_connection.connection)
+
     @asynccontextmanager
     async def uow(self) -> AsyncGenerator[Transaction, None]:
         # Unit of work. Run all queries in a single transaction.
-        assert self.connection_pool is not None
         connection: asyncpg.Connection
-        async with (self.connection_pool.acquire() as connection, connection.transaction() as transaction):
-            yield transaction
+        async with self._connection() as connection, connection.transaction() as transaction:
+            token = self._transaction_connection.set(TransactionConnection(connection))
+            try:
+                yield transaction
+            finally:
+                self._transaction_connection.reset(token)
 
-    async def execute(self, sql: str, *args: tp.Any, **kwargs: tp.Any) -> tp.Any:
-        assert self.connection_pool is not None
+    async def _query(
+        self, method: str, sql: str, *args: tp.Any, timeout: float | None = None, **kwargs: tp.Any
+    ) -> tp.Any:
         connection: asyncpg.Connection
         try:
-            async with self.connection_pool.acquire() as connection:
-                return await connection.execute(sql, *args, **kwargs)
+            with deadline(self.settings.YARA_ORM_TIMEOUT if timeout is None else timeout):
+                async with self._connection() as connection:
+                    # asyncpg cancels the query on the server when the timeout expires
+                    return await getattr(connection, method)(sql, *args, timeout=get_timeout(), **kwargs)
         except asyncpg.exceptions.UndefinedTableError as e:
             raise UndefinedTableError(str(e)) from e
+        except (TimeoutError, asyncpg.exceptions.QueryCanceledError) as e:
+            raise QueryTimeoutError(str(e)) from e
+
+    async def execute(self, sql: str, *args: tp.Any, **kwargs: tp.Any) -> tp.Any:
+        return await self._query("execute", sql, *args, **kwargs)
 
     async def fetch(self, sql: str, *args: tp.Any, **kwargs: tp.Any) -> tp.Any:
-        assert self.connection_pool is not None
-        connection: asyncpg.Connection
-        try:
-            async with self.connection_pool.acquire() as connection:
-                return await connection.fetch(sql, *args, **kwargs)
-        except asyncpg.exceptions.UndefinedTableError as e:
-            raise UndefinedTableError(str(e)) from e
+        return await self._query("fetch", sql, *args, **kwargs)
 
     async def fetchval(self, sql: str, *args: tp.Any, **kwargs: tp.Any) -> tp.Any:
-        assert self.connection_pool is not None
-        connection: asyncpg.Connection
-        try:
-            async with self.connection_pool.acquire() as connection:
-                return await connection.fetchval(sql, *args, **kwargs)
-        except asyncpg.exceptions.UndefinedTableError as e:
-            raise UndefinedTableError(str(e)) from e
+        return await self._query("fetchval", sql, *args, **kwargs)
 
     async def create_table(
         self,
         table: str,
         columns: list[ColumnClause],
         unique_constraints: list[UniqueConstraintClause] | None = None,
+        indexes: list[IndexClause] | None = None,
     ) -> None:
         columns_with_types: list[str] = []
         sql_triggers: list[str] = []
@@ -187,6 +354,10 @@ class ORMPostgresBackend(ORMBackend):
                 sql = f"ALTER TABLE {table} ADD CONSTRAINT {table}_{sql_column_names}_unique UNIQUE ({sql_columns});"
                 await self.execute(sql)
 
+        if indexes:
+            for index in indexes:
+                await self.create_index(table, index)
+
     async def drop_table(
         self,
         table: str,
@@ -194,6 +365,25 @@ class ORMPostgresBackend(ORMBackend):
         sql = f"DROP TABLE IF EXISTS {table};"
         await self.execute(sql)
 
+    async def create_index(
+        self,
+        table: str,
+        index: IndexClause,
+    ) -> None:
+        sql_unique = "UNIQUE " if index.unique else ""
+        sql_opclass = f" {index.opclass}" if index.opclass else ""
+        sql_columns = ",".join([f"{column}{sql_opclass}" for column in index.columns])
+        sql = f"CREATE {sql_unique}INDEX IF NOT EXISTS {get_index_name(table, index)} ON {table} USING {index.method} ({sql_columns});"
+        await self.execute(sql)
+
+    async def drop_index(
+        self,
+        table: str,
+        index: IndexClause,
+    ) -> None:
+        sql = f"DROP INDEX IF EXISTS {get_index_name(table, index)};"
+        await self.execute(sql)
+
     async def alter_field(
         self,
         table: str,
@@ -234,7 +424,7 @@ class ORMPostgresBackend(ORMBackend):
         table: str,
         clause: SelectClause,
     ) -> list[dict[str, tp.Any]]:
-        sql_where, values = _get_where_sql_with_values(clause.where)
+        sql_where, values = _get_where_sql_with_values(clause.where, types=self._get_column_types(table))
         sql_distinct = "DISTINCT " if clause.distinct else ""
         sql_columns = ",".join(clause.columns) if clause.columns else "*"
         sql_order_by = ""
@@ -255,10 +445,12 @@ class ORMPostgresBackend(ORMBackend):
         self,
         table: str,
         clause: DeleteClause,
-    ) -> None:
-        sql_where, values = _get_where_sql_with_values(clause.where)
-        sql = f"DELETE FROM {table}{sql_where};"  # noqa: S608
-        await self.execute(sql, *values)
+    ) -> list[dict[str, tp.Any]]:
+        sql_where, values = _get_where_sql_with_values(clause.where, types=self._get_column_types(table))
+        sql_returning = f" RETURNING {','.join(clause.returning)}" if clause.returning else ""
+        sql = f"DELETE FROM {table}{sql_where}{sql_returning};"  # noqa: S608
+        records = await self.fetch(sql, *values)
+        return [dict(record) for record in records or []]
 
     async def insert(
         self,
@@ -268,7 +460,17 @@ class ORMPostgresBackend(ORMBackend):
         sql_columns = ",".join(clause.columns)
         sql_values = ",".join([f"${index}" for index, _ in enumerate(clause.values, start=1)])
         sql_returning = f" RETURNING {','.join(clause.returning)}" if clause.returning else ""
-        sql = f"INSERT INTO {table} ({sql_columns}) VALUES ({sql_values}){sql_returning};"  # noqa: S608
+        sql_on_conflict = ""
+        if clause.on_conflict:
+            sql_on_conflict = f" ON CONFLICT ({','.join(clause.on_conflict)}) DO NOTHING"
+            if clause.on_conflict_update:
+                sql_on_conflict_update = ",".join([f"{i} = EXCLUDED.{i}" for i in clause.on_conflict_update])
+                sql_on_conflict = (
+                    f" ON CONFLICT ({','.join(clause.on_conflict)}) DO UPDATE SET {sql_on_conflict_update}"
+                )
+        sql = (
+            f"INSERT INTO {table} ({sql_columns}) VALUES ({sql_values}){sql_on_conflict}{sql_returning};"  # noqa: S608
+        )
         records = await self.fetch(sql, *clause.values)
         return [dict(record) for record in records or []]
 
@@ -281,17 +483,57 @@ class ORMPostgresBackend(ORMBackend):
             return []
         sql_columns = ",".join([f"{i} = ${index}" for index, i in enumerate(clause.columns, start=1)])
         sql_returning = f" RETURNING {','.join(clause.returning)}" if clause.returning else ""
-        sql_where, where_values = _get_where_sql_with_values(clause.where, shift_index=len(clause.values))
+        sql_where, where_values = _get_where_sql_with_values(
+            clause.where, shift_index=len(clause.values), types=self._get_column_types(table)
+        )
         sql = f"UPDATE {table} SET {sql_columns}{sql_where}{sql_returning};"  # noqa: S608
         records = await self.fetch(sql, *clause.values, *where_values)
         return [dict(record) for record in records or []]
 
+    async def insert_many(
+        self,
+        table: str,
+        clause: InsertManyClause,
+    ) -> None:
+        sql_columns = ",".join(clause.columns)
+        sql_on_conflict = f" ON CONFLICT ({','.join(clause.on_conflict)}) DO NOTHING" if clause.on_conflict else ""
+        chunk_size = MAX_ARGUMENTS // len(clause.columns)
+        for offset in range(0, len(clause.rows), chunk_size):
+            rows = clause.rows[offset : offset + chunk_size]
+            sql_rows = ",".join(
+                "(" + ",".join(f"${i * len(clause.columns) + j}" for j in range(1, len(clause.columns) + 1)) + ")"
+                for i in range(len(rows))
+            )
+            sql = f"INSERT INTO {table} ({sql_columns}) VALUES {sql_rows}{sql_on_conflict};"  # noqa: S608
+            await self.execute(sql, *[value for row in rows for value in row])
+
+    async def update_many(
+        self,
+        table: str,
+        clause: UpdateManyClause,
+    ) -> None:
+        columns = [clause.key, *clause.columns]
+        sql_casts = [f"::{CAST_TYPES[clause.types[column]]}" if column in clause.types else "" for column in columns]
+        if clause.increment:
+            sql_columns = ",".join([f"{i} = {table}.{i} + v.{i}" for i in clause.columns])
+        else:
+            sql_columns = ",".join([f"{i} = v.{i}" for i in clause.columns])
+        chunk_size = MAX_ARGUMENTS // len(columns)
+        for offset in range(0, len(clause.rows), chunk_size):
+            rows = clause.rows[offset : offset + chunk_size]
+            sql_rows = ",".join(
+                "(" + ",".join(f"${i * len(columns) + j + 1}{sql_cast}" for j, sql_cast in enumerate(sql_casts)) + ")"
+                for i in range(len(rows))
+            )
+            sql = f"UPDATE {table} SET {sql_columns} FROM (VALUES {sql_rows}) AS v({','.join(columns)}) WHERE {table}.{clause.key} = v.{clause.key};"  # noqa: S608
+            await self.execute(sql, *[value for row in rows for value in row])
+
     async def count(
         self,
         table: str,
         where: list[WhereClause] | None = None,
     ) -> int:
-        sql_where, values = _get_where_sql_with_values(where)
+        sql_where, values = _get_where_sql_with_values(where, types=self._get_column_types(table))
         sql = f"SELECT COUNT(*) FROM {table}{sql_where};"  # noqa: S608
         return await self.fetchval(sql, *values)
 
@@ -300,6 +542,6 @@ class ORMPostgresBackend(ORMBackend):
         table: str,
         where: list[WhereClause] | None = None,
     ) -> bool:
-        sql_where, values = _get_where_sql_with_values(where)
+        sql_where, values = _get_where_sql_with_values(where, types=self._get_column_types(table))
         sql = f"SELECT EXISTS(SELECT 1 FROM {table}{sql_where});"  # noqa: S608
         return await self.fetchval(sql, *values)
@@ -0,0 +1,187 @@
+import logging
+import typing as tp
+from collections.abc import Iterable
+
+from pydantic import BaseModel
+
+from yara.adapters.orm.backends.schemas import (
+    ColumnClause,
+    EColumnType,
+    EIndexMethod,
+    EOperator,
+    IndexClause,
+    UniqueConstraintClause,
+    WhereClause,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TableSchema(BaseModel):
+    name: str
+    columns: dict[str, ColumnClause] = {}
+    unique_constraints: list[UniqueConstraintClause] = []
+    indexes: list[IndexClause] = []
+
+    @property
+    def primary_key(self) -> list[str]:
+        return [column.name for column in self.columns.values() if column.primary_key]
+
+    def get_unique_keys(self) -> list[list[str]]:
+        unique_keys = []
+        if self.primary_key:
+            unique_keys.append(self.primary_key)
+        unique_keys.extend([[column.name] for column in self.columns.values() if column.unique])
+        unique_keys.extend([constraint.columns for constraint in self.unique_constraints])
+        unique_keys.extend([index.columns for index in self.indexes if index.unique])
+        return unique_keys
+
+    def get_required_columns(self) -> set[str]:
+        # NOT NULL columns without a database default
+        return {
+            column.name
+            for column in self.columns.values()
+            if not column.nullable
+            and not column.auto_now
+            and not column.auto_now_add
+            and not (
+                column.primary_key
+                and column.type
+                in (EColumnType.UUID, EColumnType.SERIAL, EColumnType.SMALLSERIAL, EColumnType.BIGSERIAL)
+            )
+        }
+
+    def get_indexed_columns(self) -> set[str]:
+        # Columns that can drive an index scan: the leading column of b-tree like indexes
+        # and every column of GIN/GiST/BRIN indexes.
+        indexed_columns = {unique_key[0] for unique_key in self.get_unique_keys()}
+        for index in self.indexes:
+            if index.method in (EIndexMethod.GIN, EIndexMethod.GIST, EIndexMethod.BRIN):
+                indexed_columns.update(index.columns)
+            else:
+                indexed_columns.add(index.columns[0])
+        return indexed_columns
+
+
+class ORMRegistry:
+    """
+    Schema registry built by replaying migrations.
+    Implements the DDL part of the ORMBackend interface and records tables instead of executing SQL.
+    """
+
+    migrations_table: str
+    tables: dict[str, TableSchema]
+
+    def __init__(self, migrations_table: str) -> None:
+        self.migrations_table = migrations_table
+        self.tables = {}
+
+    def get_table(self, table: str) -> TableSchema | None:
+        return self.tables.get(table)
+
+    def get_unique_key(self, table: str, columns: Iterable[str]) -> list[str] | None:
+        """
+        Get the shortest unique key fully covered by the columns.
+        """
+        table_schema = self.get_table(table)
+        if not table_schema:
+            return None
+        columns = set(columns)
+        unique_keys = [unique_key for unique_key in table_schema.get_unique_keys() if set(unique_key) <= columns]
+        if not unique_keys:
+            return None
+        return min(unique_keys, key=len)
+
+    def can_insert(self, table: str, columns: Iterable[str]) -> bool:
+        table_schema = self.get_table(table)
+        if not table_schema:
+            return False
+        return table_schema.get_required_columns() <= set(columns)
+
+    def get_unindexed_columns(self, table: str, columns: Iterable[str]) -> list[str]:
+        table_schema = self.get_table(table)
+        if not table_schema:
+            return []
+        indexed_columns = table_schema.get_indexed_columns()
+        return sorted({column for column in columns if column not in indexed_columns})
+
+    async def create_table(
+        self,
+        table: str,
+        columns: list[ColumnClause],
+        unique_constraints: list[UniqueConstraintClause] | None = None,
+        indexes: list[IndexClause] | None = None,
+    ) -> None:
+        self.tables[table] = TableSchema(
+            name=table,
+            columns={column.name: column for column in columns},
+            unique_constraints=unique_constraints or [],
+            indexes=indexes or [],
+        )
+
+    async def drop_table(
+        self,
+        table: str,
+    ) -> None:
+        self.tables.pop(table, None)
+
+    async def alter_field(
+        self,
+        table: str,
+        column: ColumnClause,
+    ) -> None:
+        table_schema = self.get_table(table)
+        if table_schema:
+            table_schema.columns[column.name] = column
+
+    async def create_index(
+        self,
+        table: str,
+        index: IndexClause,
+    ) -> None:
+        table_schema = self.get_table(table)
+        if table_schema:
+            table_schema.indexes.append(index)
+
+    async def drop_index(
+        self,
+        table: str,
+        index: IndexClause,
+    ) -> None:
+        table_schema = self.get_table(table)
+        if table_schema:
+            # matched by name like DROP INDEX, other indexes on the same columns stay
+            name = get_index_name(table, index)
+            table_schema.indexes = [i for i in table_schema.indexes if get_index_name(table, i) != name]
+
+    async def execute(self, sql: str, *args: tp.Any, **kwargs: tp.Any) -> tp.Any:
+        # Raw SQL in migrations is not tracked
+        return None
+
+    async def fetch(self, sql: str, *args: tp.Any, **kwargs: tp.Any) -> tp.Any:
+        return []
+
+    async def fetchval(self, sql: str, *args: tp.Any, **kwargs: tp.Any) -> tp.Any:
+        return None
+
+
+def get_index_name(table: str, index: IndexClause) -> str:
+    return index.name or f"{table}_{'_'.join(index.columns)}_idx"
+
+
+def get_eq_columns(where: list[WhereClause] | None) -> dict[str, tp.Any]:
+    """
+    Get columns that are pinned to a single value by the where clauses.
+    """
+    eq_columns: dict[str, tp.Any] = {}
+    for clause in where or []:
+        if clause.conjunction == "OR" and len(clause.terms) > 1:
+            continue
+        for term in clause.terms:
+            if term.operator == EOperator.EQ and term.value is not None:
+                eq_columns[term.column] = term.value
+    return eq_columns
+
+
+def get_where_columns(where: list[WhereClause] | None) -> list[str]:
+    return [term.column for clause in where or [] for term in clause.terms]
@@ -34,6 +34,15 @@ class EOperator(enum.StrEnum):
     IN = "IN"
     IS = "IS"
     IS_NOT = "IS NOT"
+    # JSONB / ARRAY
+    CONTAINS = "@>"
+    CONTAINED_BY = "<@"
+    HAS_KEY = "?"
+    HAS_ANY_KEYS = "?|"
+    HAS_ALL_KEYS = "?&"
+    OVERLAP = "&&"
+    PATH_EXISTS = "@?"
+    PATH_MATCH = "@@"
 
 
 class EAction(enum.StrEnum):
@@ -43,10 +52,27 @@ class EAction(enum.StrEnum):
     NO_ACTION = "NO ACTION"
 
 
+class EIndexMethod(enum.StrEnum):
+    BTREE = "BTREE"
+    HASH = "HASH"
+    GIN = "GIN"
+    GIST = "GIST"
+    BRIN = "BRIN"
+
+
 class UniqueConstraintClause(BaseModel):
     columns: list[str]
 
 
+class IndexClause(BaseModel):
+    columns: list[str]
+    method: EIndexMethod = EIndexMethod.BTREE
+    unique: bool = False
+    # e.g. jsonb_path_ops for GIN indexes serving only @>, @? and @@
+    opclass: str | None = None
+    name: str | None = None
+
+
 class FkConstraintClause(BaseModel):
     table: str
     column: str
@@ -115,12 +141,16 @@ class SelectClause(BaseModel):
 
 class DeleteClause(BaseModel):
     where: list[WhereClause] | None = None
+    returning: list[str] | None = None
 
 
 class InsertClause(BaseModel):
     columns: list[str]
     values: list[tp.Any]
     returning: list[str] | None = None
+    # ON CONFLICT (on_conflict) DO UPDATE SET on_conflict_update, DO NOTHING if on_conflict_update is empty
+    on_conflict: list[str] | None = None
+    on_conflict_update: list[str] | None = None
 
 
 class UpdateClause(BaseModel):
@@ -130,37 +160,61 @@ class UpdateClause(BaseModel):
     returning: list[str] | None = None
 
 
+class InsertManyClause(BaseModel):
+    columns: list[str]
+    rows: list[list[tp.Any]]
+    # skip rows conflicting on these columns
+    on_conflict: list[str] | None = None
+
+
+class UpdateManyClause(BaseModel):
+    # UPDATE ... FROM (VALUES ...) matching rows by key, each row is [key value, *column values]
+    key: str
+    columns: list[str]
+    rows: list[list[tp.Any]]
+    # add values to the current ones instead of setting them
+    increment: bool = False
+    # column types to cast the values to, values are sent untyped otherwise
+    types: dict[str, EColumnType] = {}
+
+
+WHERE_OPERATORS: tuple[tuple[str, EOperator], ...] = (
+    ("__is_not", EOperator.IS_NOT),
+    ("__not", EOperator.NOT_EQ),
+    ("__in", EOperator.IN),
+    ("__gt", EOperator.GT),
+    ("__lt", EOperator.LT),
+    ("__gte", EOperator.GTE),
+    ("__lte", EOperator.LTE),
+    ("__like", EOperator.LIKE),
+    ("__is", EOperator.IS),
+    ("__contains", EOperator.CONTAINS),
+    ("__contained_by", EOperator.CONTAINED_BY),
+    ("__has_key", EOperator.HAS_KEY),
+    ("__has_any_keys", EOperator.HAS_ANY_KEYS),
+    ("__has_all_keys", EOperator.HAS_ALL_KEYS),
+    ("__overlap", EOperator.OVERLAP),
+    ("__path_exists", EOperator.PATH_EXISTS),
+    ("__path_match", EOperator.PATH_MATCH),
+)
+
+
+class BulkProgress(BaseModel):
+    # pass last_key as start_after to resume
+    last_key: tp.Any = None
+    affected: int = 0
+    chunks: int = 0
+
+
 def where_clause(**kwargs: tp.Any) -> list[WhereClause]:
     terms = []
     for k, v in kwargs.items():
         operator = EOperator.EQ
-        if k.endswith("__not"):
-            operator = EOperator.NOT_EQ
-            k = k.replace("__not", "")
-        elif k.endswith("__in"):
-            operator = EOperator.IN
-            k = k.replace("__in", "")
-        elif k.endswith("__gt"):
-            operator = EOperator.GT
-            k = k.replace("__gt", "")
-        elif k.endswith("__lt"):
-            operator = EOperator.LT
-            k = k.replace("__lt", "")
-        elif k.endswith("__gte"):
-            operator = EOperator.GTE
-            k = k.replace("__gte", "")
-        elif k.endswith("__lte"):
-            operator = EOperator.LTE
-            k = k.replace("__lte", "")
-        elif k.endswith("__like"):
-            operator = EOperator.LIKE
-            k = k.replace("__like", "")
-        elif k.endswith("__is"):
-            operator = EOperator.IS
-            k = k.replace("__is", "")
-        elif k.endswith("__is_not"):
-            operator = EOperator.IS_NOT
-            k = k.replace("__is_not", "")
+        for suffix, suffix_operator in WHERE_OPERATORS:
+            if k.endswith(suffix):
+                operator = suffix_operator
+                k = k.removesuffix(suffix)
+                break
         terms.append(
             WhereTermClause(
                 column=k,
@@ -0,0 +1,436 @@
+import asyncio
+import hashlib
+import logging
+import typing as tp
+import uuid
+from collections import defaultdict
+from collections.abc import AsyncGenerator
+from contextlib import AsyncExitStack, asynccontextmanager, suppress
+
+from yara.adapters.orm.backends.base import ORMBackend
+from yara.adapters.orm.backends.registry import get_eq_columns
+from yara.adapters.orm.backends.schemas import (
+    ColumnClause,
+    DeleteClause,
+    EColumnType,
+    EOperator,
+    IndexClause,
+    InsertClause,
+    InsertManyClause,
+    OrderClause,
+    PaginationClause,
+    SelectClause,
+    UniqueConstraintClause,
+    UpdateClause,
+    UpdateManyClause,
+    WhereClause,
+    WhereTermClause,
+)
+from yara.core.helpers import import_obj
+from yara.settings import YaraSettings
+
+logger = logging.getLogger(__name__)
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping, Veach). Only 1/n of the keys move when a bucket is added.
+    """
+    bucket, j = -1, 0
+    while j < buckets:
+        bucket = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return bucket
+
+
+def _sort_key(value: tp.Any) -> tuple[bool, tp.Any]:
+    # NULLS LAST for ascending order like Postgres
+    return value is None, 0 if value is None else value
+
+
+def _shard_key_value(value: tp.Any) -> str:
+    # Postgres compares UUIDs case-insensitively, route them by their canonical form
+    if isinstance(value, str) and len(value) == 36:
+        with suppress(ValueError):
+            return str(uuid.UUID(value))
+    return str(value)
+
+
+def _where_value(value: tp.Any) -> tp.Any:
+    # where clauses don't accept UUID values
+    return str(value) if isinstance(value, uuid.UUID) else value
+
+
+class ORMShardedBackend(ORMBackend):
+    """
+    Routes rows of each table to one of the YARA_ORM_SHARD_DSNS databases by the hash of its shard key
+    (YARA_ORM_SHARD_KEYS). Tables without a shard key live on the first shard.
+    Queries pinning the shard key go to their shard, others fan out to all shards and their results are merged.
+    Transactions spanning multiple shards are not atomic.
+    """
+
+    shards: list[ORMBackend]
+    shard_keys: dict[str, str]
+
+    def __init__(
+        self,
+        settings: YaraSettings,
+        dsn: str | None = None,
+    ) -> None:
+        super().__init__(settings, dsn=dsn)
+        if not settings.YARA_ORM_SHARD_DSNS:
+            raise ValueError("Provide YARA_ORM_SHARD_DSNS setting")
+        backend_cls: type[ORMBackend] | None = import_obj(settings.YARA_ORM_SHARD_BACKEND)
+        if not backend_cls:
+            raise ValueError(f"Backend {settings.YARA_ORM_SHARD_BACKEND} not found")
+        self.shards = [backend_cls(settings, dsn=shard_dsn) for shard_dsn in settings.YARA_ORM_SHARD_DSNS]
+        self.shard_keys = settings.YARA_ORM_SHARD_KEYS
+
+    def get_shard_index(self, value: tp.Any) -> int:
+        key = int.from_bytes(hashlib.blake2b(_shard_key_value(value).encode(), digest_size=8).digest(), "big")
+        return jump_hash(key, len(self.shards))
+
+    def get_shard(self, value: tp.Any) -> ORMBackend:
+        return self.shards[self.get_shard_index(value)]
+
+    def _get_shards(self, table: str, where: list[WhereClause] | None = None) -> list[ORMBackend]:
+        shard_key = self.shard_keys.get(table)
+        if not shard_key:
+            return self.shards[:1]
+        eq_columns = get_eq_columns(where)
+        if shard_key in eq_columns:
+            return [self.get_shard(eq_columns[shard_key])]
+        for clause in where or []:
+            if clause.conjunction == "OR" and len(clause.terms) > 1:
+                continue
+            for term in clause.terms:
+                if term.column == shard_key and term.operator == EOperator.IN:
+                    indexes = sorted({self.get_shard_index(value) for value in term.value})
+                    return [self.shards[index] for index in indexes]
+        return self.shards
+
+    async def up(self) -> None:
+        await asyncio.gather(*(shard.up() for shard in self.shards))
+
+    async def load_registry(self) -> None:
+        await super().load_registry()
+        # shards compile column casts from the registry
+        for shard in self.shards:
+            shard.registry = self.registry
+
+    async def healthcheck(self) -> bool:
+        return all(await asyncio.gather(*(shard.healthcheck() for shard in self.shards)))
+
+    async def shutdown(self) -> None:
+        await asyncio.gather(*(shard.shutdown() for shard in self.shards))
+
+    @asynccontextmanager
+    async def uow(self) -> AsyncGenerator[None, None]:
+        async with AsyncExitStack() as stack:
+            for shard in self.shards:
+                await stack.enter_async_context(shard.uow())
+            yield
+
+    @asynccontextmanager
+    async def pin(self) -> AsyncGenerator[None, None]:
+        async with AsyncExitStack() as stack:
+            for shard in self.shards:
+                await stack.enter_async_context(shard.pin())
+            yield
+
+    async def execute(self, sql: str, *args: tp.Any, **kwargs: tp.Any) -> tp.Any:
+        # raw SQL can't be routed, it goes to the shard of unsharded tables
+        return await self.shards[0].execute(sql, *args, **kwargs)
+
+    async def fetch(self, sql: str, *args: tp.Any, **kwargs: tp.Any) -> tp.Any:
+        return await self.shards[0].fetch(sql, *args, **kwargs)
+
+    async def fetchval(self, sql: str, *args: tp.Any, **kwargs: tp.Any) -> tp.Any:
+        return await self.shards[0].fetchval(sql, *args, **kwargs)
+
+    async def create_table(
+        self,
+        table: str,
+        columns: list[ColumnClause],
+        unique_constraints: list[UniqueConstraintClause] | None = None,
+        indexes: list[IndexClause] | None = None,
+    ) -> None:
+        for shard in self.shards:
+            await shard.create_table(table, columns, unique_constraints=unique_constraints, indexes=indexes)
+
+    async def drop_table(
+        self,
+        table: str,
+    ) -> None:
+        for shard in self.shards:
+            await shard.drop_table(table)
+
+    async def create_index(
+        self,
+        table: str,
+        index: IndexClause,
+    ) -> None:
+        for shard in self.shards:
+            await shard.create_index(table, index)
+
+    async def drop_index(
+        self,
+        table: str,
+        index: IndexClause,
+    ) -> None:
+        for shard in self.shards:
+            await shard.drop_index(table, index)
+
+    async def alter_field(
+        self,
+        table: str,
+        column: ColumnClause,
+    ) -> None:
+        for shard in self.shards:
+            await shard.alter_field(table, column)
+
+    async def select(
+        self,
+        table: str,
+        clause: SelectClause,
+    ) -> list[dict[str, tp.Any]]:
+        shards = self._get_shards(table, clause.where)
+        if len(shards) == 1:
+            return await shards[0].select(table, clause)
+
+        # every shard returns its first offset + limit rows, the page is cut after the merge
+        shard_clause = clause.model_copy()
+        extra_columns: list[str] = []
+        if clause.columns and clause.order_by:
+            extra_columns = [order.column for order in clause.order_by if order.column not in clause.columns]
+            shard_clause.columns = clause.columns + extra_columns
+        if clause.pagination:
+            shard_clause.pagination = PaginationClause(
+                offset=0, limit=clause.pagination.offset + clause.pagination.limit
+            )
+        shards_rows = await asyncio.gather(*(shard.select(table, shard_clause) for shard in shards))
+        rows = [row for shard_rows in shards_rows for row in shard_rows]
+
+        for order in reversed(clause.order_by or []):
+            rows.sort(key=lambda row, column=order.column: _sort_key(row[column]), reverse=order.desc)  # type: ignore [misc]
+        for row in rows:
+            for column in extra_columns:
+                row.pop(column)
+        if clause.distinct:
+            unique_rows: dict[tuple[tp.Any, ...], dict[str, tp.Any]] = {}
+            for row in rows:
+                unique_rows.setdefault(tuple(row.items()), row)
+            rows = list(unique_rows.values())
+        if clause.pagination:
+            rows = rows[clause.pagination.offset : clause.pagination.offset + clause.pagination.limit]
+        return rows
+
+    async def delete(
+        self,
+        table: str,
+        clause: DeleteClause,
+    ) -> list[dict[str, tp.Any]]:
+        shards = self._get_shards(table, clause.where)
+        shards_rows = await asyncio.gather(*(shard.delete(table, clause) for shard in shards))
+        return [row for shard_rows in shards_rows for row in shard_rows]
+
+    async def insert(
+        self,
+        table: str,
+        clause: InsertClause,
+    ) -> list[dict[str, tp.Any]]:
+        shard_key = self.shard_keys.get(table)
+        if not shard_key:
+            return await self.shards[0].insert(table, clause)
+        if shard_key not in clause.columns:
+            clause = clause.model_copy()
+            clause.columns = [*clause.columns, shard_key]
+            clause.values = [*clause.values, self._generate_shard_key(table, shard_key)]
+        return await self.get_shard(clause.values[clause.columns.index(shard_key)]).insert(table, clause)
+
+    def _generate_shard_key(self, table: str, shard_key: str) -> tp.Any:
+        # the row has to be routed before the database can generate its key
+        table_schema = self.registry.get_table(table)
+        if (
+            table_schema
+            and shard_key in table_schema.columns
+            and table_schema.columns[shard_key].type == EColumnType.UUID
+        ):
+            return uuid.uuid4()
+        raise ValueError(f"Provide shard key {shard_key} to insert into {table}")
+
+    def _check_shard_key_update(self, table: str, key_value: tp.Any, value: tp.Any) -> None:
+        # the row would stay on the shard of its old key, use a new row to move it
+        if key_value is None or self.get_shard_index(key_value) != self.get_shard_index(value):
+            raise ValueError(f"Shard key {self.shard_keys[table]} of {table} can't be changed by an update")
+
+    async def update(
+        self,
+        table: str,
+        clause: UpdateClause,
+    ) -> list[dict[str, tp.Any]]:
+        shard_key = self.shard_keys.get(table)
+        if shard_key and shard_key in clause.columns:
+            self._check_shard_key_update(
+                table, get_eq_columns(clause.where).get(shard_key), clause.values[clause.columns.index(shard_key)]
+            )
+        shards = self._get_shards(table, clause.where)
+        shards_rows = await asyncio.gather(*(shard.update(table, clause) for shard in shards))
+        return [row for shard_rows in shards_rows for row in shard_rows]
+
+    async def insert_many(
+        self,
+        table: str,
+        clause: InsertManyClause,
+    ) -> None:
+        shard_key = self.shard_keys.get(table)
+        if not shard_key:
+            await self.shards[0].insert_many(table, clause)
+            return
+        columns = clause.columns
+        rows = clause.rows
+        if shard_key not in columns:
+            columns = [*columns, shard_key]
+            rows = [[*row, self._generate_shard_key(table, shard_key)] for row in rows]
+        shard_key_index = columns.index(shard_key)
+        rows_by_shard: dict[int, list[list[tp.Any]]] = defaultdict(list)
+        for row in rows:
+            rows_by_shard[self.get_shard_index(row[shard_key_index])].append(row)
+        await asyncio.gather(
+            *(
+                self.shards[index].insert_many(
+                    table, InsertManyClause(columns=columns, rows=shard_rows, on_conflict=clause.on_conflict)
+                )
+                for index, shard_rows in rows_by_shard.items()
+            )
+        )
+
+    async def update_many(
+        self,
+        table: str,
+        clause: UpdateManyClause,
+    ) -> None:
+        shard_key = self.shard_keys.get(table)
+        if not shard_key:
+            await self.shards[0].update_many(table, clause)
+            return
+        if shard_key in clause.columns:
+            shard_key_index = clause.columns.index(shard_key) + 1
+            for row in clause.rows:
+                self._check_shard_key_update(table, row[0] if clause.key == shard_key else None, row[shard_key_index])
+        if clause.key != shard_key:
+            await asyncio.gather(*(shard.update_many(table, clause) for shard in self.shards))
+            return
+        rows_by_shard: dict[int, list[list[tp.Any]]] = defaultdict(list)
+        for row in clause.rows:
+            rows_by_shard[self.get_shard_index(row[0])].append(row)
+        await asyncio.gather(
+            *(
+                self.shards[index].update_many(table, clause.model_copy(update={"rows": shard_rows}))
+                for index, shard_rows in rows_by_shard.items()
+            )
+        )
+
+    async def count(
+        self,
+        table: str,
+        where: list[WhereClause] | None = None,
+    ) -> int:
+        shards = self._get_shards(table, where)
+        return sum(await asyncio.gather(*(shard.count(table, where=where) for shard in shards)))
+
+    async def exists(
+        self,
+        table: str,
+        where: list[WhereClause] | None = None,
+    ) -> bool:
+        shards = self._get_shards(table, where)
+        return any(await asyncio.gather(*(shard.exists(table, where=where) for shard in shards)))
+
+    async def _move_rows(
+        self,
+        source: ORMBackend,
+        table: str,
+        shard_key: str,
+        chunk_size: int,
+        delete: bool,
+        source_index: int | None = None,
+    ) -> int:
+        table_schema = self.registry.get_table(table)
+        primary_key = table_schema.primary_key[0] if table_schema and len(table_schema.primary_key) == 1 else "id"
+        moved = 0
+        last_key = None
+        while True:
+            where = None
+            if last_key is not None:
+                where = [
+                    WhereClause(terms=[WhereTermClause(column=primary_key, operator=EOperator.GT, value=last_key)])
+                ]
+            rows = await source.select(
+                table,
+                SelectClause(
+                    where=where,
+                    order_by=[OrderClause(column=primary_key)],
+                    pagination=PaginationClause(limit=chunk_size),
+                ),
+            )
+            if not rows:
+                return moved
+            last_key = _where_value(rows[-1][primary_key])
+            rows_by_shard: dict[int, list[dict[str, tp.Any]]] = defaultdict(list)
+            for row in rows:
+                index = self.get_shard_index(row[shard_key])
+                if index != source_index:
+                    rows_by_shard[index].append(row)
+            for index, shard_rows in rows_by_shard.items():
+                # rows already copied by an interrupted run are skipped
+                await self.shards[index].insert_many(
+                    table,
+                    InsertManyClause(
+                        columns=list(shard_rows[0].keys()),
+                        rows=[list(row.values()) for row in shard_rows],
+                        on_conflict=[primary_key],
+                    ),
+                )
+                if delete:
+                    keys = [_where_value(row[primary_key]) for row in shard_rows]
+                    await source.delete(
+                        table,
+                        DeleteClause(
+                            where=[
+                                WhereClause(
+                                    terms=[WhereTermClause(column=primary_key, operator=EOperator.IN, value=keys)]
+                                )
+                            ]
+                        ),
+                    )
+                moved += len(shard_rows)
+            if len(rows) < chunk_size:
+                return moved
+
+    async def rebalance(self, chunk_size: int = 1000) -> int:
+        """
+        Move rows to the shard their shard key belongs to, e.g. after a shard has been added.
+        Rows are copied and then deleted from the source shard without a lock, writes to sharded tables have to be
+        stopped until it is done: a row changed between the copy and the delete is lost.
+        """
+        moved = 0
+        for table, shard_key in self.shard_keys.items():
+            for source_index, shard in enumerate(self.shards):
+                table_moved = await self._move_rows(shard, table, shard_key, chunk_size, True, source_index)
+                logger.info("%s rows of %s moved from shard %s", table_moved, table, source_index)
+                moved += table_moved
+        return moved
+
+    async def backfill(self, source: ORMBackend, chunk_size: int = 1000) -> int:
+        """
+        Copy rows of sharded tables from a source database (e.g. the former single primary) to their shards.
+        Existing rows are skipped, not updated: writes to the source have to be stopped before the last run.
+        """
+        copied = 0
+        for table, shard_key in self.shard_keys.items():
+            table_copied = await self._move_rows(source, table, shard_key, chunk_size, False)
+            logger.info("%s rows of %s copied", table_copied, table)
+            copied += table_copied
+        return copied
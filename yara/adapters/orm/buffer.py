@@ -0,0 +1,162 @@
+import asyncio
+import contextvars
+import logging
+import typing as tp
+from collections import defaultdict
+
+from yara.adapters.orm.backends.base import ORMBackend
+from yara.adapters.orm.backends.schemas import InsertManyClause, UpdateManyClause
+
+logger = logging.getLogger(__name__)
+
+
+class ORMWriteBuffer:
+    """
+    Write-behind buffer for writes that don't need to be synchronous (audit events, last seen timestamps, counters).
+    Rows are accumulated in memory and flushed with bulk statements by size or by time.
+    Updates of the same row are coalesced: set values are merged (the latest wins) and increments are summed.
+    When flushes fall behind and max_pending rows are buffered, new rows are dropped and counted.
+    Flushes run outside the context of the caller, so they don't join its unit of work, pinned connection or deadline.
+    """
+
+    backend: ORMBackend
+    max_size: int
+    flush_interval: float
+    max_pending: int
+    dropped: int
+
+    inserts: dict[tuple[str, tuple[str, ...]], list[list[tp.Any]]]
+    updates: dict[tuple[str, str], dict[tp.Any, dict[str, tp.Any]]]
+    increments: dict[tuple[str, str], dict[tp.Any, dict[str, int | float]]]
+    size: int
+
+    def __init__(self, backend: ORMBackend, max_size: int, flush_interval: float, max_pending: int) -> None:
+        self.backend = backend
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.dropped = 0
+        self._dropping = False
+        self.inserts = defaultdict(list)
+        self.updates = defaultdict(dict)
+        self.increments = defaultdict(dict)
+        self.size = 0
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task[None] | None = None
+        self._stopping = asyncio.Event()
+        self._size_flush_tasks: set[asyncio.Task[None]] = set()
+
+    def insert(self, table: str, payload: dict[str, tp.Any]) -> None:
+        if self._is_full():
+            return
+        self.inserts[(table, tuple(payload.keys()))].append(list(payload.values()))
+        self.size += 1
+        self._flush_if_full()
+
+    def update(self, table: str, key: str, key_value: tp.Any, payload: dict[str, tp.Any]) -> None:
+        rows = self.updates[(table, key)]
+        if key_value not in rows and self._is_full():
+            return
+        row = rows.setdefault(key_value, {})
+        if not row:
+            self.size += 1
+        row.update(payload)
+        self._flush_if_full()
+
+    def increment(self, table: str, key: str, key_value: tp.Any, payload: dict[str, int | float]) -> None:
+        rows = self.increments[(table, key)]
+        if key_value not in rows and self._is_full():
+            return
+        row = rows.setdefault(key_value, {})
+        if not row:
+            self.size += 1
+        for column, amount in payload.items():
+            row[column] = row.get(column, 0) + amount
+        self._flush_if_full()
+
+    def _is_full(self) -> bool:
+        # updates of rows already buffered are still merged
+        if self.size < self.max_pending:
+            return False
+        if not self._dropping:
+            self._dropping = True
+            logger.warning("Write buffer is full with %s rows, new rows are dropped", self.size)
+        self.dropped += 1
+        return True
+
+    def _flush_if_full(self) -> None:
+        if self.size >= self.max_size and not self._size_flush_tasks:
+            # a fresh context: the caller may be inside uow(), pin() or deadline()
+            task = asyncio.create_task(self.flush(), context=contextvars.Context())
+            self._size_flush_tasks.add(task)
+            task.add_done_callback(self._size_flush_tasks.discard)
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self.size:
+                return
+            inserts, self.inserts = self.inserts, defaultdict(list)
+            updates, self.updates = self.updates, defaultdict(dict)
+            increments, self.increments = self.increments, defaultdict(dict)
+            self.size = 0
+            self._dropping = False
+
+            for (table, columns), rows in inserts.items():
+                try:
+                    await self.backend.insert_many(table, InsertManyClause(columns=list(columns), rows=rows))
+                except Exception:
+                    logger.exception("Failed to flush %s buffered inserts into %s", len(rows), table)
+            for increment, buffered_rows in ((False, updates), (True, increments)):
+                for (table, key), rows_by_key in buffered_rows.items():
+                    await self._flush_updates(table, key, rows_by_key, increment)
+
+    async def _flush_updates(
+        self,
+        table: str,
+        key: str,
+        rows_by_key: dict[tp.Any, dict[str, tp.Any]],
+        increment: bool,
+    ) -> None:
+        # UPDATE ... FROM (VALUES ...) needs the same columns in every row
+        rows_by_columns: dict[tuple[str, ...], list[list[tp.Any]]] = defaultdict(list)
+        for key_value, row in rows_by_key.items():
+            columns = tuple(sorted(row))
+            rows_by_columns[columns].append([key_value, *[row[column] for column in columns]])
+        table_schema = self.backend.registry.get_table(table)
+        types = {name: column.type for name, column in table_schema.columns.items()} if table_schema else {}
+        for columns, rows in rows_by_columns.items():
+            try:
+                await self.backend.update_many(
+                    table,
+                    UpdateManyClause(
+                        key=key,
+                        columns=list(columns),
+                        rows=rows,
+                        increment=increment,
+                        types={column: types[column] for column in (key, *columns) if column in types},
+                    ),
+                )
+            except Exception:
+                logger.exception("Failed to flush %s buffered updates into %s", len(rows), table)
+
+    async def _run(self) -> None:
+        # not cancelled on stop: a cancelled flush would lose the rows it already took out of the buffer
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except TimeoutError:
+                await self.flush()
+
+    async def start(self) -> None:
+        if self._flush_task is None:
+            self._stopping.clear()
+            self._flush_task = asyncio.create_task(self._run(), context=contextvars.Context())
+
+    async def stop(self) -> None:
+        if self._flush_task is not None:
+            self._stopping.set()
+            await self._flush_task
+            self._flush_task = None
+        if self._size_flush_tasks:
+            await asyncio.gather(*self._size_flush_tasks)
+        await self.flush()
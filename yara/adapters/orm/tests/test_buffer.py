@@ -0,0 +1,146 @@
+import asyncio
+import typing as tp
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from yara.adapters.orm.backends.base import ORMBackend
+from yara.adapters.orm.backends.deadline import deadline, orm_deadline
+from yara.adapters.orm.backends.registry import ORMRegistry
+from yara.adapters.orm.backends.schemas import ColumnClause, EColumnType, InsertManyClause, UpdateManyClause
+from yara.adapters.orm.buffer import ORMWriteBuffer
+
+
+class FakeBackend:
+    def __init__(self) -> None:
+        self.registry = ORMRegistry("migrations")
+        self.inserts: list[tuple[str, InsertManyClause]] = []
+        self.updates: list[tuple[str, UpdateManyClause]] = []
+        self.release = asyncio.Event()
+        self.release.set()
+        self.flushing = asyncio.Event()
+        self.transaction: ContextVar[str | None] = ContextVar("transaction", default=None)
+        # transaction and deadline of every insert_many call
+        self.contexts: list[tuple[str | None, float | None]] = []
+
+    @asynccontextmanager
+    async def uow(self) -> AsyncGenerator[None, None]:
+        token = self.transaction.set("uow")
+        try:
+            yield
+        finally:
+            self.transaction.reset(token)
+
+    async def insert_many(self, table: str, clause: InsertManyClause) -> None:
+        self.flushing.set()
+        self.contexts.append((self.transaction.get(), orm_deadline.get()))
+        await self.release.wait()
+        self.inserts.append((table, clause))
+
+    async def update_many(self, table: str, clause: UpdateManyClause) -> None:
+        await self.release.wait()
+        self.updates.append((table, clause))
+
+
+def get_buffer(
+    max_size: int = 100,
+    flush_interval: float = 60,
+    max_pending: int = 1000,
+) -> tuple[ORMWriteBuffer, FakeBackend]:
+    backend = FakeBackend()
+    return ORMWriteBuffer(tp.cast(ORMBackend, backend), max_size, flush_interval, max_pending), backend
+
+
+async def test_merge_updates_and_increments() -> None:
+    buffer, backend = get_buffer()
+    await backend.registry.create_table(
+        "user",
+        [
+            ColumnClause(name="id", type=EColumnType.INT, primary_key=True),
+            ColumnClause(name="seen", type=EColumnType.STR),
+            ColumnClause(name="visits", type=EColumnType.INT),
+        ],
+    )
+    buffer.update("user", "id", 1, {"seen": "a"})
+    buffer.update("user", "id", 1, {"seen": "b"})
+    buffer.update("user", "id", 2, {"seen": "c"})
+    buffer.increment("user", "id", 1, {"visits": 1})
+    buffer.increment("user", "id", 1, {"visits": 2})
+    assert buffer.size == 3
+    await buffer.flush()
+    assert buffer.size == 0
+    assert [(table, clause.model_dump()) for table, clause in backend.updates] == [
+        (
+            "user",
+            {
+                "key": "id",
+                "columns": ["seen"],
+                "rows": [[1, "b"], [2, "c"]],
+                "increment": False,
+                "types": {"id": EColumnType.INT, "seen": EColumnType.STR},
+            },
+        ),
+        (
+            "user",
+            {
+                "key": "id",
+                "columns": ["visits"],
+                "rows": [[1, 3]],
+                "increment": True,
+                "types": {"id": EColumnType.INT, "visits": EColumnType.INT},
+            },
+        ),
+    ]
+
+
+async def test_flush_when_full() -> None:
+    buffer, backend = get_buffer(max_size=2)
+    buffer.insert("event", {"name": "a"})
+    await asyncio.sleep(0)
+    assert not backend.inserts
+    buffer.insert("event", {"name": "b"})
+    await buffer.stop()
+    assert [clause.rows for _, clause in backend.inserts] == [[["a"], ["b"]]]
+
+
+async def test_stop_during_flush() -> None:
+    buffer, backend = get_buffer(flush_interval=0.01)
+    await buffer.start()
+    backend.release.clear()
+    buffer.insert("event", {"name": "a"})
+    await backend.flushing.wait()
+    # the periodic flush holds the rows taken out of the buffer
+    assert buffer.size == 0
+    buffer.insert("event", {"name": "b"})
+    stop = asyncio.create_task(buffer.stop())
+    await asyncio.sleep(0.05)
+    assert not stop.done()
+    backend.release.set()
+    await stop
+    assert [clause.rows for _, clause in backend.inserts] == [[["a"]], [["b"]]]
+
+
+async def test_flush_outside_caller_context() -> None:
+    buffer, backend = get_buffer(max_size=1)
+    async with backend.uow():
+        with deadline(0.01):
+            buffer.insert("event", {"name": "a"})
+    await buffer.stop()
+    assert backend.contexts == [(None, None)]
+    assert [clause.rows for _, clause in backend.inserts] == [[["a"]]]
+
+
+async def test_drop_rows_when_full() -> None:
+    buffer, backend = get_buffer(max_size=2, max_pending=3)
+    backend.release.clear()
+    buffer.insert("event", {"name": "a"})
+    buffer.insert("event", {"name": "b"})
+    await backend.flushing.wait()
+    for name in "cdef":
+        buffer.insert("event", {"name": name})
+    buffer.update("user", "id", 1, {"seen": "a"})
+    assert buffer.size == 3
+    assert buffer.dropped == 2
+    backend.release.set()
+    await buffer.stop()
+    assert [clause.rows for _, clause in backend.inserts] == [[["a"], ["b"]], [["c"], ["d"], ["e"]]]
@@ -0,0 +1,64 @@
+import pytest
+
+from yara.adapters.orm.backends.postgres import _get_where_sql_with_values
+from yara.adapters.orm.backends.schemas import EColumnType, EOperator, WhereClause, WhereTermClause, where_clause
+
+
+@pytest.mark.parametrize(
+    ("where", "sql", "value"),
+    [
+        ({"id__in": ["a", "b"]}, "id = ANY($1)", ["a", "b"]),
+        ({"meta__contains": {"a": 1}}, "meta @> $1::jsonb", '{"a":1}'),
+        ({"meta__contained_by": {"a": 1}}, "meta <@ $1::jsonb", '{"a":1}'),
+        ({"tags__contains": ["a"]}, "tags @> $1::jsonb", '["a"]'),
+        ({"meta__has_key": "a"}, "meta ? $1", "a"),
+        ({"meta__has_any_keys": ["a", "b"]}, "meta ?| $1::text[]", ["a", "b"]),
+        ({"meta__has_all_keys": ["a", "b"]}, "meta ?& $1::text[]", ["a", "b"]),
+        ({"tags__overlap": ["a", "b"]}, "tags && $1", ["a", "b"]),
+        ({"meta__path_exists": "$.a"}, "meta @? $1::jsonpath", "$.a"),
+        ({"meta__path_match": "$.a == 1"}, "meta @@ $1::jsonpath", "$.a == 1"),
+    ],
+)
+def test_where_operators(where: dict[str, object], sql: str, value: object) -> None:
+    assert _get_where_sql_with_values(where_clause(**where)) == (f" WHERE ({sql})", [value])
+
+
+def test_where_array_columns() -> None:
+    types = {"tags": EColumnType.LIST, "meta": EColumnType.DICT}
+    assert _get_where_sql_with_values(where_clause(tags__contains=["a"]), types=types) == (
+        " WHERE (tags @> $1)",
+        [["a"]],
+    )
+    assert _get_where_sql_with_values(where_clause(meta__contains=["a"]), types=types) == (
+        " WHERE (meta @> $1::jsonb)",
+        ['["a"]'],
+    )
+
+
+def test_where_unknown_column_type(caplog: pytest.LogCaptureFixture) -> None:
+    assert _get_where_sql_with_values(where_clause(tags__contains=["a"]), types={}) == (
+        " WHERE (tags @> $1::jsonb)",
+        ['["a"]'],
+    )
+    assert "Type of column tags is not in the registry" in caplog.text
+    caplog.clear()
+    _get_where_sql_with_values(where_clause(meta__contains={"a": 1}), types={})
+    _get_where_sql_with_values(where_clause(meta__contains=["a"]), types={"meta": EColumnType.DICT})
+    assert not caplog.text
+
+
+def test_where_placeholders() -> None:
+    where = [
+        *where_clause(id=1, meta__contains={"a": 1}),
+        WhereClause(
+            conjunction="OR",
+            terms=[
+                WhereTermClause(column="name", operator=EOperator.EQ, value="a"),
+                WhereTermClause(column="name", operator=EOperator.IS, value=None),
+            ],
+        ),
+    ]
+    assert _get_where_sql_with_values(where, shift_index=2) == (
+        " WHERE (id = $3 AND meta @> $4::jsonb) AND (name = $5 OR name IS $6)",
+        [1, '{"a":1}', "a", None],
+    )
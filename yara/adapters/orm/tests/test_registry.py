@@ -0,0 +1,94 @@
+from yara.adapters.orm.backends.registry import ORMRegistry, get_eq_columns, get_where_columns
+from yara.adapters.orm.backends.schemas import (
+    ColumnClause,
+    EColumnType,
+    EIndexMethod,
+    EOperator,
+    IndexClause,
+    UniqueConstraintClause,
+    WhereClause,
+    WhereTermClause,
+    where_clause,
+)
+
+
+async def get_registry() -> ORMRegistry:
+    registry = ORMRegistry("migrations")
+    await registry.create_table(
+        "user",
+        [
+            ColumnClause(name="id", type=EColumnType.UUID, primary_key=True),
+            ColumnClause(name="created_at", type=EColumnType.DATETIME_TZ, auto_now_add=True),
+            ColumnClause(name="email", type=EColumnType.STR, unique=True),
+            ColumnClause(name="tenant", type=EColumnType.STR),
+            ColumnClause(name="name", type=EColumnType.STR),
+            ColumnClause(name="meta", type=EColumnType.DICT, nullable=True),
+        ],
+        unique_constraints=[UniqueConstraintClause(columns=["tenant", "name"])],
+    )
+    await registry.create_index("user", IndexClause(columns=["meta"], method=EIndexMethod.GIN))
+    return registry
+
+
+async def test_unique_keys() -> None:
+    registry = await get_registry()
+    assert registry.get_unique_key("user", ["id", "email"]) == ["id"]
+    assert registry.get_unique_key("user", ["tenant", "name", "meta"]) == ["tenant", "name"]
+    assert registry.get_unique_key("user", ["name"]) is None
+    assert registry.get_unique_key("unknown", ["id"]) is None
+
+
+async def test_required_columns() -> None:
+    registry = await get_registry()
+    table_schema = registry.get_table("user")
+    assert table_schema
+    # primary key, auto_now and nullable columns have defaults
+    assert table_schema.get_required_columns() == {"email", "tenant", "name"}
+    assert registry.can_insert("user", ["email", "tenant", "name"])
+    assert not registry.can_insert("user", ["email", "tenant"])
+    assert not registry.can_insert("unknown", ["id"])
+
+    await registry.alter_field("user", ColumnClause(name="name", type=EColumnType.STR, nullable=True))
+    assert registry.can_insert("user", ["email", "tenant"])
+
+
+async def test_unindexed_columns() -> None:
+    registry = await get_registry()
+    # only the leading column of a composite b-tree key drives an index scan
+    assert registry.get_unindexed_columns("user", ["id", "tenant", "name", "meta", "created_at"]) == [
+        "created_at",
+        "name",
+    ]
+    await registry.drop_index("user", IndexClause(columns=["meta"]))
+    assert registry.get_unindexed_columns("user", ["meta"]) == ["meta"]
+    await registry.drop_table("user")
+    assert registry.get_table("user") is None
+
+
+async def test_drop_index_by_name() -> None:
+    registry = await get_registry()
+    await registry.create_index("user", IndexClause(columns=["name"]))
+    await registry.create_index("user", IndexClause(columns=["name"], unique=True, name="user_name_key"))
+    await registry.drop_index("user", IndexClause(columns=["name"], name="user_name_key"))
+    table_schema = registry.get_table("user")
+    assert table_schema
+    assert [index.name for index in table_schema.indexes if index.columns == ["name"]] == [None]
+    await registry.drop_index("user", IndexClause(columns=["name"]))
+    assert registry.get_unindexed_columns("user", ["name"]) == ["name"]
+
+
+def test_eq_columns() -> None:
+    where = [
+        *where_clause(id=1, name__in=["a"], meta=None),
+        WhereClause(
+            conjunction="OR",
+            terms=[
+                WhereTermClause(column="tenant", operator=EOperator.EQ, value="a"),
+                WhereTermClause(column="tenant", operator=EOperator.EQ, value="b"),
+            ],
+        ),
+        WhereClause(conjunction="OR", terms=[WhereTermClause(column="email", operator=EOperator.EQ, value="e")]),
+    ]
+    assert get_eq_columns(where) == {"id": 1, "email": "e"}
+    assert get_eq_columns(None) == {}
+    assert get_where_columns(where) == ["id", "name", "meta", "tenant", "tenant", "email"]
@@ -0,0 +1,121 @@
+import typing as tp
+import uuid
+
+import pytest
+
+from yara.adapters.orm.backends.base import ORMBackend
+from yara.adapters.orm.backends.schemas import (
+    OrderClause,
+    PaginationClause,
+    SelectClause,
+    UpdateClause,
+    UpdateManyClause,
+    where_clause,
+)
+from yara.adapters.orm.backends.sharded import ORMShardedBackend, _sort_key, jump_hash
+from yara.settings import YaraSettings
+
+
+class FakeShard:
+    def __init__(self, rows: list[dict[str, tp.Any]]) -> None:
+        self.rows = rows
+        self.clauses: list[SelectClause] = []
+
+    async def select(self, table: str, clause: SelectClause) -> list[dict[str, tp.Any]]:
+        self.clauses.append(clause)
+        rows = self.rows
+        for order in reversed(clause.order_by or []):
+            rows = sorted(rows, key=lambda row, column=order.column: _sort_key(row[column]), reverse=order.desc)  # type: ignore [misc]
+        if clause.pagination:
+            rows = rows[clause.pagination.offset : clause.pagination.offset + clause.pagination.limit]
+        return [{column: row[column] for column in clause.columns or row} for row in rows]
+
+    async def update(self, table: str, clause: UpdateClause) -> list[dict[str, tp.Any]]:
+        return [dict(zip(clause.columns, clause.values, strict=True))]
+
+
+def get_backend(shards: int = 2) -> ORMShardedBackend:
+    return ORMShardedBackend(
+        YaraSettings.model_construct(
+            YARA_ORM_DSN="postgresql://localhost/yara",
+            YARA_ORM_SHARD_DSNS=[f"postgresql://localhost/shard_{i}" for i in range(shards)],
+            YARA_ORM_SHARD_KEYS={"item": "id"},
+        )
+    )
+
+
+@pytest.mark.parametrize(
+    ("key", "buckets", "bucket"),
+    [(1, 1, 0), (42, 57, 43), (0xDEAD10CC, 1, 0), (0xDEAD10CC, 666, 361), (256, 1024, 520)],
+)
+def test_jump_hash(key: int, buckets: int, bucket: int) -> None:
+    assert jump_hash(key, buckets) == bucket
+
+
+def test_jump_hash_moves_keys_to_new_bucket_only() -> None:
+    keys = range(10000)
+    moved = [key for key in keys if jump_hash(key, 10) != jump_hash(key, 11)]
+    assert all(jump_hash(key, 11) == 10 for key in moved)
+    assert 800 < len(moved) < 1000
+
+
+def test_shard_key_normalization() -> None:
+    backend = get_backend(shards=16)
+    value = uuid.uuid4()
+    indexes = {backend.get_shard_index(key) for key in (value, str(value), str(value).upper())}
+    assert len(indexes) == 1
+
+
+async def test_select_merge() -> None:
+    backend = get_backend()
+    shards = [
+        FakeShard([{"id": 1, "name": "b", "rank": 3}, {"id": 3, "name": "a", "rank": 1}]),
+        FakeShard([{"id": 2, "name": "a", "rank": 2}, {"id": 4, "name": None, "rank": 4}]),
+    ]
+    backend.shards = [tp.cast(ORMBackend, shard) for shard in shards]
+    rows = await backend.select(
+        "item",
+        SelectClause(
+            columns=["id"],
+            order_by=[OrderClause(column="name"), OrderClause(column="rank", desc=True)],
+            pagination=PaginationClause(offset=1, limit=2),
+        ),
+    )
+    # NULLS LAST, order columns are fetched from the shards and removed after the merge
+    assert rows == [{"id": 3}, {"id": 1}]
+    assert shards[0].clauses[0].columns == ["id", "name", "rank"]
+    assert shards[0].clauses[0].pagination == PaginationClause(offset=0, limit=3)
+
+    distinct_rows = await backend.select("item", SelectClause(columns=["name"], distinct=True))
+    assert sorted(distinct_rows, key=lambda row: str(row["name"])) == [{"name": None}, {"name": "a"}, {"name": "b"}]
+
+
+async def test_select_routing() -> None:
+    backend = get_backend()
+    shards = [FakeShard([]), FakeShard([])]
+    backend.shards = [tp.cast(ORMBackend, shard) for shard in shards]
+    await backend.select("item", SelectClause(where=where_clause(id=1)))
+    assert [len(shard.clauses) for shard in shards] == [
+        int(backend.get_shard_index(1) == 0),
+        int(backend.get_shard_index(1) == 1),
+    ]
+    await backend.select("other", SelectClause())
+    assert len(shards[0].clauses) == 1 + int(backend.get_shard_index(1) == 0)
+
+
+async def test_shard_key_update() -> None:
+    backend = get_backend()
+    backend.shards = [tp.cast(ORMBackend, FakeShard([])) for _ in backend.shards]
+    moved = next(value for value in range(100) if backend.get_shard_index(value) != backend.get_shard_index(1))
+    # setting the key a row is routed by is allowed
+    assert await backend.update(
+        "item", UpdateClause(columns=["id", "name"], values=[1, "a"], where=where_clause(id=1))
+    ) == [{"id": 1, "name": "a"}]
+    with pytest.raises(ValueError, match="Shard key id of item can't be changed"):
+        await backend.update("item", UpdateClause(columns=["id"], values=[moved], where=where_clause(id=1)))
+    with pytest.raises(ValueError, match="Shard key id of item can't be changed"):
+        await backend.update("item", UpdateClause(columns=["id"], values=[1], where=where_clause(name="a")))
+    with pytest.raises(ValueError, match="Shard key id of item can't be changed"):
+        await backend.update_many("item", UpdateManyClause(key="id", columns=["id"], rows=[[1, moved]]))
+    with pytest.raises(ValueError, match="Shard key id of item can't be changed"):
+        await backend.update_many("item", UpdateManyClause(key="name", columns=["id"], rows=[["a", 1]]))
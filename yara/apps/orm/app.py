@@ -1,9 +1,23 @@
 import typing as tp
 
-from yara.apps.orm.commands import downgrade, migrate
+from yara.apps.orm.commands import downgrade, migrate, rebalance_shards
+from yara.apps.orm.middlewares import ORMConnectionMiddleware, ORMDeadlineMiddleware
 from yara.core.apps import YaraApp
+from yara.core.middlewares import YaraMiddleware
+from yara.settings import YaraSettings
 
 
 class ORMApp(YaraApp):
+    def get_middlewares(self) -> list[tuple[type[YaraMiddleware], dict[str, tp.Any]]]:
+        settings: YaraSettings = self.root_app.settings
+        middlewares: list[tuple[type[YaraMiddleware], dict[str, tp.Any]]] = []
+        if settings.YARA_ORM_REQUEST_TIMEOUT:
+            middlewares.append(
+                (tp.cast(type[YaraMiddleware], ORMDeadlineMiddleware), {"timeout": settings.YARA_ORM_REQUEST_TIMEOUT})
+            )
+        if settings.YARA_ORM_PIN_CONNECTIONS:
+            middlewares.append((tp.cast(type[YaraMiddleware], ORMConnectionMiddleware), {}))
+        return middlewares
+
     def get_commands(self) -> list[tp.Any]:
-        return [downgrade, migrate]
+        return [downgrade, migrate, rebalance_shards]
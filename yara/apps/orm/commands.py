@@ -1,6 +1,7 @@
 import typing as tp
 
 from yara.adapters.orm.adapter import ORMAdapter
+from yara.adapters.orm.backends.sharded import ORMShardedBackend
 from yara.core.commands import Option, command, echo
 
 
@@ -16,3 +17,41 @@ async def downgrade(root_app=Option(None, hidden=True)) -> None:  # type: ignore
     orm_adapter: ORMAdapter[tp.Any] = root_app.get_adapter(ORMAdapter)
     await orm_adapter.backend.downgrade("yara__orm__migrations")
     echo("Database has been downgraded")
+
+
+@command
+async def rebalance_shards(  # type: ignore [no-untyped-def]
+    source_dsn: tp.Annotated[
+        str | None,
+        Option(
+            help="Copy sharded tables from this database instead of moving rows between shards",
+        ),
+    ] = None,
+    chunk_size: tp.Annotated[
+        int,
+        Option(
+            help="Rows per chunk",
+        ),
+    ] = 1000,
+    root_app=Option(None, hidden=True),
+) -> None:
+    """
+    Move rows of sharded tables to their shards. Stop writes to sharded tables while it runs.
+    """
+    orm_adapter: ORMAdapter[tp.Any] = root_app.get_adapter(ORMAdapter)
+    backend = orm_adapter.backend
+    if not isinstance(backend, ORMShardedBackend):
+        echo("YARA_ORM_BACKEND is not sharded")
+        return
+    await backend.load_registry()
+    if source_dsn:
+        source = backend.shards[0].__class__(root_app.settings, dsn=source_dsn)
+        await source.up()
+        try:
+            copied = await backend.backfill(source, chunk_size=chunk_size)
+        finally:
+            await source.shutdown()
+        echo(f"{copied} rows have been copied to shards")
+    else:
+        moved = await backend.rebalance(chunk_size=chunk_size)
+        echo(f"{moved} rows have been moved between shards")
@@ -0,0 +1,35 @@
+import typing as tp
+
+from fastapi import Request, Response
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.types import ASGIApp
+
+from yara.adapters.orm.adapter import ORMAdapter
+from yara.adapters.orm.backends.deadline import deadline
+
+
+class ORMDeadlineMiddleware(BaseHTTPMiddleware):
+    """
+    Limit the time all ORM calls of a request can take together.
+    The deadline has to wrap the whole call, so it can't be split into process_request/process_response hooks.
+    """
+
+    def __init__(self, app: ASGIApp, timeout: float) -> None:
+        super().__init__(app)
+        self.timeout = timeout
+
+    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
+        with deadline(self.timeout):
+            return await call_next(request)
+
+
+class ORMConnectionMiddleware(BaseHTTPMiddleware):
+    """
+    Pin one connection for all ORM calls of a request. The connection is acquired on the first ORM call
+    and released when the response is returned.
+    """
+
+    async def dispatch(self, request: Request, call_next: RequestResponseEndpoint) -> Response:
+        orm_adapter: ORMAdapter[tp.Any] = request.app.extra["yara_root_app"].get_adapter(ORMAdapter)
+        async with orm_adapter.pin():
+            return await call_next(request)
@@ -0,0 +1,14 @@
+import typing as tp
+from collections.abc import AsyncGenerator
+
+from yara.adapters.orm.adapter import ORMAdapter
+from yara.core.routers import Depends, get_root_app
+
+
+async def pin_orm_connection(root_app: tp.Any = Depends(get_root_app)) -> AsyncGenerator[None, None]:
+    """
+    Dependency pinning one connection for all ORM calls of the endpoint.
+    """
+    orm_adapter: ORMAdapter[tp.Any] = root_app.get_adapter(ORMAdapter)
+    async with orm_adapter.pin():
+        yield
@@ -44,6 +44,6 @@ class StorageService(YaraService):
         if file is None:
             logger.warning("File with id %s not found", id)
             return
-        with self.file_orm_adapter.backend.uow():
+        async with self.file_orm_adapter.backend.uow():
             await self.file_orm_adapter.delete(File, where_clause(id=id))
             await self.storage_adapter.remove_object(file.bucket_name, file.path)
@@ -1,8 +1,18 @@
+import typing as tp
+
+from yara.adapters.memory.adapter import MemoryAdapter
+from yara.apps.websockets.hub import WebsocketHub
 from yara.apps.websockets.routers import router
 from yara.core.apps import YaraApp
 from yara.core.routers import YaraApiRouter
 
 
 class WebsocketsApp(YaraApp):
+    hub: WebsocketHub
+
+    def __init__(self, root_app: tp.Any) -> None:
+        super().__init__(root_app)
+        self.hub = WebsocketHub(root_app.get_adapter(MemoryAdapter))
+
     def get_routers(self) -> list[YaraApiRouter]:
         return [router]
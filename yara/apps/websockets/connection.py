@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import typing as tp
+from collections.abc import AsyncIterator, Coroutine
+from contextlib import suppress
+from uuid import uuid4
+
+logger = logging.getLogger(__name__)
+
+
+# first byte of the messages carrying a coalescing key, JSON text never starts with it
+KEYED_MESSAGE_HEADER = b"\x1e"
+
+
+def pack_keyed_message(key: str, message: bytes) -> bytes:
+    """
+    Attach the coalescing key to the message, a pending message with the same key is replaced by it.
+    """
+    if "\n" in key:
+        raise ValueError("Coalescing key can't contain line breaks")
+    return KEYED_MESSAGE_HEADER + key.encode("utf-8") + b"\n" + message
+
+
+def unpack_keyed_message(data: bytes) -> tuple[str | None, bytes]:
+    if not data.startswith(KEYED_MESSAGE_HEADER):
+        return None, data
+    key, _, message = data[1:].partition(b"\n")
+    return key.decode("utf-8"), message
+
+
+def coalesce_messages(messages: list[bytes]) -> list[bytes]:
+    """
+    Unpack the messages keeping the latest message of every coalescing key in place of the first one.
+    """
+    coalesced: list[bytes] = []
+    positions: dict[str, int] = {}
+    for data in messages:
+        key, message = unpack_keyed_message(data)
+        if key is None:
+            coalesced.append(message)
+        elif key in positions:
+            coalesced[positions[key]] = message
+        else:
+            positions[key] = len(coalesced)
+            coalesced.append(message)
+    return coalesced
+
+
+class WebSocket(tp.Protocol):
+    async def accept(self) -> None:
+        ...
+
+    def iter_text(self) -> AsyncIterator[str]:
+        ...
+
+    async def send_text(self, message: str) -> None:
+        ...
+
+    async def close(self) -> None:
+        ...
+
+
+OverflowPolicy = tp.Literal["drop_oldest", "drop_newest", "disconnect"]
+
+
+class WebsocketConnection:
+    """
+    Socket of a user connected to this process with its bounded send queue.
+    A message with a coalescing key replaces the queued message with the same key, so only the latest value is sent.
+    A message coming to a full queue is handled by the overflow policy: the oldest or the new message is dropped,
+    or the connection is marked disconnected and its sender stops.
+    Readers of the user queue wait for the send queue to fall to low_watermark before reading more,
+    and for a wake-up when the user queue is empty.
+    Queued messages are sent in batches of up to batch_size, as one JSON array frame if batch_coalesce is set.
+    When a batch arrives in a burst the sender waits batch_linger milliseconds for the rest of it,
+    a message arriving alone is sent at once.
+    """
+
+    id: str
+    user_id: str
+    websocket: WebSocket
+    # coalescing key or None, the messages with a key wait in pending
+    queue: asyncio.Queue[tuple[str | None, bytes]]
+    pending: dict[str, bytes]
+    channels: set[str]
+    dropped: int
+    coalesced: int
+    send_lock: asyncio.Lock
+    overflow: OverflowPolicy
+    low_watermark: int
+    disconnected: asyncio.Event
+    woken: asyncio.Event
+    batch_size: int
+    batch_linger: int
+    batch_coalesce: bool
+
+    def __init__(
+        self,
+        user_id: str,
+        websocket: WebSocket,
+        queue_size: int,
+        overflow: OverflowPolicy = "drop_oldest",
+        low_watermark: int = 0,
+        batch_size: int = 1,
+        batch_linger: int = 0,
+        batch_coalesce: bool = False,
+    ) -> None:
+        self.id = uuid4().hex
+        self.user_id = user_id
+        self.websocket = websocket
+        self.queue = asyncio.Queue(queue_size)
+        self.pending = {}
+        self.channels = set()
+        self.dropped = 0
+        self.coalesced = 0
+        self.send_lock = asyncio.Lock()
+        self.overflow = overflow
+        self.low_watermark = low_watermark
+        self.disconnected = asyncio.Event()
+        self.woken = asyncio.Event()
+        self.batch_size = batch_size
+        self.batch_linger = batch_linger
+        self.batch_coalesce = batch_coalesce
+        self._drained = asyncio.Event()
+
+    async def send(self, message: bytes) -> None:
+        # the socket is written by send_forever and by the stream sender
+        async with self.send_lock:
+            await self.websocket.send_text(message.decode("utf-8"))
+
+    async def send_batch(self, messages: list[bytes]) -> None:
+        if self.batch_coalesce:
+            await self.send(b"[" + b",".join(messages) + b"]")
+            return
+        for message in messages:
+            await self.send(message)
+
+    def put(self, data: bytes) -> bool:
+        """
+        Queue the message to send, returns False if it was dropped.
+        """
+        if self.disconnected.is_set():
+            return False
+        key, message = unpack_keyed_message(data)
+        if key is not None and key in self.pending:
+            # the latest value wins, the message waiting to be sent is replaced
+            self.pending[key] = message
+            self.coalesced += 1
+            return True
+        if not self.queue.full():
+            self._enqueue(key, message)
+            return True
+        self.dropped += 1
+        if self.dropped == 1 or not self.dropped % 1000:
+            logger.warning(
+                "Connection %s of user %s is too slow, %s messages dropped", self.id, self.user_id, self.dropped
+            )
+        match self.overflow:
+            case "drop_oldest":
+                self._take(self.queue.get_nowait())
+                self._enqueue(key, message)
+                return True
+            case "disconnect":
+                self.disconnect()
+        return False
+
+    def _enqueue(self, key: str | None, message: bytes) -> None:
+        if key is None:
+            self.queue.put_nowait((None, message))
+            return
+        self.pending[key] = message
+        self.queue.put_nowait((key, b""))
+
+    def _take(self, item: tuple[str | None, bytes]) -> bytes:
+        key, message = item
+        return self.pending.pop(key) if key is not None else message
+
+    def disconnect(self) -> None:
+        self.disconnected.set()
+
+    def wake(self) -> None:
+        self.woken.set()
+
+    async def wait_woken(self, timeout: float) -> bool:
+        """
+        Wait for a message pushed to the user queue, returns False on timeout.
+        """
+        try:
+            await asyncio.wait_for(self.woken.wait(), timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    def get_free_space(self) -> int:
+        return self.queue.maxsize - self.queue.qsize()
+
+    def is_slow(self) -> bool:
+        return bool(self.dropped) or self.queue.full()
+
+    async def wait_drained(self) -> None:
+        """
+        Wait until the queued messages fall to the low watermark.
+        """
+        while self.queue.qsize() > self.low_watermark:
+            self._drained.clear()
+            await self._drained.wait()
+
+    async def send_forever(self) -> None:
+        while True:
+            messages = [self._take(await self.queue.get())]
+            if self.batch_linger and not self.queue.empty() and self.queue.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.batch_linger / 1000)
+            while len(messages) < self.batch_size and not self.queue.empty():
+                messages.append(self._take(self.queue.get_nowait()))
+            if self.queue.qsize() <= self.low_watermark:
+                self._drained.set()
+            await self.send_batch(messages)
+
+
+async def serve_websocket(websocket: WebSocket, *coroutines: Coroutine[tp.Any, tp.Any, tp.Any]) -> None:
+    """
+    Run the receiver and the sender of the socket until one of them returns, when the client disconnects
+    or the socket is disconnected as a slow consumer, then cancel the others and close the socket.
+    """
+    tasks = [asyncio.create_task(coroutine) for coroutine in coroutines]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # the client may have closed the socket already
+        with suppress(RuntimeError, OSError):
+            await websocket.close()
@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import typing as tp
+from collections import defaultdict
+from uuid import uuid4
+
+import orjson
+
+from yara.adapters.memory.adapter import MemoryAdapter
+from yara.apps.websockets.connection import WebsocketConnection
+
+logger = logging.getLogger(__name__)
+
+
+def pack_message(node_id: str, message: bytes) -> bytes:
+    """
+    Prefix the published message with the node id of the sender, so the sender skips its own copy.
+    """
+    return node_id.encode("utf-8") + b"\n" + message
+
+
+def unpack_message(data: bytes) -> tuple[str, bytes]:
+    node_id, _, message = data.partition(b"\n")
+    return node_id.decode("utf-8"), message
+
+
+# published to the channel of the user after a push to its queue
+WAKE_UP_MESSAGE = b""
+
+
+ControlAction = tp.Literal["subscribe", "unsubscribe", "disconnect"]
+
+
+def pack_control(action: ControlAction, user_id: str, channel: str = "") -> bytes:
+    """
+    Control message subscribing, unsubscribing or disconnecting the sockets of the user connected to any process.
+    """
+    return orjson.dumps({"action": action, "user_id": user_id, "channel": channel})
+
+
+class WebsocketHub:
+    """
+    Per process registry of the connected sockets.
+    Every channel a local socket listens to is subscribed once through the pub/sub connection
+    shared by the memory backend, messages are dispatched to the send queues of the local sockets.
+    Messages published by this process are delivered to the local sockets directly and skipped by the listeners.
+    WAKE_UP_MESSAGE wakes up the readers of the user queue instead of being sent.
+    While sockets are connected the hub also listens to control_channel, so any process can subscribe
+    the sockets of a user to a channel, e.g. a room, or disconnect them wherever they are connected.
+    """
+
+    control_channel: str = "ws_control"
+
+    memory_adapter: MemoryAdapter
+    node_id: str
+    # user id -> connection id -> connection
+    connections: defaultdict[str, dict[str, WebsocketConnection]]
+    # channel -> connections listening to it
+    channels: defaultdict[str, set[WebsocketConnection]]
+    # slow consumers: messages dropped and coalesced by the closed connections, connections disconnected,
+    # user queues overflowed by the messages sent from this process
+    dropped: int
+    coalesced: int
+    disconnected: int
+    overflowed_queues: int
+
+    def __init__(self, memory_adapter: MemoryAdapter) -> None:
+        self.memory_adapter = memory_adapter
+        self.node_id = uuid4().hex
+        self.connections = defaultdict(dict)
+        self.channels = defaultdict(set)
+        self.dropped = 0
+        self.coalesced = 0
+        self.disconnected = 0
+        self.overflowed_queues = 0
+        self._listeners: dict[str, asyncio.Task[None]] = {}
+
+    def register(self, connection: WebsocketConnection) -> None:
+        self.connections[connection.user_id][connection.id] = connection
+        if self.control_channel not in self._listeners:
+            self._listeners[self.control_channel] = asyncio.create_task(self._listen(self.control_channel))
+
+    def unregister(self, connection: WebsocketConnection) -> None:
+        user_connections = self.connections.get(connection.user_id, {})
+        user_connections.pop(connection.id, None)
+        if not user_connections:
+            self.connections.pop(connection.user_id, None)
+        for channel in list(connection.channels):
+            self.unsubscribe(connection, channel)
+        self.dropped += connection.dropped
+        self.coalesced += connection.coalesced
+        if connection.disconnected.is_set():
+            self.disconnected += 1
+        if not self.connections:
+            listener = self._listeners.pop(self.control_channel, None)
+            if listener:
+                listener.cancel()
+
+    def subscribe(self, connection: WebsocketConnection, channel: str) -> None:
+        self.channels[channel].add(connection)
+        connection.channels.add(channel)
+        if channel not in self._listeners:
+            self._listeners[channel] = asyncio.create_task(self._listen(channel))
+
+    def unsubscribe(self, connection: WebsocketConnection, channel: str) -> None:
+        connection.channels.discard(channel)
+        listeners = self.channels.get(channel)
+        if listeners is None:
+            return
+        listeners.discard(connection)
+        if not listeners:
+            del self.channels[channel]
+            listener = self._listeners.pop(channel, None)
+            if listener:
+                listener.cancel()
+
+    def subscribe_user(self, user_id: str, channel: str) -> None:
+        for connection in self.get_connections(user_id):
+            self.subscribe(connection, channel)
+
+    def unsubscribe_user(self, user_id: str, channel: str) -> None:
+        for connection in self.get_connections(user_id):
+            self.unsubscribe(connection, channel)
+
+    async def control(self, action: ControlAction, user_id: str, channel: str = "") -> None:
+        """
+        Subscribe, unsubscribe or disconnect the sockets of the user connected to this and to the other processes.
+        """
+        message = pack_control(action, user_id, channel)
+        self._handle_control(message)
+        await self.publish(self.control_channel, message)
+
+    def get_connections(self, user_id: str) -> list[WebsocketConnection]:
+        return list(self.connections.get(user_id, {}).values())
+
+    def is_subscribed(self, channel: str) -> bool:
+        return channel in self._listeners
+
+    async def publish(self, channel: str, message: bytes) -> int:
+        return await self.memory_adapter.publish(channel, pack_message(self.node_id, message))
+
+    async def send(self, channel: str, message: bytes) -> int:
+        """
+        Publish the message once and fan it out to the local sockets of the channel.
+        Returns the number of local sockets plus the number of other processes subscribed to the channel.
+        """
+        local = self.dispatch(channel, message)
+        # this process is counted by PUBLISH, but skips its own messages
+        subscribed = self.is_subscribed(channel)
+        return local + await self.publish(channel, message) - subscribed
+
+    def dispatch(self, channel: str, message: bytes) -> int:
+        listeners = self.channels.get(channel, set())
+        for connection in listeners:
+            if message == WAKE_UP_MESSAGE:
+                connection.wake()
+            else:
+                connection.put(message)
+        return len(listeners)
+
+    def _handle_control(self, message: bytes) -> None:
+        command = orjson.loads(message)
+        match command["action"]:
+            case "subscribe":
+                self.subscribe_user(command["user_id"], command["channel"])
+            case "unsubscribe":
+                self.unsubscribe_user(command["user_id"], command["channel"])
+            case "disconnect":
+                for connection in self.get_connections(command["user_id"]):
+                    connection.disconnect()
+
+    async def _listen(self, channel: str) -> None:
+        while True:
+            try:
+                async for _, data in self.memory_adapter.subscribe(channel):
+                    node_id, message = unpack_message(data)
+                    if node_id == self.node_id:
+                        continue
+                    if channel == self.control_channel:
+                        self._handle_control(message)
+                    else:
+                        self.dispatch(channel, message)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Websocket hub listener of %s failed, resubscribing", channel)
+            await asyncio.sleep(1)
+
+    def metrics(self) -> dict[str, tp.Any]:
+        connections = [
+            connection for user_connections in self.connections.values() for connection in user_connections.values()
+        ]
+        return {
+            "users": len(self.connections),
+            "connections": len(connections),
+            "channels": len(self.channels),
+            "slow_connections": sum(connection.is_slow() for connection in connections),
+            "dropped": self.dropped + sum(connection.dropped for connection in connections),
+            "coalesced": self.coalesced + sum(connection.coalesced for connection in connections),
+            "disconnected": self.disconnected,
+            "overflowed_queues": self.overflowed_queues,
+        }
@@ -1,6 +1,7 @@
 from uuid import UUID
 
 from yara.apps.auth.routers import get_authenticated_user_id
+from yara.apps.websockets.schemas import WebsocketOptions
 from yara.apps.websockets.services import WebsocketService
 from yara.core.routers import Depends, WebSocket, YaraApiRouter, get_service
 
@@ -14,6 +15,7 @@ router = YaraApiRouter(
 async def websockets(
     websocket: WebSocket,
     authenticated_user_id: UUID = Depends(get_authenticated_user_id),
+    options: WebsocketOptions = Depends(),
     websockets_service: WebsocketService = Depends(get_service(WebsocketService)),
 ) -> None:
     await websockets_service.accept(
@@ -23,8 +25,5 @@ async def websockets(
     await websockets_service.listen(
         authenticated_user_id,
         websocket,
-    )
-    await websockets_service.close_ws(
-        authenticated_user_id,
-        websocket,
+        options,
     )
@@ -0,0 +1,14 @@
+from pydantic import BaseModel, Field
+
+
+class WebsocketOptions(BaseModel):
+    """
+    Delivery options of a connection, the ones not set default to the YARA_WEBSOCKETS_BATCH_* settings.
+    """
+
+    # messages sent per wake-up of the sender
+    batch_size: int | None = Field(default=None, ge=1, le=1000)
+    # milliseconds the sender waits for more messages when they arrive in a burst
+    batch_linger: int | None = Field(default=None, ge=0, le=1000)
+    # send every batch as one JSON array frame
+    batch_coalesce: bool | None = None
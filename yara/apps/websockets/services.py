@@ -1,12 +1,22 @@
 import asyncio
 import logging
 import typing as tp
-from collections.abc import AsyncIterator, Sequence
-from uuid import UUID
+from collections.abc import Sequence
+from uuid import UUID, uuid4
 
 import orjson
 
 from yara.adapters.memory.adapter import MemoryAdapter
+from yara.adapters.memory.backends.base import StreamEntry
+from yara.apps.websockets.connection import (
+    WebSocket,
+    WebsocketConnection,
+    coalesce_messages,
+    pack_keyed_message,
+    serve_websocket,
+)
+from yara.apps.websockets.hub import WAKE_UP_MESSAGE, ControlAction, WebsocketHub, pack_control, pack_message
+from yara.apps.websockets.schemas import WebsocketOptions
 from yara.core.helpers import import_obj
 from yara.core.services import YaraService
 from yara.main import YaraRootApp
@@ -14,23 +24,15 @@ from yara.main import YaraRootApp
 logger = logging.getLogger(__name__)
 
 
-class WebSocket(tp.Protocol):
-    async def accept(self) -> None:
-        ...
-
-    def iter_text(self) -> AsyncIterator[str]:
-        ...
-
-    async def send_text(self, message: str) -> None:
-        ...
-
-    async def close(self) -> None:
-        ...
-
-
 class WebsocketService(YaraService):
     memory_set_subscribers_key: str = "ws_subscribers"
     memory_queue_messages_key: str = "ws_messages_for_{user_id}"
+    memory_stream_messages_key: str = "ws_stream_for_{user_id}"
+    memory_stream_group: str = "ws"
+    memory_channel_key: str = "ws_channel_for_{user_id}"
+    memory_broadcast_channel: str = "ws_broadcast"
+    memory_room_channel_key: str = "ws_room_{room}"
+    memory_set_rooms_key: str = "ws_rooms_for_{user_id}"
 
     memory_adapter: MemoryAdapter
 
@@ -41,6 +43,14 @@ class WebsocketService(YaraService):
         super().__init__(root_app)
         self.memory_adapter: MemoryAdapter = self.root_app.get_adapter(MemoryAdapter)
 
+    def get_hub(self) -> WebsocketHub | None:
+        # the hub of WebsocketsApp, looked up by type as the app module imports the routers using this service
+        for app in getattr(self.root_app, "apps", {}).values():
+            hub = getattr(app, "hub", None)
+            if isinstance(hub, WebsocketHub):
+                return hub
+        return None
+
     async def accept(
         self,
         user_id: UUID,
@@ -49,64 +59,245 @@ class WebsocketService(YaraService):
         await websocket.accept()
         await self.memory_adapter.sadd(self.memory_set_subscribers_key, str(user_id))
 
-    async def _send_to_user(
+    async def _send_to_users(
         self,
-        user_id: UUID | str,
-        message_json: str | bytes,
+        user_ids: Sequence[UUID | str],
+        message: bytes,
         check_user: bool = True,
-    ) -> bool:
-        if check_user and not await self.memory_adapter.sismember(
-            self.memory_set_subscribers_key,
-            str(user_id),
-        ):
-            logger.warning("User %s is not a subscriber", user_id)
-            return False
-        await self.memory_adapter.lpush(
-            self.memory_queue_messages_key.format(user_id=user_id),
-            message_json,
+    ) -> tuple[int, int]:
+        """
+        Deliver the message to a chunk of users with one membership check and one pipeline of pushes.
+        Returns the numbers of users the message was delivered to and skipped.
+        """
+        if not user_ids:
+            return 0, 0
+        delivery = self.root_app.settings.YARA_WEBSOCKETS_DELIVERY
+        hub = self.get_hub()
+        chunk_user_ids = [str(user_id) for user_id in user_ids]
+        if delivery == "pubsub":
+            return await self._publish_to_users(hub, chunk_user_ids, message, check_user)
+        delivered = local = 0
+        remote_user_ids: list[str] = []
+        for user_id in chunk_user_ids:
+            local_connections = hub.get_connections(user_id) if hub and delivery != "stream" else []
+            if local_connections:
+                # the queue of the user is consumed by one of its sockets, a local one takes the message directly
+                local += 1
+                delivered += min(local_connections, key=lambda connection: connection.queue.qsize()).put(message)
+            else:
+                remote_user_ids.append(user_id)
+        if check_user and remote_user_ids:
+            subscribed = await self.memory_adapter.smismember(self.memory_set_subscribers_key, remote_user_ids)
+            not_subscribed = len(remote_user_ids)
+            remote_user_ids = [
+                user_id for user_id, is_subscriber in zip(remote_user_ids, subscribed, strict=True) if is_subscriber
+            ]
+            not_subscribed -= len(remote_user_ids)
+            if not_subscribed:
+                logger.warning("%s of %s users are not subscribers", not_subscribed, len(user_ids))
+        if remote_user_ids:
+            delivered += await self._push_to_users(hub, remote_user_ids, message)
+        return delivered, len(user_ids) - delivered
+
+    async def _push_to_users(self, hub: WebsocketHub | None, user_ids: list[str], message: bytes) -> int:
+        """
+        Push the message to the queues of the users in one pipeline, the queues are bounded by
+        YARA_WEBSOCKETS_QUEUE_MAXLEN and YARA_WEBSOCKETS_QUEUE_TTL. Returns the number of users the message was queued for.
+        """
+        settings = self.root_app.settings
+        # readers of the hub processes wait for a wake-up instead of blocking a connection,
+        # the sender may be a process without the hub, e.g. a worker
+        wake_up = pack_message("", WAKE_UP_MESSAGE)
+        ttl = settings.YARA_WEBSOCKETS_QUEUE_TTL
+        if settings.YARA_WEBSOCKETS_DELIVERY == "stream":
+            async with self.memory_adapter.pipeline() as pipeline:
+                for user_id in user_ids:
+                    stream = self.memory_stream_messages_key.format(user_id=user_id)
+                    pipeline.xadd(stream, {"message": message}, maxlen=settings.YARA_WEBSOCKETS_STREAM_MAXLEN)
+                    if ttl:
+                        pipeline.expire(stream, ttl)
+                    pipeline.publish(self.memory_channel_key.format(user_id=user_id), wake_up)
+            return len(user_ids)
+        maxlen = settings.YARA_WEBSOCKETS_QUEUE_MAXLEN
+        overflow = settings.YARA_WEBSOCKETS_OVERFLOW
+        # position of the LPUSH of every user, its result is the length of the queue
+        lpush_indexes = []
+        async with self.memory_adapter.pipeline() as pipeline:
+            for user_id in user_ids:
+                queue_name = self.memory_queue_messages_key.format(user_id=user_id)
+                lpush_indexes.append(len(pipeline))
+                pipeline.lpush(queue_name, message)
+                if maxlen:
+                    # new messages are pushed to the left and popped from the right
+                    if overflow == "drop_newest":
+                        pipeline.ltrim(queue_name, -maxlen, -1)
+                    else:
+                        pipeline.ltrim(queue_name, 0, maxlen - 1)
+                if ttl:
+                    pipeline.expire(queue_name, ttl)
+                pipeline.publish(self.memory_channel_key.format(user_id=user_id), wake_up)
+        if not maxlen:
+            return len(user_ids)
+        lengths = [pipeline.results[index] for index in lpush_indexes]
+        overflowed = [user_id for user_id, length in zip(user_ids, lengths, strict=True) if length > maxlen]
+        if not overflowed:
+            return len(user_ids)
+        logger.warning("Queues of %s users are full, slow consumers: %s", len(overflowed), ", ".join(overflowed[:10]))
+        if hub:
+            hub.overflowed_queues += len(overflowed)
+        if overflow == "drop_oldest":
+            return len(user_ids)
+        if overflow == "disconnect":
+            await self.memory_adapter.delete_many(
+                [self.memory_queue_messages_key.format(user_id=user_id) for user_id in overflowed]
+            )
+            for user_id in overflowed:
+                await self._control("disconnect", user_id)
+        return len(user_ids) - len(overflowed)
+
+    async def _publish_to_users(
+        self,
+        hub: WebsocketHub | None,
+        user_ids: list[str],
+        message: bytes,
+        check_user: bool,
+    ) -> tuple[int, int]:
+        local_user_ids = set()
+        # this process is counted by PUBLISH, but skips its own messages
+        subscribed_user_ids = set()
+        if hub:
+            for user_id in user_ids:
+                if hub.is_subscribed(self.memory_channel_key.format(user_id=user_id)):
+                    subscribed_user_ids.add(user_id)
+                for connection in hub.get_connections(user_id):
+                    if connection.put(message):
+                        local_user_ids.add(user_id)
+        # every other process with a socket of the user is subscribed to the channel once
+        packed_message = pack_message(hub.node_id if hub else "", message)
+        async with self.memory_adapter.pipeline() as pipeline:
+            for user_id in user_ids:
+                pipeline.publish(self.memory_channel_key.format(user_id=user_id), packed_message)
+        delivered = sum(
+            1
+            for user_id, received in zip(user_ids, pipeline.results, strict=True)
+            if received - (user_id in subscribed_user_ids) > 0 or user_id in local_user_ids
         )
-        return True
+        skipped = len(user_ids) - delivered
+        if check_user and skipped:
+            logger.warning("%s of %s users are not connected", skipped, len(user_ids))
+        return delivered, skipped
 
     async def send_to(
         self,
         user_ids: Sequence[UUID | str],
         message: dict[str, tp.Any],
-    ) -> None:
+        key: str | None = None,
+    ) -> tuple[int, int]:
+        """
+        Returns the numbers of users the message was delivered to and skipped.
+        A message with a coalescing key, e.g. "presence:{user_id}", replaces the message with the same key
+        waiting in the send queue of a socket, so only the latest value is sent.
+        """
         try:
             message_json = orjson.dumps(message)
         except orjson.JSONEncodeError:
             logger.error("Error encoding message to JSON: %s", message)
-            return
-        await asyncio.gather(
-            *[
-                self._send_to_user(
-                    user_id,
-                    message_json,
-                )
-                for user_id in user_ids
-            ]
-        )
+            return 0, len(user_ids)
+        if key:
+            message_json = pack_keyed_message(key, message_json)
+        chunk_size = self.root_app.settings.YARA_WEBSOCKETS_SEND_CHUNK_SIZE
+        delivered = skipped = 0
+        for start in range(0, len(user_ids), chunk_size):
+            chunk_delivered, chunk_skipped = await self._send_to_users(
+                user_ids[start : start + chunk_size], message_json
+            )
+            delivered += chunk_delivered
+            skipped += chunk_skipped
+        return delivered, skipped
 
     async def broadcast(
         self,
         message: dict[str, tp.Any],
-    ) -> None:
+        key: str | None = None,
+    ) -> tuple[int, int]:
+        """
+        Returns the numbers of subscribers the message was delivered to and skipped.
+        In "channel" broadcast the subscribers are not known, the number of reached local sockets and processes
+        is returned instead, see WebsocketHub.send. The coalescing key works like in send_to.
+        """
+        try:
+            message_json = orjson.dumps(message)
+        except orjson.JSONEncodeError:
+            logger.error("Error encoding message to JSON: %s", message)
+            return 0, 0
+        if key:
+            message_json = pack_keyed_message(key, message_json)
+        if self.root_app.settings.YARA_WEBSOCKETS_BROADCAST == "channel":
+            return await self._send_to_channel(self.memory_broadcast_channel, message_json), 0
+        page_size = self.root_app.settings.YARA_WEBSOCKETS_BROADCAST_PAGE_SIZE
+        delivered = skipped = 0
+        user_ids: list[str] = []
+        # the subscribers set is scanned in pages, so memory doesn't grow with the number of subscribers
+        async for subscriber_id in self.memory_adapter.sscan_iter(self.memory_set_subscribers_key, count=page_size):
+            user_ids.append(bytes(subscriber_id).decode("utf-8"))  # type: ignore [arg-type]
+            if len(user_ids) >= page_size:
+                page_delivered, page_skipped = await self._send_to_users(user_ids, message_json, check_user=False)
+                delivered += page_delivered
+                skipped += page_skipped
+                user_ids = []
+        if user_ids:
+            page_delivered, page_skipped = await self._send_to_users(user_ids, message_json, check_user=False)
+            delivered += page_delivered
+            skipped += page_skipped
+        return delivered, skipped
+
+    async def join(self, user_id: UUID | str, room: str) -> None:
+        """
+        Add the user to the room, the connected sockets of the user join it at once, the ones connected later on connect.
+        """
+        await self.memory_adapter.sadd(self.memory_set_rooms_key.format(user_id=user_id), room)
+        await self._control("subscribe", str(user_id), self.memory_room_channel_key.format(room=room))
+
+    async def leave(self, user_id: UUID | str, room: str) -> None:
+        await self.memory_adapter.srem(self.memory_set_rooms_key.format(user_id=user_id), room)
+        await self._control("unsubscribe", str(user_id), self.memory_room_channel_key.format(room=room))
+
+    async def send_to_rooms(
+        self,
+        rooms: Sequence[str],
+        message: dict[str, tp.Any],
+        key: str | None = None,
+    ) -> int:
+        """
+        Publish the message once per room, it is sent to the sockets of the room members connected at the moment.
+        Returns the number of reached local sockets and processes, see WebsocketHub.send.
+        The coalescing key works like in send_to.
+        """
         try:
             message_json = orjson.dumps(message)
         except orjson.JSONEncodeError:
             logger.error("Error encoding message to JSON: %s", message)
+            return 0
+        if key:
+            message_json = pack_keyed_message(key, message_json)
+        received = 0
+        for room in rooms:
+            received += await self._send_to_channel(self.memory_room_channel_key.format(room=room), message_json)
+        return received
+
+    async def _send_to_channel(self, channel: str, message: bytes) -> int:
+        hub = self.get_hub()
+        if hub:
+            return await hub.send(channel, message)
+        return await self.memory_adapter.publish(channel, pack_message("", message))
+
+    async def _control(self, action: ControlAction, user_id: str, channel: str = "") -> None:
+        hub = self.get_hub()
+        if hub:
+            await hub.control(action, user_id, channel)
             return
-        subscriber_ids = await self.memory_adapter.smembers(self.memory_set_subscribers_key)
-        user_ids = [bytes(subscriber_id).decode("utf-8") for subscriber_id in subscriber_ids]  # type: ignore [arg-type]
-        await asyncio.gather(
-            *[
-                self._send_to_user(
-                    user_id,
-                    message_json,
-                    check_user=False,
-                )
-                for user_id in user_ids
-            ]
+        await self.memory_adapter.publish(
+            WebsocketHub.control_channel, pack_message("", pack_control(action, user_id, channel))
         )
 
     async def _ws_receiver(self, user_id: UUID, websocket: WebSocket) -> None:
@@ -122,29 +313,171 @@ class WebsocketService(YaraService):
         async for message_json in websocket.iter_text():
             task_handle_ws_message.delay(str(user_id), message_json)
 
-    async def _ws_sender(self, user_id: UUID, websocket: WebSocket) -> None:
-        while True:
-            _, message = await self.memory_adapter.brpop([self.memory_queue_messages_key.format(user_id=user_id)])
-            message_str = bytes(message).decode("utf-8")  # type: ignore [arg-type]
-            await websocket.send_text(message_str)
+    async def _ws_stream_sender(
+        self,
+        user_id: UUID,
+        connection: WebsocketConnection,
+        hub: WebsocketHub | None = None,
+    ) -> None:
+        """
+        With the hub the stream is read without blocking after every wake-up of the connection,
+        otherwise every connection blocks a connection of the memory backend in XREADGROUP.
+        The consumer of the connection is deleted when it stops, unless it leaves unacknowledged entries
+        for the other connections to claim. The stream expires YARA_WEBSOCKETS_QUEUE_TTL after the last message,
+        a connected reader keeps it alive.
+        """
+        settings = self.root_app.settings
+        stream = self.memory_stream_messages_key.format(user_id=user_id)
+        group = self.memory_stream_group
+        ttl = settings.YARA_WEBSOCKETS_QUEUE_TTL
+        # every connection is a consumer, the group remembers the last delivered message across reconnects
+        consumer = uuid4().hex
+        await self.memory_adapter.xgroup_create(stream, group, id="0")
+        claim = True
+        unacknowledged = 0
+        try:
+            while True:
+                entries: list[StreamEntry] = []
+                if claim:
+                    if ttl:
+                        await self.memory_adapter.expire(stream, ttl)
+                    # take over messages left unacknowledged by connections closed mid-send
+                    _, entries = await self.memory_adapter.xautoclaim(
+                        stream, group, consumer, settings.YARA_WEBSOCKETS_STREAM_CLAIM_IDLE
+                    )
+                if not entries:
+                    connection.woken.clear()
+                    result = await self.memory_adapter.xreadgroup(
+                        group,
+                        consumer,
+                        {stream: ">"},
+                        count=100,
+                        block=None if hub else settings.YARA_WEBSOCKETS_STREAM_BLOCK,
+                    )
+                    entries = [entry for _, stream_entries in result for entry in stream_entries]
+                if not entries and hub:
+                    claim = not await connection.wait_woken(settings.YARA_WEBSOCKETS_QUEUE_POLL_INTERVAL / 1000)
+                    continue
+                claim = not entries
+                unacknowledged = len(entries)
+                # entries are acknowledged once sent, so keyed messages are coalesced within a batch only
+                for start in range(0, len(entries), connection.batch_size):
+                    batch = entries[start : start + connection.batch_size]
+                    await connection.send_batch(coalesce_messages([fields[b"message"] for _, fields in batch]))
+                    await self.memory_adapter.xack(stream, group, *[entry_id for entry_id, _ in batch])
+                    unacknowledged -= len(batch)
+        finally:
+            if not unacknowledged:
+                await self.memory_adapter.xgroup_delconsumer(stream, group, consumer)
 
-    async def listen(self, user_id: UUID, websocket: WebSocket) -> None:
-        task_group: list[asyncio.Task[None]] = []
+    async def _pop_messages(self, user_id: UUID, count: int) -> list[bytes]:
+        """
+        Wait for a queued message of the user and take up to count messages with one BRPOP and one RPOP.
+        """
+        queue_name = self.memory_queue_messages_key.format(user_id=user_id)
+        result = await self.memory_adapter.brpop([queue_name])
+        if not result:
+            return []
+        messages: list[tp.Any] = [result[1]]
+        if count > 1:
+            messages.extend(await self.memory_adapter.rpop(queue_name, count=count - 1) or [])
+        return [bytes(message) for message in messages]
 
-        async def run_ws_receiver() -> None:
-            await self._ws_receiver(user_id, websocket)
-            # Cancel all tasks in the task group when this task is done
-            for task in task_group:
-                task.cancel()
+    async def _ws_queue_reader(self, user_id: UUID, connection: WebsocketConnection) -> None:
+        queue_name = self.memory_queue_messages_key.format(user_id=user_id)
+        poll_interval = self.root_app.settings.YARA_WEBSOCKETS_QUEUE_POLL_INTERVAL / 1000
+        while True:
+            # messages stay in the memory backend, bounded by its queue length, until the socket catches up
+            await connection.wait_drained()
+            count = max(min(connection.batch_size, connection.get_free_space()), 1)
+            # a wake-up coming while the queue is read is not lost
+            connection.woken.clear()
+            # with count RPOP returns a list
+            messages = tp.cast(list[tp.Any], await self.memory_adapter.rpop(queue_name, count=count) or [])
+            for message in messages:
+                connection.put(bytes(message))
+            if len(messages) < count:
+                # the queue is empty, the next push wakes the reader up
+                await connection.wait_woken(poll_interval)
 
-        receiver_task = asyncio.create_task(run_ws_receiver())
-        task_group.append(receiver_task)
+    def _get_connection(self, user_id: UUID, websocket: WebSocket, options: WebsocketOptions) -> WebsocketConnection:
+        settings = self.root_app.settings
+        return WebsocketConnection(
+            str(user_id),
+            websocket,
+            settings.YARA_WEBSOCKETS_SEND_QUEUE_SIZE,
+            overflow=settings.YARA_WEBSOCKETS_OVERFLOW,
+            low_watermark=settings.YARA_WEBSOCKETS_SEND_QUEUE_LOW_WATERMARK,
+            batch_size=options.batch_size or settings.YARA_WEBSOCKETS_BATCH_SIZE,
+            batch_linger=(
+                options.batch_linger if options.batch_linger is not None else settings.YARA_WEBSOCKETS_BATCH_LINGER
+            ),
+            batch_coalesce=(
+                options.batch_coalesce
+                if options.batch_coalesce is not None
+                else settings.YARA_WEBSOCKETS_BATCH_COALESCE
+            ),
+        )
 
-        sender_task = asyncio.create_task(self._ws_sender(user_id, websocket))
-        task_group.append(sender_task)
+    async def _ws_hub_sender(self, hub: WebsocketHub, user_id: UUID, connection: WebsocketConnection) -> None:
+        settings = self.root_app.settings
+        hub.register(connection)
+        try:
+            if settings.YARA_WEBSOCKETS_BROADCAST == "channel":
+                hub.subscribe(connection, self.memory_broadcast_channel)
+            # rooms joined before the socket connected, later joins arrive through the control channel of the hub
+            for room in await self.memory_adapter.smembers(self.memory_set_rooms_key.format(user_id=user_id)):
+                room_name = bytes(room).decode("utf-8")  # type: ignore [arg-type]
+                hub.subscribe(connection, self.memory_room_channel_key.format(room=room_name))
+            # messages in "pubsub" delivery, wake-ups of the queue readers otherwise
+            hub.subscribe(connection, self.memory_channel_key.format(user_id=user_id))
+            async with asyncio.TaskGroup() as task_group:
+                tasks = [task_group.create_task(connection.send_forever())]
+                match settings.YARA_WEBSOCKETS_DELIVERY:
+                    case "stream":
+                        tasks.append(task_group.create_task(self._ws_stream_sender(user_id, connection, hub)))
+                    case "list":
+                        tasks.append(task_group.create_task(self._ws_queue_reader(user_id, connection)))
+                # a slow consumer is disconnected with the "disconnect" overflow policy
+                await connection.disconnected.wait()
+                logger.warning("Disconnecting connection %s of user %s as a slow consumer", connection.id, user_id)
+                for task in tasks:
+                    task.cancel()
+        finally:
+            hub.unregister(connection)
 
-        # Wait for all tasks in the task group to complete
-        await asyncio.gather(*task_group)
+    async def _ws_sender(self, user_id: UUID, websocket: WebSocket, options: WebsocketOptions) -> None:
+        settings = self.root_app.settings
+        connection = self._get_connection(user_id, websocket, options)
+        hub = self.get_hub()
+        if hub:
+            await self._ws_hub_sender(hub, user_id, connection)
+            return
+        if settings.YARA_WEBSOCKETS_DELIVERY == "stream":
+            await self._ws_stream_sender(user_id, connection)
+            return
+        async with asyncio.TaskGroup() as task_group:
+            # keyed messages are coalesced in the send queue, not only within one popped batch
+            task_group.create_task(connection.send_forever())
+            while True:
+                await connection.wait_drained()
+                count = max(min(connection.batch_size, connection.get_free_space()), 1)
+                for message in await self._pop_messages(user_id, count):
+                    connection.put(message)
+
+    async def listen(self, user_id: UUID, websocket: WebSocket, options: WebsocketOptions | None = None) -> None:
+        """
+        Serve the socket until the client disconnects or the socket is disconnected as a slow consumer,
+        then close it and remove the user from the subscribers.
+        """
+        try:
+            await serve_websocket(
+                websocket,
+                self._ws_receiver(user_id, websocket),
+                self._ws_sender(user_id, websocket, options or WebsocketOptions()),
+            )
+        finally:
+            await self.memory_adapter.srem(self.memory_set_subscribers_key, str(user_id))
 
     async def close_ws(self, user_id: UUID, websocket: WebSocket) -> None:
         await self.memory_adapter.srem(
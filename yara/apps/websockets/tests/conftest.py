@@ -0,0 +1,5 @@
+import os
+from pathlib import Path
+
+# yara.main, imported by the services, builds the root app from the environment at import
+os.environ.setdefault("YARA_ENV_FILE", str(Path(__file__).parents[4] / ".env.dev"))
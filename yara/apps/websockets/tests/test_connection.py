@@ -0,0 +1,90 @@
+import asyncio
+from collections.abc import AsyncIterator
+
+import pytest
+
+from yara.apps.websockets.connection import (
+    WebsocketConnection,
+    coalesce_messages,
+    pack_keyed_message,
+    serve_websocket,
+)
+
+
+class FakeWebSocket:
+    def __init__(self) -> None:
+        self.sent: list[str] = []
+        self.closed = False
+
+    async def accept(self) -> None:
+        pass
+
+    async def iter_text(self) -> AsyncIterator[str]:
+        for message in self.sent:
+            yield message
+
+    async def send_text(self, message: str) -> None:
+        self.sent.append(message)
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+async def test_latest_value_wins() -> None:
+    websocket = FakeWebSocket()
+    connection = WebsocketConnection("user", websocket, 10, batch_size=10)
+    connection.put(pack_keyed_message("progress", b'{"progress":1}'))
+    connection.put(b'{"id":1}')
+    connection.put(pack_keyed_message("progress", b'{"progress":2}'))
+    connection.put(pack_keyed_message("presence", b'{"online":true}'))
+    assert connection.queue.qsize() == 3
+    assert connection.coalesced == 1
+    messages = [connection._take(connection.queue.get_nowait()) for _ in range(3)]
+    assert messages == [b'{"progress":2}', b'{"id":1}', b'{"online":true}']
+    assert not connection.pending
+
+
+async def test_drop_oldest_keyed_message() -> None:
+    connection = WebsocketConnection("user", FakeWebSocket(), 1)
+    connection.put(pack_keyed_message("progress", b"1"))
+    assert connection.put(b"2")
+    assert connection.dropped == 1
+    assert not connection.pending
+
+
+def test_coalesce_messages() -> None:
+    messages = [pack_keyed_message("a", b"1"), b"2", pack_keyed_message("a", b"3")]
+    assert coalesce_messages(messages) == [b"3", b"2"]
+
+
+async def test_slow_consumer_is_closed() -> None:
+    websocket = FakeWebSocket()
+    connection = WebsocketConnection("user", websocket, 1, overflow="disconnect")
+    receiver_cancelled = asyncio.Event()
+
+    async def receive() -> None:
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            receiver_cancelled.set()
+            raise
+
+    task = asyncio.create_task(serve_websocket(websocket, receive(), connection.disconnected.wait()))
+    await asyncio.sleep(0)
+    connection.put(b"1")
+    connection.put(b"2")
+    await asyncio.wait_for(task, 1)
+    assert connection.disconnected.is_set()
+    assert receiver_cancelled.is_set()
+    assert websocket.closed
+
+
+async def test_socket_is_closed_on_error() -> None:
+    websocket = FakeWebSocket()
+
+    async def fail() -> None:
+        raise ValueError("sender failed")
+
+    with pytest.raises(ValueError, match="sender failed"):
+        await serve_websocket(websocket, asyncio.Event().wait(), fail())
+    assert websocket.closed
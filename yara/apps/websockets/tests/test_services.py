@@ -0,0 +1,162 @@
+import asyncio
+import typing as tp
+from types import SimpleNamespace
+
+import orjson
+import pytest
+
+from yara.adapters.memory.adapter import MemoryAdapter
+from yara.apps.websockets.connection import WebsocketConnection
+from yara.apps.websockets.hub import WebsocketHub
+from yara.apps.websockets.schemas import WebsocketOptions
+from yara.apps.websockets.services import WebsocketService
+from yara.apps.websockets.tests.test_connection import FakeWebSocket
+from yara.settings import YaraSettings
+
+
+def get_memory_adapter(**settings: tp.Any) -> MemoryAdapter:
+    settings = {
+        "YARA_MEMORY_BACKEND": "yara.adapters.memory.backends.local.LocalMemoryBackend",
+        "YARA_WEBSOCKETS_QUEUE_POLL_INTERVAL": 60000,
+        **settings,
+    }
+    return MemoryAdapter(tp.cast(tp.Any, SimpleNamespace(settings=YaraSettings.model_construct(**settings))))
+
+
+def get_service(memory_adapter: MemoryAdapter, hub: WebsocketHub | None = None) -> WebsocketService:
+    """
+    Service of a process sharing the memory backend, with the hub of WebsocketsApp or without it, e.g. a worker.
+    """
+    root_app = SimpleNamespace(
+        settings=memory_adapter.root_app.settings,
+        get_adapter=lambda _: memory_adapter,
+        apps={"websockets": SimpleNamespace(hub=hub)} if hub else {},
+    )
+    return WebsocketService(tp.cast(tp.Any, root_app))
+
+
+def connect(hub: WebsocketHub, user_id: str, *channels: str) -> WebsocketConnection:
+    connection = WebsocketConnection(user_id, FakeWebSocket(), 10)
+    hub.register(connection)
+    for channel in channels:
+        hub.subscribe(connection, channel)
+    return connection
+
+
+async def wait_sent(websocket: FakeWebSocket, count: int) -> list[tp.Any]:
+    async with asyncio.timeout(1):
+        while len(websocket.sent) < count:
+            await asyncio.sleep(0.01)
+    return [orjson.loads(message) for message in websocket.sent]
+
+
+@pytest.mark.parametrize(
+    ("overflow", "delivered", "queued"),
+    [("drop_oldest", (1, 0), [2, 3]), ("drop_newest", (0, 1), [1, 2]), ("disconnect", (0, 1), [])],
+)
+async def test_queue_overflow(overflow: str, delivered: tuple[int, int], queued: list[int]) -> None:
+    memory_adapter = get_memory_adapter(YARA_WEBSOCKETS_QUEUE_MAXLEN=2, YARA_WEBSOCKETS_OVERFLOW=overflow)
+    hub, other_hub = WebsocketHub(memory_adapter), WebsocketHub(memory_adapter)
+    service = get_service(memory_adapter, hub)
+    # the slow consumer is connected to another process
+    connection = connect(other_hub, "slow")
+    await asyncio.sleep(0.01)
+    await memory_adapter.sadd(service.memory_set_subscribers_key, "slow", "fast")
+    assert await service.send_to(["slow", "fast"], {"id": 1}) == (2, 0)
+    assert await service.send_to(["slow"], {"id": 2}) == (1, 0)
+    assert await service.send_to(["slow"], {"id": 3}) == delivered
+    assert hub.overflowed_queues == 1
+    messages = await memory_adapter.rpop(service.memory_queue_messages_key.format(user_id="slow"), count=10) or []
+    assert [orjson.loads(message)["id"] for message in messages] == queued
+    assert await memory_adapter.rpop(service.memory_queue_messages_key.format(user_id="fast"), count=10) == [
+        b'{"id":1}'
+    ]
+    await asyncio.sleep(0.01)
+    assert connection.disconnected.is_set() == (overflow == "disconnect")
+    other_hub.unregister(connection)
+
+
+async def test_publish_to_users() -> None:
+    memory_adapter = get_memory_adapter(YARA_WEBSOCKETS_DELIVERY="pubsub")
+    hub, other_hub = WebsocketHub(memory_adapter), WebsocketHub(memory_adapter)
+    service = get_service(memory_adapter, hub)
+    channel_key = service.memory_channel_key
+    connections = [
+        connect(hub, "local", channel_key.format(user_id="local")),
+        connect(other_hub, "remote", channel_key.format(user_id="remote")),
+        # the user is connected to both processes
+        connect(hub, "both", channel_key.format(user_id="both")),
+        connect(other_hub, "both", channel_key.format(user_id="both")),
+    ]
+    # the only socket of the user is local and drops the message, this process doesn't count as a receiver
+    disconnected = connect(hub, "disconnected", channel_key.format(user_id="disconnected"))
+    disconnected.disconnect()
+    await asyncio.sleep(0.01)
+    assert await service.send_to(["local", "remote", "both", "disconnected", "offline"], {"id": 1}) == (3, 2)
+    await asyncio.sleep(0.01)
+    assert [connection.queue.qsize() for connection in connections] == [1, 1, 1, 1]
+    assert disconnected.queue.empty()
+    for connection in [*connections, disconnected]:
+        hub.unregister(connection)
+        other_hub.unregister(connection)
+
+
+@pytest.mark.parametrize("delivery", ["list", "stream"])
+async def test_wake_up_from_process_without_hub(delivery: str) -> None:
+    memory_adapter = get_memory_adapter(YARA_WEBSOCKETS_DELIVERY=delivery)
+    hub = WebsocketHub(memory_adapter)
+    service = get_service(memory_adapter, hub)
+    websocket = FakeWebSocket()
+    connection = service._get_connection(tp.cast(tp.Any, "user"), websocket, WebsocketOptions())
+    task = asyncio.create_task(service._ws_hub_sender(hub, tp.cast(tp.Any, "user"), connection))
+    await asyncio.sleep(0.01)
+    await memory_adapter.sadd(service.memory_set_subscribers_key, "user")
+    # the reader waits for YARA_WEBSOCKETS_QUEUE_POLL_INTERVAL unless it is woken up
+    assert await get_service(memory_adapter).send_to(["user"], {"id": 1}) == (1, 0)
+    assert await wait_sent(websocket, 1) == [{"id": 1}]
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+async def test_rooms() -> None:
+    memory_adapter = get_memory_adapter()
+    hub = WebsocketHub(memory_adapter)
+    service, worker_service = get_service(memory_adapter, hub), get_service(memory_adapter)
+    await service.join("user", "before")
+    websocket = FakeWebSocket()
+    connection = service._get_connection(tp.cast(tp.Any, "user"), websocket, WebsocketOptions())
+    task = asyncio.create_task(service._ws_hub_sender(hub, tp.cast(tp.Any, "user"), connection))
+    await asyncio.sleep(0.01)
+    # joined in this process and in a process without the hub
+    await service.join("user", "after")
+    await worker_service.join("user", "worker")
+    await asyncio.sleep(0.01)
+    assert {f"ws_room_{room}" for room in ["before", "after", "worker"]} <= connection.channels
+    await worker_service.send_to_rooms(["before", "after", "worker"], {"id": 1})
+    assert await wait_sent(websocket, 3) == [{"id": 1}] * 3
+    await worker_service.leave("user", "worker")
+    await asyncio.sleep(0.01)
+    assert "ws_room_worker" not in connection.channels
+    assert await memory_adapter.smembers(service.memory_set_rooms_key.format(user_id="user")) == {b"before", b"after"}
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+
+async def test_channel_broadcast_count() -> None:
+    memory_adapter = get_memory_adapter(YARA_WEBSOCKETS_BROADCAST="channel")
+    hub, other_hub = WebsocketHub(memory_adapter), WebsocketHub(memory_adapter)
+    service = get_service(memory_adapter, hub)
+    channel = service.memory_broadcast_channel
+    local = connect(hub, "local", channel)
+    await asyncio.sleep(0.01)
+    assert await service.broadcast({"id": 1}) == (1, 0)
+    # the other process is counted once, whatever the number of its sockets
+    remote = [connect(other_hub, "remote", channel), connect(other_hub, "remote", channel)]
+    await asyncio.sleep(0.01)
+    assert await service.broadcast({"id": 2}) == (2, 0)
+    assert await get_service(memory_adapter).broadcast({"id": 3}) == (2, 0)
+    hub.unregister(local)
+    for connection in remote:
+        other_hub.unregister(connection)
@@ -1,6 +1,8 @@
 import os
+import typing as tp
 from collections.abc import Generator
 
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
 
 
@@ -44,12 +46,62 @@ class YaraSettings(BaseSettings):
     YARA_ORM_BACKEND: str = "yara.adapters.orm.backends.postgres.ORMPostgresBackend"
     YARA_ORM_DSN: str
     YARA_ORM_MIGRATIONS_TABLE: str = "yara__orm__migrations"
+    YARA_ORM_WARN_UNINDEXED: bool = False
+    # seconds, default client side timeout of every ORM call
+    YARA_ORM_TIMEOUT: float | None = None
+    # milliseconds, server side statement_timeout of pool connections
+    YARA_ORM_STATEMENT_TIMEOUT: int | None = None
+    # seconds, ORM budget of a request, set by ORMDeadlineMiddleware
+    YARA_ORM_REQUEST_TIMEOUT: float | None = None
+    YARA_ORM_PIN_CONNECTIONS: bool = False
+    YARA_ORM_POOL_MIN_SIZE: int = 10
+    YARA_ORM_POOL_MAX_SIZE: int = 10
+    YARA_ORM_POOL_MAX_QUERIES: int = 50000
+    YARA_ORM_POOL_MAX_INACTIVE_CONNECTION_LIFETIME: float = 300.0
+    # path to an async function called with every new connection, e.g. to register type codecs
+    YARA_ORM_POOL_INIT: str | None = None
+    YARA_ORM_STATEMENT_CACHE_SIZE: int = 100
+    # PgBouncer transaction pooling compatibility
+    YARA_ORM_PGBOUNCER: bool = False
+    YARA_ORM_BULK_CHUNK_SIZE: int = 1000
+    YARA_ORM_BULK_CHUNK_PAUSE: float = 0.0
+    YARA_ORM_WRITE_BUFFER_SIZE: int = 1000
+    YARA_ORM_WRITE_BUFFER_INTERVAL: float = 1.0
+    # rows buffered while flushes fall behind, new rows over it are dropped and counted in ORMWriteBuffer.dropped
+    YARA_ORM_WRITE_BUFFER_MAX_PENDING: int = 100000
+    # ORMShardedBackend: backend of every shard, shard DSNs and table -> shard key column
+    YARA_ORM_SHARD_BACKEND: str = "yara.adapters.orm.backends.postgres.ORMPostgresBackend"
+    YARA_ORM_SHARD_DSNS: list[str] = []
+    YARA_ORM_SHARD_KEYS: dict[str, str] = {}
 
     # Memory
     YARA_MEMORY_BACKEND: str = "yara.adapters.memory.backends.redis.RedisMemoryBackend"
-    YARA_MEMORY_DSN: str
+    YARA_MEMORY_DSN: str | None = None
     YARA_MEMORY_MAX_CONNECTIONS: int = 100
     YARA_MEMORY_TIMEOUT: int | None = None
+    # seconds, commands running longer are logged, see MemoryAdapter.metrics() for latencies and pool saturation
+    YARA_MEMORY_SLOW_COMMAND_THRESHOLD: float | None = None
+    # LocalMemoryBackend: approximate memory cap in bytes (LRU eviction) and expired keys reaping interval
+    YARA_MEMORY_LOCAL_MAX_MEMORY: int | None = None
+    YARA_MEMORY_LOCAL_REAP_INTERVAL: float = 1.0
+    # RedisRingMemoryBackend: standalone servers of the consistent hash ring and points per server
+    YARA_MEMORY_RING_DSNS: list[str] = []
+    YARA_MEMORY_RING_REPLICAS: int = 160
+    # messages buffered per subscriber, the oldest are dropped when a subscriber falls behind
+    YARA_MEMORY_PUBSUB_QUEUE_SIZE: int = 1000
+    # keys with these prefixes are cached in process, writes through MemoryAdapter invalidate them on every node
+    YARA_MEMORY_NEAR_CACHE_PREFIXES: list[str] = []
+    YARA_MEMORY_NEAR_CACHE_SIZE: int = 10000
+    # seconds, upper bound of staleness when an invalidation is lost
+    YARA_MEMORY_NEAR_CACHE_TTL: float = 5.0
+    YARA_MEMORY_NEAR_CACHE_CHANNEL: str = "yara__memory__near_cache"
+    # codec and compression of MemoryAdapter.set_value/get_value, zstd needs zstandard, lz4 and msgpack their packages
+    YARA_MEMORY_CODEC: tp.Literal["orjson", "msgpack", "raw"] = "orjson"
+    YARA_MEMORY_COMPRESSION: tp.Literal["zlib", "zstd", "lz4"] | None = None
+    # bytes, smaller serialized values are stored uncompressed
+    YARA_MEMORY_COMPRESSION_THRESHOLD: int = 1024
+    # key prefix -> {"codec": ..., "compression": ..., "compression_threshold": ...} overriding the defaults above
+    YARA_MEMORY_CODECS: dict[str, dict[str, tp.Any]] = {}
 
     # Storage
     YARA_STORAGE_BACKEND: str = "yara.adapters.storage.backends.minio.MinioStorageBackend"
@@ -82,6 +134,56 @@ class YaraSettings(BaseSettings):
 
     # Websockets
     YARA_WEBSOCKETS_HANDLER_TASK: str | None = None
+    # "list": LPUSH/RPOP queues, "stream": streams with a consumer group, unacknowledged messages are redelivered,
+    # "pubsub": user channels subscribed once per process, messages for users not connected at the moment are lost.
+    # With WebsocketsApp a push to a "list" or "stream" queue wakes up its readers through the user channel,
+    # so no connection is held per socket. Without it every socket blocks a pool connection in BRPOP/XREADGROUP.
+    YARA_WEBSOCKETS_DELIVERY: tp.Literal["list", "stream", "pubsub"] = "list"
+    # milliseconds a queue reader waits for a wake-up before reading anyway, covers wake-ups lost on reconnects
+    YARA_WEBSOCKETS_QUEUE_POLL_INTERVAL: int = 5000
+    # high watermark of the send buffer of a socket, messages coming over it are handled by YARA_WEBSOCKETS_OVERFLOW
+    YARA_WEBSOCKETS_SEND_QUEUE_SIZE: int = 1000
+    # the queue of the user is read again once the send buffer of the socket falls to the low watermark
+    YARA_WEBSOCKETS_SEND_QUEUE_LOW_WATERMARK: int = 100
+    # messages kept in the "list" queue of a user, the queue is trimmed with LTRIM, None is unbounded
+    YARA_WEBSOCKETS_QUEUE_MAXLEN: int | None = 1000
+    # seconds the "list" queue or the stream of a user is kept after the last message, None keeps it until read
+    YARA_WEBSOCKETS_QUEUE_TTL: int | None = 60 * 60 * 24
+    # what happens to a full queue or send buffer: the oldest or the newest message is dropped,
+    # or the queue is deleted and the sockets of the user are disconnected as slow consumers to resync on reconnect
+    YARA_WEBSOCKETS_OVERFLOW: tp.Literal["drop_oldest", "drop_newest", "disconnect"] = "drop_oldest"
+    YARA_WEBSOCKETS_STREAM_MAXLEN: int = 1000
+    # milliseconds a stream reader blocks without WebsocketsApp
+    YARA_WEBSOCKETS_STREAM_BLOCK: int = 5000
+    # milliseconds a message may stay unacknowledged before another connection of the user takes it over
+    YARA_WEBSOCKETS_STREAM_CLAIM_IDLE: int = 30000
+    # "queue": broadcast is delivered like send_to every subscriber,
+    # "channel": broadcast is published once and every process sends it to its sockets, offline users miss it
+    YARA_WEBSOCKETS_BROADCAST: tp.Literal["queue", "channel"] = "queue"
+    # messages sent per wake-up of a socket sender, queued messages are popped with one RPOP with count
+    YARA_WEBSOCKETS_BATCH_SIZE: int = 100
+    # milliseconds a socket sender waits for more messages when they arrive in a burst, 0 sends at once
+    YARA_WEBSOCKETS_BATCH_LINGER: int = 0
+    # send every batch as one JSON array frame, clients opt in with the batch_coalesce query parameter
+    YARA_WEBSOCKETS_BATCH_COALESCE: bool = False
+    # subscribers read with SSCAN and sent to per page of broadcast
+    YARA_WEBSOCKETS_BROADCAST_PAGE_SIZE: int = 1000
+    # users checked and pushed to in one pipeline by send_to
+    YARA_WEBSOCKETS_SEND_CHUNK_SIZE: int = 1000
+
+    @model_validator(mode="after")
+    def check_websockets_hub(self) -> "YaraSettings":
+        # fail on startup rather than on every accepted socket, subclasses of WebsocketsApp keep the suffix
+        if (
+            self.YARA_WEBSOCKETS_DELIVERY == "pubsub"
+            or self.YARA_WEBSOCKETS_BROADCAST == "channel"
+            or self.YARA_WEBSOCKETS_OVERFLOW == "disconnect"
+        ) and not any(app.endswith("WebsocketsApp") for app in self.YARA_APPS):
+            raise ValueError(
+                "YARA_WEBSOCKETS_DELIVERY, YARA_WEBSOCKETS_BROADCAST and YARA_WEBSOCKETS_OVERFLOW settings "
+                "need yara.apps.websockets.app.WebsocketsApp in YARA_APPS"
+            )
+        return self
 
     # SECURITY
     YARA_CORS_ORIGINS: list[str] = ["*"]